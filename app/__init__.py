@@ -18,9 +18,11 @@
 
 # The function returns the configured Flask application instance, ready to be used or further configured.
 
+from collections.abc import Mapping, Sequence
 from flask import Flask
+from flask.json.provider import DefaultJSONProvider
 from .integration_manager import initialize_integrations
-from .integrations.database import CurrentDBIntegration
+from .integrations.database import create_database_integration
 from .models import set_database_integration
 from dotenv import load_dotenv
 import os
@@ -28,10 +30,23 @@ import os
 load_dotenv()
 
 
+class GraphJSONProvider(DefaultJSONProvider):
+  # Graphs loaded from a binary snapshot hold lazy mappings and sequences instead of dicts and lists
+
+  @staticmethod
+  def default(o):
+    if isinstance(o, Mapping):
+      return dict(o.items())
+    if isinstance(o, Sequence) and not isinstance(o, (str, bytes)):
+      return list(o)
+    return DefaultJSONProvider.default(o)
+
+
 def create_app(setup_callbacks=None):
   app = Flask(__name__,
               template_folder="./templates",
               static_folder="../static")
+  app.json = GraphJSONProvider(app)
 
   from .views import main
 
@@ -40,9 +55,11 @@ def create_app(setup_callbacks=None):
   # Initialize integrations
   initialize_integrations(app)
 
-  db_integration_instance = CurrentDBIntegration()
+  db_integration_instance = create_database_integration()
   set_database_integration(db_integration_instance)
 
+  # Graph analytics, clusters and the layout are kept warm after writes from their first request on (see views)
+
   # If setup_callbacks is None, initialize as empty list
   setup_callbacks = setup_callbacks or []
 
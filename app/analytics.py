@@ -0,0 +1,161 @@
+# Graph analytics over the CSR snapshot: PageRank, in/out degree and weakly connected components.
+#
+# GraphAnalytics computes all three for one snapshot with NumPy:
+# - pagerank: power iteration, each step a weighted bincount of the ranks flowing along the edges; dangling nodes
+#   spread their rank evenly
+# - weakly connected components: min-label hooking along the edges plus pointer jumping, until no label changes
+#
+# get_graph_analytics() caches the results per graph version. With ANALYTICS_BACKGROUND_REFRESH, writes queue a
+# recompute on the async signal bus, batched so a burst of writes costs one recompute, and readers that pass
+# wait=False are answered from the previous version while a newer one is computed.
+import os
+import threading
+
+import numpy as np
+
+from . import models
+from .signals import connect_async, entity_created, entity_deleted
+
+ANALYTICS_DAMPING = float(os.environ.get("ANALYTICS_DAMPING", 0.85))
+ANALYTICS_TOLERANCE = float(os.environ.get("ANALYTICS_TOLERANCE", 1e-6))
+ANALYTICS_MAX_ITERATIONS = int(os.environ.get("ANALYTICS_MAX_ITERATIONS", 100))
+ANALYTICS_BACKGROUND_REFRESH = os.environ.get("ANALYTICS_BACKGROUND_REFRESH", "True") == "True"
+
+
+def edge_sources(snapshot):
+  return np.repeat(np.arange(snapshot.node_count, dtype=np.int32), snapshot.out_degree())
+
+
+def pagerank(snapshot, damping=ANALYTICS_DAMPING, tolerance=ANALYTICS_TOLERANCE,
+             max_iterations=ANALYTICS_MAX_ITERATIONS):
+  count = snapshot.node_count
+  if not count:
+    return np.empty(0)
+  sources, targets = edge_sources(snapshot), snapshot.indices
+  out_degree = snapshot.out_degree().astype(np.float64)
+  dangling = out_degree == 0
+  # Share of a node's rank each of its out-edges carries
+  share = np.divide(1.0, out_degree, out=np.zeros(count), where=~dangling)
+
+  rank = np.full(count, 1.0 / count)
+  for _ in range(max_iterations):
+    flow = np.bincount(targets, weights=(rank * share)[sources], minlength=count)
+    updated = (1 - damping) / count + damping * (flow + rank[dangling].sum() / count)
+    converged = np.abs(updated - rank).sum() < tolerance
+    rank = updated
+    if converged:
+      break
+  return rank
+
+
+def weakly_connected_components(snapshot):
+  # A component label per node: the smallest node index in its component
+  labels = np.arange(snapshot.node_count, dtype=np.int32)
+  sources, targets = edge_sources(snapshot), snapshot.indices
+  while True:
+    source_labels, target_labels = labels[sources], labels[targets]
+    lowest = np.minimum(source_labels, target_labels)
+    hooked = labels.copy()
+    # Hook the roots of both endpoints to the smaller label
+    np.minimum.at(hooked, source_labels, lowest)
+    np.minimum.at(hooked, target_labels, lowest)
+    while True:
+      jumped = hooked[hooked]
+      if np.array_equal(jumped, hooked):
+        break
+      hooked = jumped
+    if np.array_equal(hooked, labels):
+      return labels
+    labels = hooked
+
+
+class GraphAnalytics:
+
+  def __init__(self, snapshot):
+    self.snapshot = snapshot
+    self.version = snapshot.version
+    self.in_degree = snapshot.in_degree()
+    self.out_degree = snapshot.out_degree()
+    self.pagerank = pagerank(snapshot)
+    self.components = weakly_connected_components(snapshot)
+    self.component_sizes = np.bincount(self.components, minlength=snapshot.node_count)
+
+  def top(self, scores, limit=20, entity_type=None):
+    # [(entity ID, entity type, score)] for the highest scores, optionally of one entity type only
+    candidates = np.arange(self.snapshot.node_count)
+    if entity_type is not None:
+      if entity_type not in self.snapshot.type_names:
+        return []
+      candidates = candidates[self.snapshot.node_types == self.snapshot.type_names.index(entity_type)]
+    best = candidates[np.argsort(-scores[candidates], kind="stable")[:limit]]
+    return [(self.snapshot.ids[position], self.snapshot.entity_type(position), scores[position].item())
+            for position in best]
+
+  def score(self, entity_id):
+    positions = self.snapshot.positions([entity_id])
+    return self.pagerank[positions[0]].item() if len(positions) else 0.0
+
+  def component_list(self, limit=20, max_members=50, smallest_first=False):
+    # Components by size, each with up to max_members entity IDs
+    roots = np.flatnonzero(self.component_sizes)
+    order = np.argsort(self.component_sizes[roots], kind="stable")
+    roots = roots[order if smallest_first else order[::-1]][:limit]
+    members = {root: np.flatnonzero(self.components == root)[:max_members] for root in roots}
+    return [{
+        "size": int(self.component_sizes[root]),
+        "members": [self.snapshot.ids[position] for position in members[root]],
+    } for root in roots]
+
+
+_analytics = None
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_refresh_connected = False
+
+
+def get_graph_analytics(wait=True):
+  """
+  The analytics of the current graph version, computed on first use.
+
+  With wait=False, analytics of an older version are returned right away, if there are any, while the current
+  version is computed in a background thread.
+  """
+  global _analytics
+  analytics = _analytics
+  if analytics is not None and analytics.version == models.current_version():
+    return analytics
+  if analytics is not None and not wait:
+    if _refresh_lock.acquire(blocking=False):
+      threading.Thread(target=_refresh, name="analytics-refresh", daemon=True).start()
+    return analytics
+  with _lock:
+    snapshot = models.get_graph_snapshot()
+    if _analytics is None or _analytics.version != snapshot.version:
+      _analytics = GraphAnalytics(snapshot)
+    return _analytics
+
+
+def _refresh():
+  try:
+    get_graph_analytics()
+  finally:
+    _refresh_lock.release()
+
+
+def _refresh_after_writes(events):
+  get_graph_analytics()
+
+
+def enable_background_refresh():
+  # Recompute after structural writes, once per batch of signals
+  global _refresh_connected
+  if ANALYTICS_BACKGROUND_REFRESH and not _refresh_connected:
+    _refresh_connected = True
+    connect_async(entity_created, _refresh_after_writes, batch=True)
+    connect_async(entity_deleted, _refresh_after_writes, batch=True)
+
+
+def rank_entities(entities):
+  # Search results ordered by PageRank, most central first
+  analytics = get_graph_analytics(wait=False)
+  return sorted(entities, key=lambda entity: analytics.score(entity.get("id")), reverse=True)
@@ -0,0 +1,303 @@
+# Streaming bulk export and import of the graph, as NDJSON or Arrow/Parquet.
+#
+# The graph is exported as a stream of flat records, entities before the relationships that reference them:
+#   {"kind": "entity", "type": "people", "id": 1, "data": {"name": "Ada"}}
+#   {"kind": "relationship", "from_id": 1, "to_id": 2, "relationship": "knows", ...}
+# In Arrow and Parquet the records are rows of one schema: kind, type, id, from_id, to_id and relationship as
+# strings, and the remaining fields as a JSON string in data.
+#
+# Import reads records lazily and writes them in chunks of BULK_BATCH_SIZE through the backend's add_entities and
+# add_relationships, which backends with a bulk write path override. New IDs are recorded against the exported
+# ones, so relationship endpoints are remapped to the entities they pointed at; relationships whose endpoints were
+# not imported are skipped and counted. An "id" in an entity's data equal to its exported ID is dropped, as it is the
+# source backend's ID and not a property.
+#
+# Usage:
+#   python -m app.bulk export graph.ndjson                 # the backend selected by DATABASE_TYPE
+#   python -m app.bulk export graph.parquet --batch-size 50000
+#   DATABASE_TYPE=nebulagraph python -m app.bulk import graph.parquet
+#   python -m app.bulk migrate --source falkordb --target nebulagraph
+#
+# The format follows the file extension (.ndjson/.jsonl, .arrow, .parquet) unless --format is given. Arrow and
+# Parquet need pyarrow.
+import argparse
+import io
+import json
+import os
+import time
+from collections import defaultdict
+from itertools import islice
+
+BULK_BATCH_SIZE = int(os.environ.get("BULK_BATCH_SIZE", 10000))
+
+FORMATS = {".ndjson": "ndjson", ".jsonl": "ndjson", ".arrow": "arrow", ".parquet": "parquet"}
+COLUMNS = ["kind", "type", "id", "from_id", "to_id", "relationship", "data"]
+RELATIONSHIP_COLUMNS = {"from_id", "to_id", "relationship"}
+
+
+def require_pyarrow():
+  try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+  except ImportError as e:
+    raise RuntimeError("Arrow and Parquet need pyarrow: pip install pyarrow") from e
+  return pyarrow
+
+
+def format_of(path, format=None):
+  if format:
+    return format
+  extension = os.path.splitext(path)[1].lower()
+  if extension not in FORMATS:
+    raise ValueError(f"Can't tell the format of {path}, pass --format")
+  return FORMATS[extension]
+
+
+# Records
+
+
+def iter_records(db):
+  # Backends that export in pages (export_pages) are streamed page by page
+  pages = db.export_pages() if hasattr(db, "export_pages") else [db.get_full_graph()]
+  for page in pages:
+    # Copies of the containers, since the in-memory backend returns its live graph and writes may land while the
+    # records are streamed
+    for entity_type, entities in list(page.get("entities", {}).items()):
+      for entity_id, entity in list(entities.items()):
+        data = entity.get("data", entity) if isinstance(entity, dict) else {}
+        yield {"kind": "entity", "type": entity_type, "id": entity_id, "data": data}
+    for relationship in list(page.get("relationships", [])):
+      yield {"kind": "relationship", **relationship}
+
+
+def import_records(db, records, batch_size=BULK_BATCH_SIZE):
+  """
+  Write a stream of exported records into a backend, in chunks.
+
+  Returns:
+      dict: Counts of imported entities and relationships, skipped relationships and the seconds taken.
+  """
+  started = time.perf_counter()
+  id_map = {}
+  pending_entities = defaultdict(list)  # entity type -> [(exported ID, payload)]
+  pending_relationships = []
+  counts = {"entities": 0, "relationships": 0, "skipped_relationships": 0}
+
+  def flush_entities(entity_type):
+    chunk = pending_entities.pop(entity_type, [])
+    if chunk:
+      new_ids = db.add_entities(entity_type, [{"data": data} for _, data in chunk])
+      for (old_id, _), new_id in zip(chunk, new_ids):
+        id_map[str(old_id)] = new_id
+      counts["entities"] += len(chunk)
+
+  def flush_relationships():
+    chunk = []
+    for relationship in pending_relationships:
+      from_id = id_map.get(str(relationship.get("from_id")))
+      to_id = id_map.get(str(relationship.get("to_id")))
+      if from_id is None or to_id is None:
+        counts["skipped_relationships"] += 1
+        continue
+      chunk.append({**relationship, "from_id": from_id, "to_id": to_id})
+    pending_relationships.clear()
+    if chunk:
+      db.add_relationships(chunk)
+      counts["relationships"] += len(chunk)
+
+  for record in records:
+    kind = record.pop("kind", "entity")
+    if kind == "entity":
+      entity_type = record["type"]
+      data = dict(record.get("data") or {})
+      if "id" in data and str(data["id"]) == str(record.get("id")):
+        # The backend's own ID, which some exports repeat in the data; the target assigns its own
+        del data["id"]
+      pending_entities[entity_type].append((record.get("id"), data))
+      if len(pending_entities[entity_type]) >= batch_size:
+        flush_entities(entity_type)
+    else:
+      if pending_entities:
+        # Relationships may point at entities still waiting in a chunk
+        for entity_type in list(pending_entities):
+          flush_entities(entity_type)
+      pending_relationships.append(record)
+      if len(pending_relationships) >= batch_size:
+        flush_relationships()
+
+  for entity_type in list(pending_entities):
+    flush_entities(entity_type)
+  flush_relationships()
+
+  counts["seconds"] = round(time.perf_counter() - started, 3)
+  return counts
+
+
+# NDJSON
+
+
+def to_ndjson(records):
+  for record in records:
+    yield json.dumps(record, ensure_ascii=False, default=str) + "\n"
+
+
+def from_ndjson(lines):
+  for line in lines:
+    line = line.strip()
+    if line:
+      yield json.loads(line)
+
+
+# Arrow and Parquet
+
+
+def _row(record):
+  if record.get("kind") == "entity":
+    return {
+        "kind": "entity", "type": record["type"], "id": str(record["id"]), "from_id": None, "to_id": None,
+        "relationship": None, "data": json.dumps(record.get("data") or {}, ensure_ascii=False, default=str),
+    }
+  rest = {key: value for key, value in record.items() if key not in RELATIONSHIP_COLUMNS and key != "kind"}
+  return {
+      "kind": "relationship", "type": None, "id": None,
+      "from_id": str(record.get("from_id")), "to_id": str(record.get("to_id")),
+      "relationship": record.get("relationship"), "data": json.dumps(rest, ensure_ascii=False, default=str),
+  }
+
+
+def to_record_batches(records, batch_size=BULK_BATCH_SIZE):
+  pa = require_pyarrow()
+  schema = arrow_schema()
+  records = iter(records)
+  while True:
+    rows = [_row(record) for record in islice(records, batch_size)]
+    if not rows:
+      return
+    yield pa.RecordBatch.from_pylist(rows, schema=schema)
+
+
+def from_record_batches(batches):
+  for batch in batches:
+    for row in batch.to_pylist():
+      data = json.loads(row["data"]) if row["data"] else {}
+      if row["kind"] == "entity":
+        yield {"kind": "entity", "type": row["type"], "id": row["id"], "data": data}
+      else:
+        yield {"kind": "relationship", **data, "from_id": row["from_id"], "to_id": row["to_id"],
+               "relationship": row["relationship"]}
+
+
+def arrow_schema():
+  pa = require_pyarrow()
+  return pa.schema([(column, pa.string()) for column in COLUMNS])
+
+
+class _ChunkSink(io.RawIOBase):
+  # A write-only file collecting what the Arrow stream writer wrote since the last drain
+
+  def __init__(self):
+    self.chunks = []
+
+  def writable(self):
+    return True
+
+  def write(self, data):
+    self.chunks.append(bytes(data))
+    return len(data)
+
+  def drain(self):
+    data, self.chunks = b"".join(self.chunks), []
+    return data
+
+
+def iter_arrow_stream(records, batch_size=BULK_BATCH_SIZE):
+  # Arrow IPC stream bytes, one chunk per record batch, for HTTP responses
+  pa = require_pyarrow()
+  sink = _ChunkSink()
+  writer = pa.ipc.new_stream(sink, arrow_schema())
+  for batch in to_record_batches(records, batch_size):
+    writer.write_batch(batch)
+    yield sink.drain()
+  writer.close()
+  yield sink.drain()
+
+
+# Files
+
+
+def export_file(db, path, format=None, batch_size=BULK_BATCH_SIZE):
+  format = format_of(path, format)
+  count = 0
+
+  def counted(records):
+    nonlocal count
+    for record in records:
+      count += 1
+      yield record
+
+  records = counted(iter_records(db))
+  if format == "ndjson":
+    with open(path, "w", encoding="utf8") as file:
+      file.writelines(to_ndjson(records))
+  else:
+    pa = require_pyarrow()
+    if format == "arrow":
+      with pa.OSFile(path, "wb") as sink, pa.ipc.new_stream(sink, arrow_schema()) as writer:
+        for batch in to_record_batches(records, batch_size):
+          writer.write_batch(batch)
+    else:
+      with pa.parquet.ParquetWriter(path, arrow_schema()) as writer:
+        for batch in to_record_batches(records, batch_size):
+          writer.write_batch(batch)
+  return count
+
+
+def read_file(path, format=None, batch_size=BULK_BATCH_SIZE):
+  format = format_of(path, format)
+  if format == "ndjson":
+    with open(path, encoding="utf8") as file:
+      yield from from_ndjson(file)
+    return
+  pa = require_pyarrow()
+  if format == "arrow":
+    with pa.OSFile(path, "rb") as source:
+      yield from from_record_batches(pa.ipc.open_stream(source))
+  else:
+    yield from from_record_batches(pa.parquet.ParquetFile(path).iter_batches(batch_size=batch_size))
+
+
+def main():
+  from .integrations.database import create_database_integration, get_database_integration
+
+  parser = argparse.ArgumentParser(description="Bulk export and import of the graph.")
+  commands = parser.add_subparsers(dest="command", required=True)
+  export_parser = commands.add_parser("export", help="Export the graph to a file.")
+  export_parser.add_argument("path")
+  import_parser = commands.add_parser("import", help="Import a file into the graph.")
+  import_parser.add_argument("path")
+  migrate_parser = commands.add_parser("migrate", help="Copy the graph from one backend into another.")
+  migrate_parser.add_argument("--source", required=True, help="DATABASE_TYPE to read from.")
+  migrate_parser.add_argument("--target", required=True, help="DATABASE_TYPE to write to.")
+  for command in (export_parser, import_parser, migrate_parser):
+    command.add_argument("--format", choices=sorted(set(FORMATS.values())))
+    command.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+  args = parser.parse_args()
+
+  started = time.perf_counter()
+  if args.command == "export":
+    count = export_file(create_database_integration(), args.path, args.format, args.batch_size)
+    print(f"Exported {count:,} records to {args.path} in {time.perf_counter() - started:.1f}s")
+  elif args.command == "import":
+    counts = import_records(create_database_integration(), read_file(args.path, args.format, args.batch_size),
+                           args.batch_size)
+    print(f"Imported {args.path}: {counts}")
+  else:
+    source = get_database_integration(args.source)()
+    target = get_database_integration(args.target)()
+    counts = import_records(target, iter_records(source), args.batch_size)
+    print(f"Migrated {args.source} to {args.target}: {counts}")
+
+
+if __name__ == "__main__":
+  main()
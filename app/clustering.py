@@ -0,0 +1,279 @@
+# Level-of-detail clustering of the graph, for browsing large graphs a few hundred elements at a time.
+#
+# ClusterHierarchy groups the nodes of a snapshot into communities with label propagation, then groups those
+# communities the same way over the graph of communities (edges weighted by the relationships between them), and so
+# on until there are at most CLUSTER_TOP_SIZE clusters or a round no longer merges enough of them. Every level keeps
+# its clusters' sizes, their internal relationship counts, a representative (the member with the most
+# relationships), the most common entity type and the weighted edges between clusters.
+#
+# label_propagation is vectorized: every round, each node takes the label with the most edge weight among its
+# neighbors, counted for all nodes at once by sorting (node, label) pairs and summing their runs. Half of the nodes, picked at random,
+# update per round, which keeps labels from oscillating between two sides of a bipartite structure.
+#
+# get_cluster_hierarchy() caches the hierarchy per graph version, like get_graph_analytics(). A new version starts
+# label propagation from the previous version's communities, so it converges in a few rounds and clusters keep
+# their members between refreshes.
+import os
+import threading
+
+import numpy as np
+
+from . import models
+from .signals import connect_async, entity_created, entity_deleted
+
+CLUSTER_TOP_SIZE = int(os.environ.get("CLUSTER_TOP_SIZE", 50))
+CLUSTER_MAX_ROUNDS = int(os.environ.get("CLUSTER_MAX_ROUNDS", 30))
+# A level is only added when it has at most this share of the clusters of the level below
+CLUSTER_MIN_SHRINK = float(os.environ.get("CLUSTER_MIN_SHRINK", 0.8))
+CLUSTER_BACKGROUND_REFRESH = os.environ.get("CLUSTER_BACKGROUND_REFRESH", "True") == "True"
+
+
+def label_propagation(count, sources, targets, weights, labels=None, max_rounds=CLUSTER_MAX_ROUNDS, seed=0):
+  """
+  Community labels of an undirected, weighted graph.
+
+  Args:
+      count (int): The number of nodes.
+      sources, targets, weights (np.ndarray): The edges; self-loops are ignored.
+      labels (np.ndarray): Starting labels (node indices), each node its own label if None.
+
+  Returns:
+      np.ndarray: A label per node, the index of a node of its community.
+  """
+  labels = np.arange(count, dtype=np.int64) if labels is None else labels.astype(np.int64)
+  keep = sources != targets
+  nodes = np.concatenate([sources[keep], targets[keep]]).astype(np.int64)
+  neighbors = np.concatenate([targets[keep], sources[keep]]).astype(np.int64)
+  weights = np.concatenate([weights[keep], weights[keep]]).astype(np.float64)
+  if not len(nodes):
+    return labels
+  rng = np.random.default_rng(seed)
+
+  for _ in range(max_rounds):
+    # Edge weight per (node, neighbor label) pair: sort the pairs and sum the runs of equal ones
+    keys = nodes * count + labels[neighbors]
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    totals = np.add.reduceat(weights[order], starts)
+    pair_nodes, pair_labels = keys[starts] // count, keys[starts] % count
+    # Ties go to the node's own label, then at random
+    totals += 1e-3 * (pair_labels == labels[pair_nodes]) + 1e-4 * rng.random(len(totals))
+    # The heaviest label of every node; pairs are sorted by node, so each node's pairs are a run
+    node_starts = np.flatnonzero(np.r_[True, pair_nodes[1:] != pair_nodes[:-1]])
+    heaviest = np.repeat(np.maximum.reduceat(totals, node_starts), np.diff(np.r_[node_starts, len(totals)]))
+    winners = np.flatnonzero(totals == heaviest)
+    best = labels.copy()
+    best[pair_nodes[winners]] = pair_labels[winners]
+
+    pending = best != labels
+    if pending.sum() <= count * 1e-4:
+      break
+    changed = pending & (rng.random(count) < 0.5)
+    labels[changed] = best[changed]
+  return labels
+
+
+def _compact(labels):
+  # Labels renumbered 0..k-1
+  _, clusters = np.unique(labels, return_inverse=True)
+  return clusters.astype(np.int32)
+
+
+def _aggregate(membership, sources, targets, weights, count):
+  # The edges between clusters, one per pair (a < b) with the summed weight, and the weight inside every cluster
+  a, b = membership[sources], membership[targets]
+  internal = np.bincount(a[a == b], weights=weights[a == b], minlength=count)
+  between = a != b
+  low, high = np.minimum(a[between], b[between]), np.maximum(a[between], b[between])
+  pairs, inverse = np.unique(low.astype(np.int64) * count + high, return_inverse=True)
+  summed = np.bincount(inverse, weights=weights[between])
+  return (pairs // count).astype(np.int32), (pairs % count).astype(np.int32), summed, internal
+
+
+def _first_per_group(groups, scores):
+  # The index of the highest score in every group
+  order = np.lexsort((-scores, groups))
+  first = order[np.r_[True, groups[order][1:] != groups[order][:-1]]]
+  return groups[first], first
+
+
+class ClusterLevel:
+
+  def __init__(self, snapshot, node_clusters, sources, targets, weights, internal):
+    self.node_clusters = node_clusters  # cluster of every node of the snapshot
+    self.count = int(node_clusters.max()) + 1 if len(node_clusters) else 0
+    self.sources, self.targets, self.weights = sources, targets, weights
+    self.internal = internal
+    self.sizes = np.bincount(node_clusters, minlength=self.count)
+
+    clusters, representatives = _first_per_group(node_clusters, snapshot.degree().astype(np.float64))
+    self.representatives = np.zeros(self.count, dtype=np.int64)
+    self.representatives[clusters] = representatives
+    type_count = max(len(snapshot.type_names), 1)
+    pairs, counts = np.unique(node_clusters.astype(np.int64) * type_count + snapshot.node_types,
+                              return_counts=True)
+    clusters, best = _first_per_group(pairs // type_count, counts.astype(np.float64))
+    self.types = np.zeros(self.count, dtype=np.int64)
+    self.types[clusters] = pairs[best] % type_count
+
+
+class ClusterHierarchy:
+
+  def __init__(self, snapshot, previous=None, top_size=CLUSTER_TOP_SIZE):
+    self.snapshot = snapshot
+    self.version = snapshot.version
+    count = snapshot.node_count
+    sources = np.repeat(np.arange(count, dtype=np.int32), snapshot.out_degree())
+    targets = snapshot.indices
+    weights = np.ones(len(targets))
+
+    # Level 0 is the nodes themselves
+    self.levels = [ClusterLevel(snapshot, np.arange(count, dtype=np.int32), sources, targets, weights,
+                                np.zeros(count))]
+    node_clusters = self.levels[0].node_clusters
+    labels = self._previous_labels(previous) if previous is not None else None
+    while self.levels[-1].count > top_size:
+      below = self.levels[-1]
+      membership = _compact(label_propagation(below.count, below.sources, below.targets, below.weights, labels))
+      labels = None
+      clusters = int(membership.max()) + 1 if len(membership) else 0
+      if len(self.levels) > 1 and clusters > below.count * CLUSTER_MIN_SHRINK:
+        break
+      node_clusters = membership[node_clusters]
+      sources, targets, weights, internal = _aggregate(membership, below.sources, below.targets, below.weights,
+                                                       clusters)
+      self.levels.append(ClusterLevel(snapshot, node_clusters, sources, targets, weights, internal))
+      if clusters == below.count:
+        break
+
+  def _previous_labels(self, previous):
+    # Start from the communities of the previous version: every known node takes the position of its previous
+    # community's representative, when that one is still in the graph
+    if len(previous.levels) < 2:
+      return None
+    level = previous.levels[1]
+    old = previous.snapshot
+    labels = np.arange(self.snapshot.node_count, dtype=np.int64)
+    for position, entity_id in enumerate(self.snapshot.ids):
+      old_position = old.index.get(entity_id)
+      if old_position is None:
+        continue
+      representative = old.ids[level.representatives[level.node_clusters[old_position]]]
+      new_position = self.snapshot.index.get(representative)
+      if new_position is not None:
+        labels[position] = new_position
+    return labels
+
+  @property
+  def top(self):
+    return len(self.levels) - 1
+
+  def children(self, level, cluster):
+    # The clusters of level - 1 inside a cluster of level
+    below = self.levels[level - 1]
+    members = np.flatnonzero(self.levels[level].node_clusters == cluster)
+    return np.unique(below.node_clusters[members])
+
+  def view(self, level=None, clusters=None, limit=300):
+    """
+    The clusters of one level and the edges between them, largest clusters first.
+
+    Args:
+        level (int): The level, the top one if None; level 0 is the entities themselves.
+        clusters (np.ndarray): Only these clusters of the level, all of them if None.
+        limit (int): The most clusters returned.
+
+    Returns:
+        dict: clusters (cluster, size, internal edges, representative entity and type), edges between the returned
+        clusters as (source, target, weight), and external edges from them to the clusters of the level above, as
+        (source, parent cluster, weight).
+    """
+    level = self.top if level is None else level
+    current = self.levels[level]
+    clusters = np.arange(current.count) if clusters is None else np.asarray(clusters)
+    total = len(clusters)
+    clusters = clusters[np.argsort(-current.sizes[clusters], kind="stable")][:limit]
+    selected = np.zeros(current.count, dtype=bool)
+    selected[clusters] = True
+
+    inside = selected[current.sources] & selected[current.targets]
+    result = {
+        "level": level,
+        "levels": len(self.levels),
+        "total": total,
+        "clusters": [{
+            "cluster": int(cluster),
+            "size": int(current.sizes[cluster]),
+            "internal_edges": int(current.internal[cluster]),
+            "representative": self.snapshot.ids[current.representatives[cluster]],
+            "type": self.snapshot.type_names[current.types[cluster]] if self.snapshot.type_names else None,
+        } for cluster in clusters],
+        "edges": [(int(a), int(b), float(w)) for a, b, w in zip(current.sources[inside], current.targets[inside],
+                                                                  current.weights[inside])],
+        "external": [],
+    }
+    if level < self.top:
+      # Edges leaving the selection, summed per cluster of the level above on the other end
+      parents = self.levels[level + 1].node_clusters
+      parent_of = np.zeros(current.count, dtype=np.int64)
+      parent_of[current.node_clusters] = parents
+      near = np.concatenate([current.sources, current.targets]).astype(np.int64)
+      far = np.concatenate([current.targets, current.sources])
+      weights = np.concatenate([current.weights, current.weights])
+      leaving = selected[near] & ~selected[far]
+      parent_count = self.levels[level + 1].count
+      pairs, inverse = np.unique(near[leaving] * parent_count + parent_of[far[leaving]], return_inverse=True)
+      summed = np.bincount(inverse, weights=weights[leaving])
+      result["external"] = [(int(pair // parent_count), int(pair % parent_count), float(w))
+                            for pair, w in zip(pairs, summed)]
+    return result
+
+
+_hierarchy = None
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_refresh_connected = False
+
+
+def get_cluster_hierarchy(wait=True):
+  """
+  The cluster hierarchy of the current graph version, computed on first use.
+
+  With wait=False, the hierarchy of an older version is returned right away, if there is one, while the current
+  version is computed in a background thread.
+  """
+  global _hierarchy
+  hierarchy = _hierarchy
+  if hierarchy is not None and hierarchy.version == models.current_version():
+    return hierarchy
+  if hierarchy is not None and not wait:
+    if _refresh_lock.acquire(blocking=False):
+      threading.Thread(target=_refresh, name="cluster-refresh", daemon=True).start()
+    return hierarchy
+  with _lock:
+    snapshot = models.get_graph_snapshot()
+    if _hierarchy is None or _hierarchy.version != snapshot.version:
+      _hierarchy = ClusterHierarchy(snapshot, _hierarchy)
+    return _hierarchy
+
+
+def _refresh():
+  try:
+    get_cluster_hierarchy()
+  finally:
+    _refresh_lock.release()
+
+
+def _refresh_after_writes(events):
+  if _hierarchy is not None:
+    get_cluster_hierarchy()
+
+
+def enable_background_refresh():
+  # Recompute after structural writes, once per batch of signals, once the hierarchy has been asked for
+  global _refresh_connected
+  if CLUSTER_BACKGROUND_REFRESH and not _refresh_connected:
+    _refresh_connected = True
+    connect_async(entity_created, _refresh_after_writes, batch=True)
+    connect_async(entity_deleted, _refresh_after_writes, batch=True)
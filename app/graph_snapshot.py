@@ -0,0 +1,233 @@
+# A read-only, compressed sparse row (CSR) copy of the graph's structure, for traversal and analytics.
+#
+# GraphSnapshot.from_graph compiles the output of get_full_graph into NumPy arrays:
+# - ids / index: node index -> entity ID and back (string forms of the IDs resolve too, since some backends and
+#   routes mix them); node_types holds each node's entity type as an index into type_names
+# - indptr / indices / edge_types: the out-edges of node i are indices[indptr[i]:indptr[i + 1]], with their
+#   relationship labels in edge_types (an index into relationship_names)
+# - in_indptr / in_indices: the same for in-edges, with in_edges mapping every in-edge back to its out-edge
+# - names / snippets: the entity names and relationship snippets, copied at compile time, for name() and
+#   relationship(); snippets only holds the edges that have one
+# All index arrays are int32, so a snapshot costs 16 bytes per edge (indices, edge_types, in_indices, in_edges) and
+# 12 per node (node_types, indptr, in_indptr) plus the ID maps, names and snippets.
+#
+# Snapshots are immutable and keep no reference to the graph they were compiled from, whose backend may change it
+# in place. models.get_graph_snapshot() compiles one lazily per graph version and shares it, so integrations can
+# traverse the graph without touching the backend. Relationships whose endpoints are not entities of the graph are
+# left out and counted in skipped_relationships.
+import numpy as np
+
+
+def _index(ids):
+  index = {}
+  for position, entity_id in enumerate(ids):
+    index[entity_id] = position
+    index.setdefault(str(entity_id), position)
+  return index
+
+
+def record_name(record):
+  # The name of an entity record, flat or with its fields under "data"; None without one
+  if isinstance(record, dict):
+    data = record.get("data", record)
+    if isinstance(data, dict) and data.get("name"):
+      return str(data["name"])
+    if record.get("name"):
+      return str(record["name"])
+  return None
+
+
+def record_snippet(relationship):
+  data = relationship.get("data")
+  snippet = relationship.get("snippet") or (data.get("snippet") if isinstance(data, dict) else None)
+  return str(snippet) if snippet else None
+
+
+def _csr(sources, targets, node_count):
+  order = np.argsort(sources, kind="stable")
+  indptr = np.zeros(node_count + 1, dtype=np.int32)
+  np.cumsum(np.bincount(sources, minlength=node_count), out=indptr[1:])
+  return indptr, targets[order].astype(np.int32), order
+
+
+def _slots(indptr, nodes):
+  # The CSR slots of all edges of nodes, concatenated, without a Python loop over the nodes
+  starts = indptr[nodes]
+  lengths = indptr[nodes + 1] - starts
+  total = int(lengths.sum())
+  if not total:
+    return np.empty(0, dtype=np.int64)
+  offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+  return offsets + np.arange(total)
+
+
+def _expand(indptr, indices, nodes):
+  # All neighbors of nodes, concatenated
+  return indices[_slots(indptr, nodes)]
+
+
+class GraphSnapshot:
+
+  def __init__(self, version, ids, node_types, type_names, sources, targets, edge_types, relationship_names,
+               skipped_relationships=0, index=None, names=None, snippets=None):
+    self.version = version
+    self.ids = ids
+    self.index = index if index is not None else _index(ids)
+    self.node_types = node_types
+    self.type_names = type_names
+    self.relationship_names = relationship_names
+    self.skipped_relationships = skipped_relationships
+    self.names = names
+
+    self.indptr, self.indices, order = _csr(sources, targets, len(ids))
+    self.edge_types = edge_types[order]
+    self.in_indptr, self.in_indices, in_order = _csr(targets, sources, len(ids))
+    # Out-edge of every in-edge: where each relationship landed in the out-edge order
+    out_slots = np.empty(len(order), dtype=np.int32)
+    out_slots[order] = np.arange(len(order), dtype=np.int32)
+    self.in_edges = out_slots[in_order]
+    # Snippets come keyed by the edge's position in sources, and are kept by out-edge
+    self.snippets = {int(out_slots[edge]): snippet for edge, snippet in (snippets or {}).items()}
+    for array in (self.node_types, self.indptr, self.indices, self.edge_types, self.in_indptr, self.in_indices,
+                  self.in_edges):
+      array.setflags(write=False)
+
+  @classmethod
+  def from_graph(cls, graph, version=0):
+    # Backends such as the in-memory one return their live dicts and list, which writers change while the snapshot
+    # compiles: every container is copied first and only the copies are read. dict() and list() copy a dict or list
+    # without running Python code, so no other thread writes in between (list(d.items()) allocates a tuple per
+    # item, and a garbage collection it sets off can)
+    ids, node_types, type_names, names = [], [], [], []
+    for entity_type, entities in dict(graph.get("entities", {})).items():
+      type_names.append(entity_type)
+      items = dict(entities)
+      for entity_id, record in items.items():
+        ids.append(entity_id)
+        names.append(record_name(record))
+      node_types.extend([len(type_names) - 1] * len(items))
+
+    index = _index(ids)
+    position = index.get
+    sources, targets, edge_types = [], [], []
+    snippets = {}
+    relationship_index = {}
+    skipped = 0
+    for relationship in list(graph.get("relationships", [])):
+      from_id, to_id = relationship.get("from_id"), relationship.get("to_id")
+      source = position(from_id)
+      if source is None:
+        source = position(str(from_id))
+      target = position(to_id)
+      if target is None:
+        target = position(str(to_id))
+      if source is None or target is None:
+        skipped += 1
+        continue
+      snippet = record_snippet(relationship)
+      if snippet:
+        snippets[len(sources)] = snippet
+      sources.append(source)
+      targets.append(target)
+      label = relationship.get("relationship", "")
+      edge_type = relationship_index.get(label)
+      if edge_type is None:
+        edge_type = relationship_index[label] = len(relationship_index)
+      edge_types.append(edge_type)
+
+    return cls(version, ids, np.array(node_types, dtype=np.int32), type_names,
+               np.array(sources, dtype=np.int32), np.array(targets, dtype=np.int32),
+               np.array(edge_types, dtype=np.int32), list(relationship_index), skipped, index, names, snippets)
+
+  @property
+  def node_count(self):
+    return len(self.ids)
+
+  @property
+  def edge_count(self):
+    return len(self.indices)
+
+  @property
+  def nbytes(self):
+    return sum(array.nbytes for array in (self.node_types, self.indptr, self.indices, self.edge_types,
+                                          self.in_indptr, self.in_indices, self.in_edges))
+
+  def positions(self, entity_ids):
+    # Node indices of the entity IDs the snapshot knows
+    positions = (self.index.get(entity_id, self.index.get(str(entity_id))) for entity_id in entity_ids)
+    return np.array([position for position in positions if position is not None], dtype=np.int32)
+
+  def out_degree(self):
+    return np.diff(self.indptr)
+
+  def in_degree(self):
+    return np.diff(self.in_indptr)
+
+  def degree(self):
+    return self.out_degree() + self.in_degree()
+
+  def neighbor_positions(self, nodes, direction="both"):
+    nodes = np.asarray(nodes, dtype=np.int32)
+    parts = []
+    if direction in ("out", "both"):
+      parts.append(_expand(self.indptr, self.indices, nodes))
+    if direction in ("in", "both"):
+      parts.append(_expand(self.in_indptr, self.in_indices, nodes))
+    return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int32)
+
+  def neighbors(self, entity_id, direction="both"):
+    return [self.ids[position] for position in self.neighbor_positions(self.positions([entity_id]), direction)]
+
+  def edges_of(self, nodes, direction="both"):
+    # Out-edge indices of all edges touching nodes, each once
+    nodes = np.asarray(nodes, dtype=np.int32)
+    parts = []
+    if direction in ("out", "both"):
+      parts.append(_slots(self.indptr, nodes))
+    if direction in ("in", "both"):
+      parts.append(self.in_edges[_slots(self.in_indptr, nodes)])
+    return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+  def edge_sources(self, edges):
+    # Source node of out-edges
+    return np.searchsorted(self.indptr, edges, side="right") - 1
+
+  def bfs(self, entity_ids, max_depth=None, direction="both"):
+    """
+    Breadth-first search from one or more entities, one vectorized step per level.
+
+    Returns:
+        np.ndarray: The depth of every node from the nearest source, -1 where unreachable.
+    """
+    depths = np.full(self.node_count, -1, dtype=np.int32)
+    frontier = np.unique(self.positions(entity_ids))
+    depths[frontier] = 0
+    depth = 0
+    while len(frontier) and (max_depth is None or depth < max_depth):
+      depth += 1
+      reached = self.neighbor_positions(frontier, direction)
+      frontier = reached[depths[reached] < 0]
+      depths[frontier] = depth
+    return depths
+
+  def neighborhood(self, entity_id, depth=1, direction="both"):
+    # Entity IDs within depth hops, the entity included
+    return [self.ids[position] for position in np.flatnonzero(self.bfs([entity_id], depth, direction) >= 0)]
+
+  def entity_type(self, position):
+    return self.type_names[self.node_types[position]]
+
+  def name(self, position):
+    # The entity's name when the snapshot was compiled, None without one
+    if self.names is None:
+      return None
+    return self.names[position]
+
+  def relationship(self, edge):
+    # The relationship of an out-edge, as it was when the snapshot was compiled
+    relationship = {"from_id": self.ids[self.edge_sources(edge)], "to_id": self.ids[self.indices[edge]],
+                    "relationship": self.relationship_names[self.edge_types[edge]]}
+    snippet = self.snippets.get(int(edge))
+    if snippet:
+      relationship["snippet"] = snippet
+    return relationship
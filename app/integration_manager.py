@@ -15,17 +15,36 @@
 # `integration_manager`, allowing for easy access to integration functionalities throughout the app.
 
 # The `initialize_integrations` function is responsible for initializing the `IntegrationManager` with the Flask app 
-# and dynamically loading integration modules from a specified directory. It checks the `INTEGRATIONS` dictionary to 
-# determine if an integration is active, and if so, it imports the module, checks for a `register` function, and 
-# executes it to register the integration. This dynamic loading mechanism allows for flexible integration management, 
-# enabling or disabling integrations as needed without modifying the core application code.
+# and declaring the active integrations from the `INTEGRATIONS` manifest. Integrations are imported lazily: the module 
+# is only imported, and its `register` function executed, the first time the integration is looked up by name. This 
+# keeps openai, bs4 and requests out of startup. Integrations listed in `EAGER_INTEGRATIONS` hook into the app when 
+# they register (signals, view wrappers, background threads), so they are still imported at startup.
+
+# Periodic integrations don't start threads of their own. In register() they call
+# `integration_manager.schedule(name, function, interval=... or cron=...)`, and the manager's `Scheduler` runs
+# every job on one timer thread and a shared pool of `SCHEDULER_WORKERS` threads:
+# - interval jobs run every `interval` seconds, cron jobs on the minutes a 5-field cron expression matches
+#   ("*/5 * * * *"), each delayed by up to `jitter` seconds so jobs declared together don't fire together
+# - a job that is still running when it is due again is skipped, never run twice at once
+# - jobs are called with the app, inside an app context, so they use the models layer directly
+# - `scheduler.stats()` reports runs, failures, skipped runs and run time per job; `scheduler.shutdown()` stops
+#   the timer and waits for running jobs, and runs at exit
 
 
 
 # app/integration_manager.py
-import os
+import atexit
+import heapq
 import importlib
+import importlib.util
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from flask import Flask, current_app
+from .integrations.database.metrics import LatencyRecorder
 
 # Dictionary to hold the status of integrations
 INTEGRATIONS = {
@@ -44,33 +63,237 @@ INTEGRATIONS = {
     'ai_search' : True
 }
 
+# Integrations that have to run their register() at startup because they
+# attach to the app rather than being triggered by name
+EAGER_INTEGRATIONS = {'auto_add_person', 'auto_tag_person'}
+
 # This dictionary will hold callable integration functions
 INTEGRATION_FUNCTIONS = {}
 
+# Threads shared by all scheduled jobs
+SCHEDULER_WORKERS = int(os.environ.get('SCHEDULER_WORKERS', 2))
+
+# Ranges of the five cron fields: minute, hour, day of month, month, day of week (0 = Sunday)
+CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+
+def parse_cron_field(field, low, high):
+    # "*", "*/15", "1-5", "0,30" or "9-17/2" -> the set of matching values
+    values = set()
+    for part in field.split(','):
+        spec, _, step = part.partition('/')
+        if spec == '*':
+            start, end = low, high
+        elif '-' in spec:
+            start, end = (int(value) for value in spec.split('-'))
+        else:
+            start = end = int(spec)
+        if start < low or end > high or start > end:
+            raise ValueError(f'Cron field {field!r} is outside {low}-{high}')
+        values.update(range(start, end + 1, int(step) if step else 1))
+    return values
+
+
+class CronSchedule:
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f'Cron expression {expression!r} needs 5 fields')
+        self.expression = expression
+        (self.minutes, self.hours, self.days, self.months,
+         self.weekdays) = (parse_cron_field(field, low, high) for field, (low, high) in zip(fields, CRON_FIELDS))
+
+    def next_after(self, moment):
+        # The first matching minute after moment, skipping whole days and hours that can't match
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 4)
+        while moment < limit:
+            if (moment.month not in self.months or moment.day not in self.days
+                    or (moment.weekday() + 1) % 7 not in self.weekdays):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f'Cron expression {self.expression!r} never matches')
+
+
+class ScheduledJob:
+    def __init__(self, name, function, interval=None, cron=None, jitter=0.0):
+        if (interval is None) == (cron is None):
+            raise ValueError(f'Job {name!r} needs either an interval or a cron expression')
+        self.name = name
+        self.function = function
+        self.interval = interval
+        self.cron = CronSchedule(cron) if cron else None
+        self.jitter = jitter
+        self.running = False
+        self.next_run = None
+        self.counters = {'runs': 0, 'failures': 0, 'skipped': 0}
+        self.last_error = None
+
+    def schedule_next(self, now):
+        # Interval jobs keep their cadence from the previous due time rather than drifting with run time
+        if self.cron:
+            wall_clock = datetime.now()
+            due = now + (self.cron.next_after(wall_clock) - wall_clock).total_seconds()
+        elif self.next_run is None or self.next_run + self.interval < now:
+            due = now + self.interval
+        else:
+            due = self.next_run + self.interval
+        self.next_run = due
+        return due + random.uniform(0, self.jitter)
+
+
+class Scheduler:
+    def __init__(self, app, workers=SCHEDULER_WORKERS):
+        self.app = app
+        self.workers = workers
+        self.jobs = {}
+        self.latency = LatencyRecorder()
+        self._queue = []  # (run at, sequence, job name), on the monotonic clock
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self._executor = None
+        self._thread = None
+        self._stopped = False
+
+    def add(self, job):
+        with self._condition:
+            if job.name in self.jobs:
+                raise ValueError(f'Job {job.name!r} is already scheduled')
+            self.jobs[job.name] = job
+            self._push(job, job.schedule_next(time.monotonic()))
+            if self._thread is None:
+                # The timer thread and pool only exist once something is scheduled
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scheduler')
+                self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+                self._thread.start()
+                atexit.register(self.shutdown)
+            self._condition.notify()
+        return job
+
+    def _push(self, job, run_at):
+        self._sequence += 1
+        heapq.heappush(self._queue, (run_at, self._sequence, job.name))
+
+    def _run(self):
+        with self._condition:
+            while not self._stopped:
+                if not self._queue:
+                    self._condition.wait()
+                    continue
+                run_at, _, name = self._queue[0]
+                now = time.monotonic()
+                if run_at > now:
+                    self._condition.wait(run_at - now)
+                    continue
+                heapq.heappop(self._queue)
+                job = self.jobs.get(name)
+                if job is None:
+                    continue
+                if job.running:
+                    job.counters['skipped'] += 1
+                else:
+                    job.running = True
+                    self._executor.submit(self._execute, job)
+                self._push(job, job.schedule_next(now))
+
+    def _execute(self, job):
+        started = time.perf_counter()
+        try:
+            with self.app.app_context():
+                job.function(self.app)
+            job.counters['runs'] += 1
+        except Exception as e:
+            job.counters['failures'] += 1
+            job.last_error = repr(e)
+            print(f'Scheduled job {job.name} failed: {e!r}')
+        finally:
+            self.latency.record(job.name, time.perf_counter() - started)
+            with self._condition:
+                job.running = False
+
+    def remove(self, name):
+        with self._condition:
+            # Its queue entry is skipped when it comes up
+            return self.jobs.pop(name, None) is not None
+
+    def shutdown(self, wait=True):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def stats(self):
+        latency = self.latency.stats()
+        return {
+            name: {
+                **job.counters,
+                'running': job.running,
+                'last_error': job.last_error,
+                'latency': latency.get(name),
+            }
+            for name, job in self.jobs.items()
+        }
+
 class IntegrationManager:
     def __init__(self, app):
         self.app = app
         self.integration_functions = {}
+        # integration name -> module path, imported on first lookup
+        self.declared_integrations = {}
+        self._load_lock = threading.RLock()
+        self.scheduler = Scheduler(app)
 
     def register(self, integration_name, integration_function):
         # Register the callable function for the integration
         self.integration_functions[integration_name] = integration_function
         #self.app.before_request_funcs.setdefault(None, []).append(integration_function)
 
+    def schedule(self, name, function, interval=None, cron=None, jitter=0.0):
+        # Run function(app) every interval seconds or on a cron expression, on the shared scheduler
+        return self.scheduler.add(ScheduledJob(name, function, interval=interval, cron=cron, jitter=jitter))
+
+    def declare(self, integration_name, module_path):
+        # Record where an integration lives without importing it
+        self.declared_integrations[integration_name] = module_path
+
+    def load(self, integration_name):
+        # Import a declared integration and run its register function
+        with self._load_lock:
+            module_path = self.declared_integrations.get(integration_name)
+            if module_path is None:
+                return
+            mod = importlib.import_module(module_path)
+            if hasattr(mod, 'register'):
+                mod.register(self)
+            del self.declared_integrations[integration_name]
+
+    def get(self, integration_name):
+        if integration_name not in self.integration_functions:
+            self.load(integration_name)
+        return self.integration_functions.get(integration_name)
+
 def get_integration_function(integration_name):
   # Retrieve a callable integration function by name
-  return current_app.integration_manager.integration_functions.get(integration_name)
+  return current_app.integration_manager.get(integration_name)
 
 def initialize_integrations(app):
   app.integration_manager = IntegrationManager(app)
 
-  integrations_dir = os.path.join(app.root_path, 'integrations')
-  for module_name in os.listdir(integrations_dir):
-      if module_name == '__init__.py' or module_name == '__pycache__' or not module_name.endswith('.py'):
+  for integration_name, enabled in INTEGRATIONS.items():
+      if not enabled:
+          continue
+      module_path = f'app.integrations.{integration_name}'
+      # Skip manifest entries without a module, like the old directory scan did
+      if importlib.util.find_spec(module_path) is None:
           continue
-      integration_name = module_name[:-3]
-      if INTEGRATIONS.get(integration_name):
-          module_path = f'app.integrations.{integration_name}'
-          mod = importlib.import_module(module_path)
-          if hasattr(mod, 'register'):
-              mod.register(app.integration_manager)
+      app.integration_manager.declare(integration_name, module_path)
+      if integration_name in EAGER_INTEGRATIONS:
+          app.integration_manager.load(integration_name)
@@ -2,53 +2,12 @@ import os
 import openai
 from flask import jsonify
 import json
-from app.models import get_full_graph, search_entities, search_relationships
+from app.models import search_entities, search_relationships
+from app.analytics import rank_entities
+from app.retrieval import assemble_context
 
 openai.api_key = os.getenv('OPENAI_API_KEY')
-
-
-def collect_connections(nodes, edges):
-  graph = get_full_graph()
-  triplets = []
-
-  # First, directly process the edges to construct triplets for these specific relationships
-  for edge in edges:
-      from_id = edge['from_temp_id']
-      to_id = edge['to_temp_id']
-      # Attempt to retrieve the relationship's description directly, or construct a fallback description
-      relationship_desc = edge.get('data', {}).get('snippet', f'Unknown relationship from {from_id} to {to_id}')
-      triplets.append(relationship_desc)
-
-  # Create a set of node temp IDs from the input nodes for quick lookup
-  node_temp_ids = {node['temp_id'] for node in nodes}
-
-  # Then, for each node in the input list, use find_connected_triplets to find all additional triplets
-  for node in nodes:
-      node_temp_id = node['temp_id']
-      additional_triplets = find_connected_triplets(node_temp_id, graph)
-      triplets.extend(additional_triplets)
-
-  return triplets
-
-def find_connected_triplets(node_id, graph, exclude_id=None):
-    """
-    Find all triplets for a given node except those connected to exclude_id.
-    """
-    connected_triplets = []
-    for relationship in graph['relationships']:
-        # Check if the relationship involves the node in question and is not excluded
-        if (relationship['from_id'] == node_id and relationship['to_id'] != exclude_id) or (relationship['to_id'] == node_id and relationship['from_id'] != exclude_id):
-            # Construct the triplet description using the snippet or a default format
-            from_node_name = next((node['data']['name'] for entity_type, entities in graph['entities'].items() for _, node in entities.items() if node['data']['temp_id'] == relationship['from_id']), 'Unknown')
-            to_node_name = next((node['data']['name'] for entity_type, entities in graph['entities'].items() for _, node in entities.items() if node['data']['temp_id'] == relationship['to_id']), 'Unknown')
-            relationship_type = relationship.get('relationship', 'connected to')
-            triplet = f"{from_node_name} {relationship_type} {to_node_name}" if 'snippet' not in relationship else relationship['snippet']
-            print(triplet)
-            connected_triplets.append(triplet)
-    
-    return connected_triplets
-
-
+openai.api_base = os.environ.get('OPENAI_BASE_URL', openai.api_base)
 
 
 def generate_search_parameters(input_text):
@@ -78,7 +37,6 @@ def ai_search(app, input_text):
       if not search_parameters:
           return jsonify({"error": "Failed to generate search parameters"}), 400
 
-      graph = get_full_graph()
       entity_results = []
       relationship_results = []
 
@@ -92,11 +50,16 @@ def ai_search(app, input_text):
               relationship_results.extend(search_relationships(param_dict))
   
 
+      # Most central entities first, so their connections lead the prompt
+      entity_results = rank_entities(entity_results)
+
       print("entity_results: ", entity_results)
       print("relationship_results: ", relationship_results)
-      # Now expecting a single list of triplets instead of two separate lists
-      triplets = collect_connections(entity_results, relationship_results)
-      print("triplet: ", triplets)
+      # The best scored triplets around the results, deduplicated and packed up to the token budget
+      search_terms = [value for param in search_parameters for value in param.values()]
+      context = assemble_context(input_text, entity_results, relationship_results, search_terms)
+      triplets = context.pop("triplets")
+      print(f"context: {len(triplets)} of {context['candidates']} triplets, {context['tokens']}/{context['budget']} tokens")
 
       # Construct a message to send to GPT based on triplets
       if triplets:
@@ -117,7 +80,7 @@ def ai_search(app, input_text):
           # Assuming the model's response is directly usable
           answer = response.choices[0].message['content']
           print("answer: ", answer)
-          return jsonify({"answer": answer, "triplets":str(triplets)}), 200
+          return jsonify({"answer": answer, "triplets":str(triplets), "context": context}), 200
       except Exception as e:
           print(f"Error processing AI search: {e}")
           return jsonify({"error": str(e)}), 500
@@ -1,21 +1,17 @@
 # This is an example integration that demonstrates how to add a function that automatically runs periodically (in this case 5 seconds)
 
-import threading
-from time import sleep
-from flask import json
+from flask import current_app
+from app.models import add_entity
+from app.signals import entity_created
 
-def add_person_every_minute(app):
-    with app.test_request_context():
-        while True:
-            data = json.dumps({'name': 'AutoGenerated', 'auto_test': True})
-            # Mimic a POST request to the create_entity endpoint
-            response = app.test_client().post('/people', data=data, content_type='application/json')
-            print(f"added with response: {response.status}")
-            sleep(5)  # Every minute
 
-def start_adding_persons(app):
-    thread = threading.Thread(target=add_person_every_minute, args=(app,))
-    thread.start()
+def add_person(app):
+    # Runs on the shared scheduler inside an app context, so it uses the models layer like the views do
+    data = {'name': 'AutoGenerated', 'auto_test': True}
+    entity_id = add_entity('people', data)
+    entity_created.send(current_app._get_current_object(), entity_type='people', entity_id=entity_id, data=data)
+    print(f"added person with id: {entity_id}")
+
 
 def register(integration_manager):
-    start_adding_persons(integration_manager.app)
+    integration_manager.schedule('auto_add_person', add_person, interval=5, jitter=0.5)
@@ -1,7 +1,7 @@
 # this is an example integration that automatically triggers based on an entity creation using the blinker signals by importing entity_created from app.signals.
 
 from flask import request, current_app, jsonify
-from app.signals import entity_created
+from app.signals import entity_created, connect_async
 
 def tag_person(sender, **extra):
     # Logic for tagging person goes here
@@ -33,7 +33,8 @@ def auto_tag_person(next):
 
 def register(integration_manager):
     app = integration_manager.app  # Get the app instance from the manager
-    entity_created.connect(tag_person, sender=app)
+    # Tagging runs on the signal bus's pool, off the request thread
+    connect_async(entity_created, tag_person, sender=app)
     
     # Apply the middleware to the create_entity view function
     integration_manager.app.view_functions['main.create_entity'] = auto_tag_person(
@@ -33,11 +33,11 @@
 import os
 import openai
 from flask import jsonify
-from app.models import search_entities_with_type, add_entity
+from app.models import search_entities_with_type_batch, add_entity
 
 # Your OpenAI API key should be securely stored and accessed. Hardcoding is not recommended for production systems.
 openai.api_key = os.environ['OPENAI_API_KEY']
-openai.base_url = os.environ.get('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+openai.api_base = os.environ.get('OPENAI_BASE_URL', openai.api_base)
 
 OPENAI_MODEL_NAME = "gpt-4-turbo-preview"
 
@@ -54,15 +54,14 @@ def conditional_entity_addition(app, data):
         search_results = []
   
         # Run a search for each parameter in the input data
-        for key, value in entity_data.items():
-            # Ensure only strings are searched with a partial match
-            if isinstance(value, str):
-                search_params = {key: value}
-                print(f"Search parameters: {search_params}")
-                print("entity type: ", entity_type)
-                results = search_entities_with_type(entity_type, search_params)
-                print(f"Search results: {results}")
-                search_results.extend(results)
+        # Ensure only strings are searched with a partial match
+        search_params_list = [{key: value} for key, value in entity_data.items() if isinstance(value, str)]
+        print(f"Search parameters: {search_params_list}")
+        print("entity type: ", entity_type)
+        # The searches are independent, so backends can send them in one round trip
+        for results in search_entities_with_type_batch(entity_type, search_params_list):
+            print(f"Search results: {results}")
+            search_results.extend(results)
   
         # Combine all search results
         combined_results = {result['id']: result for result in search_results}.values()
@@ -36,7 +36,7 @@ from app.models import search_relationships, add_relationship
 
 # Your OpenAI API key should be securely stored and accessed. Hardcoding is not recommended for production systems.
 openai.api_key = os.environ['OPENAI_API_KEY']
-openai.base_url = os.environ.get('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+openai.api_base = os.environ.get('OPENAI_BASE_URL', openai.api_base)
 
 OPENAI_MODEL_NAME = "gpt-4-turbo-preview"
 
@@ -1,17 +1,48 @@
+import importlib
 import os
 
-from .memory import InMemoryDatabase
-from .nexus import NexusDBIntegration
-from .nebulagraph import NebulaGraphIntegration
-from .falkordb import FalkorDBIntegration
+# Backends are imported only when selected, so a memory deployment never pays
+# for (or needs) nebula3, falkordb or nexus_python.
+DATABASE_BACKENDS = {
+    "memory": ("app.integrations.database.memory", "InMemoryDatabase"),
+    "shared_memory": ("app.integrations.database.shared_memory", "SharedMemoryDatabase"),
+    "sharded": ("app.integrations.database.sharded", "ShardedDatabaseIntegration"),
+    "nexusdb": ("app.integrations.database.nexus", "NexusDBIntegration"),
+    "nebulagraph": ("app.integrations.database.nebulagraph", "NebulaGraphIntegration"),
+    "falkordb": ("app.integrations.database.falkordb", "FalkorDBIntegration"),
+}
+
+_BACKEND_CLASSES = {
+    class_name: module_path
+    for module_path, class_name in DATABASE_BACKENDS.values()
+}
 
 db_type = os.getenv("DATABASE_TYPE", "memory").lower()
+# Wrap the backend in the read-through CachingDatabaseIntegration
+database_cache = os.getenv("DATABASE_CACHE", "False") == "True"
+
+
+def get_database_integration(database_type):
+  # Unknown types fall back to the in-memory database, as before
+  module_path, class_name = DATABASE_BACKENDS.get(database_type,
+                                                  DATABASE_BACKENDS["memory"])
+  return getattr(importlib.import_module(module_path), class_name)
+
+
+CurrentDBIntegration = get_database_integration(db_type)
+
+
+def create_database_integration():
+  integration = CurrentDBIntegration()
+  if database_cache:
+    from .caching import CachingDatabaseIntegration
+    integration = CachingDatabaseIntegration(integration)
+  return integration
+
 
-if db_type == "nexusdb":
-  CurrentDBIntegration = NexusDBIntegration
-elif db_type == "nebulagraph":
-  CurrentDBIntegration = NebulaGraphIntegration
-elif db_type == "falkordb":
-    CurrentDBIntegration = FalkorDBIntegration
-else:
-  CurrentDBIntegration = InMemoryDatabase
+def __getattr__(name):
+  # Keep `from app.integrations.database import FalkorDBIntegration` working
+  # without importing every backend up front
+  if name in _BACKEND_CLASSES:
+    return getattr(importlib.import_module(_BACKEND_CLASSES[name]), name)
+  raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -11,6 +11,17 @@ class DatabaseIntegration(ABC):
     def get_full_graph(self):
         pass
 
+    def get_graph_view(self):
+        # The graph as the visualization gets it. Backends that trim or sample
+        # large graphs for the UI override this; get_full_graph stays complete.
+        return self.get_full_graph()
+
+    def data_version(self):
+        # A value that changes whenever the stored graph does, including writes
+        # made by other processes; None when the backend can't tell cheaply,
+        # and only the writes going through app.models invalidate then.
+        return None
+
     @abstractmethod
     def get_entity(self, entity_type, entity_id):
         pass
@@ -42,3 +53,20 @@ class DatabaseIntegration(ABC):
     @abstractmethod
     def search_relationships(self, search_params):
         pass
+
+    def search_entities_with_type_batch(self, entity_type, search_params_list):
+        # Run several independent searches, one result list per search_params.
+        # Backends that can send them in a single round trip override this.
+        return [
+            self.search_entities_with_type(entity_type, search_params)
+            for search_params in search_params_list
+        ]
+
+    def add_entities(self, entity_type, data_list):
+        # Add several entities of one type, returning their IDs in order.
+        # Backends with a bulk write path override this.
+        return [self.add_entity(entity_type, data) for data in data_list]
+
+    def add_relationships(self, data_list):
+        # Add several relationships, returning their IDs in order.
+        return [self.add_relationship(data) for data in data_list]
@@ -0,0 +1,210 @@
+# A read-through cache in front of any DatabaseIntegration.
+#
+# CachingDatabaseIntegration wraps the configured backend (DATABASE_CACHE=True) and serves get_entity,
+# get_all_entities, search_*, get_full_graph and get_graph_view from a bounded LRU with TTL (cache.py). Writes made
+# through the wrapper, and the entity_created / entity_updated / entity_deleted signals, invalidate only what they can change:
+# - reads are keyed by a generation counter of the groups they depend on (an entity type, the untyped entity
+#   searches, the relationships, the full graph); a write bumps the generations it affects, and entries of old
+#   generations are never looked up again and age out of the LRU
+# - get_entity entries are dropped by ID on update and delete
+# - a delete clears the whole cache, because some backends cascade deletes to other entities
+#
+# cache_stats() reports the LRU counters and the hit ratio per method. The TTL bounds how stale reads can get
+# when other processes write to a shared database; the graph reads are also keyed by the backend's data_version,
+# so backends that report one (shared memory) never serve a graph older than its last write.
+import os
+import threading
+
+from app.signals import entity_created, entity_deleted, entity_updated
+
+from .base import DatabaseIntegration
+from .cache import LRUCache
+
+DATABASE_CACHE_SIZE = int(os.environ.get("DATABASE_CACHE_SIZE", 10000))
+DATABASE_CACHE_TTL_SECONDS = float(os.environ.get("DATABASE_CACHE_TTL_SECONDS", 30))
+
+CACHED_METHODS = [
+    "get_full_graph",
+    "get_graph_view",
+    "get_entity",
+    "get_all_entities",
+    "search_entities",
+    "search_entities_with_type",
+    "search_relationships",
+]
+
+
+def params_key(search_params):
+    return tuple(sorted((key, str(value)) for key, value in search_params.items()))
+
+
+class CachingDatabaseIntegration(DatabaseIntegration):
+
+    def __init__(self, inner, maxsize=DATABASE_CACHE_SIZE, ttl=DATABASE_CACHE_TTL_SECONDS):
+        self.inner = inner
+        self.cache = LRUCache(maxsize, ttl)
+        self._generations = {}
+        self._generation_lock = threading.Lock()
+        self.method_stats = {method: {"hits": 0, "misses": 0} for method in CACHED_METHODS}
+
+        entity_created.connect(self._on_entity_created)
+        entity_updated.connect(self._on_entity_updated)
+        entity_deleted.connect(self._on_entity_deleted)
+
+    def __getattr__(self, name):
+        # Backend specific extras (latency_stats, write_stats, add_entities, ...) pass through
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    # Generations
+
+    def _generation(self, group):
+        return self._generations.get(group, 0)
+
+    def _bump(self, *groups):
+        with self._generation_lock:
+            for group in groups:
+                self._generations[group] = self._generations.get(group, 0) + 1
+
+    def _entities_changed(self, entity_type):
+        self._bump(("type", entity_type), "entities", "graph")
+
+    def _relationships_changed(self):
+        self._bump("relationships", "graph")
+
+    def _entity_deleted(self):
+        self.cache.clear()
+        self._bump("entities", "relationships", "graph")
+
+    def _cached(self, method, key, load):
+        result = self.cache.get(key)
+        stats = self.method_stats[method]
+        if result is not None:
+            stats["hits"] += 1
+            return result
+        stats["misses"] += 1
+        result = load()
+        # Missing entities aren't cached, so an entity is visible as soon as it's created
+        if result is not None:
+            self.cache.set(key, result)
+        return result
+
+    # Reads
+
+    def data_version(self):
+        return self.inner.data_version()
+
+    def get_full_graph(self):
+        key = ("graph", self._generation("graph"), self.inner.data_version())
+        return self._cached("get_full_graph", key, self.inner.get_full_graph)
+
+    def get_graph_view(self):
+        key = ("view", self._generation("graph"), self.inner.data_version())
+        return self._cached("get_graph_view", key, self.inner.get_graph_view)
+
+    def get_entity(self, entity_type, entity_id):
+        key = ("entity", entity_type, str(entity_id))
+        return self._cached("get_entity", key, lambda: self.inner.get_entity(entity_type, entity_id))
+
+    def get_all_entities(self, entity_type):
+        key = ("all", entity_type, self._generation(("type", entity_type)))
+        return self._cached("get_all_entities", key, lambda: self.inner.get_all_entities(entity_type))
+
+    def search_entities(self, search_params):
+        key = ("search", params_key(search_params), self._generation("entities"))
+        return self._cached("search_entities", key, lambda: self.inner.search_entities(search_params))
+
+    def search_entities_with_type(self, entity_type, search_params):
+        key = ("search", entity_type, params_key(search_params), self._generation(("type", entity_type)))
+        return self._cached(
+            "search_entities_with_type", key,
+            lambda: self.inner.search_entities_with_type(entity_type, search_params))
+
+    def search_entities_with_type_batch(self, entity_type, search_params_list):
+        # Cached searches are answered locally, the rest go to the backend as one batch
+        generation = self._generation(("type", entity_type))
+        keys = [
+            ("search", entity_type, params_key(search_params), generation)
+            for search_params in search_params_list
+        ]
+        results = [self.cache.get(key) for key in keys]
+        misses = [index for index, result in enumerate(results) if result is None]
+
+        stats = self.method_stats["search_entities_with_type"]
+        stats["hits"] += len(results) - len(misses)
+        stats["misses"] += len(misses)
+
+        if misses:
+            loaded = self.inner.search_entities_with_type_batch(
+                entity_type, [search_params_list[index] for index in misses])
+            for index, result in zip(misses, loaded):
+                results[index] = result
+                self.cache.set(keys[index], result)
+        return results
+
+    def search_relationships(self, search_params):
+        key = ("relationships", params_key(search_params), self._generation("relationships"))
+        return self._cached(
+            "search_relationships", key, lambda: self.inner.search_relationships(search_params))
+
+    # Writes
+
+    def add_entity(self, entity_type, data):
+        entity_id = self.inner.add_entity(entity_type, data)
+        self._entities_changed(entity_type)
+        return entity_id
+
+    def add_entities(self, entity_type, data_list):
+        entity_ids = self.inner.add_entities(entity_type, data_list)
+        self._entities_changed(entity_type)
+        return entity_ids
+
+    def update_entity(self, entity_type, entity_id, data):
+        updated = self.inner.update_entity(entity_type, entity_id, data)
+        self.cache.pop(("entity", entity_type, str(entity_id)))
+        self._entities_changed(entity_type)
+        # Relationships carry entity names
+        self._relationships_changed()
+        return updated
+
+    def delete_entity(self, entity_type, entity_id):
+        deleted = self.inner.delete_entity(entity_type, entity_id)
+        self._entity_deleted()
+        return deleted
+
+    def add_relationship(self, data):
+        relationship_id = self.inner.add_relationship(data)
+        self._relationships_changed()
+        return relationship_id
+
+    def add_relationships(self, data_list):
+        relationship_ids = self.inner.add_relationships(data_list)
+        self._relationships_changed()
+        return relationship_ids
+
+    # Signals, for writes that don't go through the wrapper
+
+    def _on_entity_created(self, sender, entity_type=None, **kwargs):
+        if entity_type == "relationship":
+            self._relationships_changed()
+        else:
+            self._entities_changed(entity_type)
+
+    def _on_entity_updated(self, sender, entity_type=None, entity_id=None, **kwargs):
+        self.cache.pop(("entity", entity_type, str(entity_id)))
+        self._entities_changed(entity_type)
+        self._relationships_changed()
+
+    def _on_entity_deleted(self, sender, **kwargs):
+        self._entity_deleted()
+
+    def cache_stats(self):
+        methods = {}
+        for method, stats in self.method_stats.items():
+            lookups = stats["hits"] + stats["misses"]
+            methods[method] = {
+                **stats,
+                "hit_ratio": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+            }
+        return {"cache": self.cache.stats(), "methods": methods}
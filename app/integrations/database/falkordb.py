@@ -1,5 +1,15 @@
+import json
 import os
+import re
+import threading
+
 from falkordb import FalkorDB
+from falkordb.helpers import stringify_param_value
+from falkordb.query_result import QueryResult
+from redis import BlockingConnectionPool
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError, ResponseError, TimeoutError
+from redis.retry import Retry
 
 from .base import DatabaseIntegration
 
@@ -7,6 +17,34 @@ FALKOR_HOST     = os.environ.get("FALKOR_HOST", "127.0.0.1")
 FALKOR_PORT     = os.environ.get("FALKOR_PORT", 6379)
 FALKOR_GRAPH_ID = os.environ.get("FALKOR_GRAPH_ID", "mindgraph")
 
+# Connection pool: one connection per concurrent command, up to FALKOR_POOL_SIZE.
+# Callers wait up to FALKOR_POOL_TIMEOUT seconds for a free connection.
+FALKOR_POOL_SIZE             = int(os.environ.get("FALKOR_POOL_SIZE", 16))
+FALKOR_POOL_TIMEOUT          = float(os.environ.get("FALKOR_POOL_TIMEOUT", 5))
+# Idle connections are PINGed before reuse when older than this many seconds
+FALKOR_HEALTH_CHECK_INTERVAL = int(os.environ.get("FALKOR_HEALTH_CHECK_INTERVAL", 30))
+# Reconnect attempts on connection errors and timeouts
+FALKOR_RETRIES               = int(os.environ.get("FALKOR_RETRIES", 3))
+# Node ID window per page when exporting the graph
+FALKOR_PAGE_SIZE             = int(os.environ.get("FALKOR_PAGE_SIZE", 10000))
+# Number of nodes the visualization gets from get_graph_view, 0 for the whole graph
+FALKOR_GRAPH_SAMPLE_SIZE     = int(os.environ.get("FALKOR_GRAPH_SAMPLE_SIZE", 0))
+# Create the schema.json driven indexes on startup
+FALKOR_CREATE_INDEXES        = os.environ.get("FALKOR_CREATE_INDEXES", "True") == "True"
+
+# Relationship fields FalkorDB keeps as the edge's endpoints and type, or derives from them
+EDGE_STRUCTURE_FIELDS = {"from_id", "to_id", "relationship", "from_type", "to_type", "from_entity", "to_entity"}
+
+# Properties covered by the full-text index of every label
+FULLTEXT_FIELDS = ["name", "description"]
+
+# RediSearch drops these from full-text queries; a term made only of them would match nothing
+FULLTEXT_STOP_WORDS = {
+    "a", "is", "the", "an", "and", "are", "as", "at", "be", "but", "by", "for", "if", "in", "into", "it", "no",
+    "not", "of", "on", "or", "such", "that", "their", "then", "there", "these", "they", "this", "to", "was",
+    "will", "with",
+}
+
 # rename dict keys containing spaces with _
 def remove_spaces(data):
     normalized_data = {}
@@ -21,11 +59,139 @@ def remove_spaces(data):
 
     return normalized_data
 
+# build the "CYPHER key=value ..." header FalkorDB expects in front of a parameterized query
+def params_header(params):
+    if not params:
+        return ""
+
+    return "CYPHER " + " ".join(f"{key}={stringify_param_value(val)}" for key, val in params.items()) + " "
+
+# prefix query over the words of the given values, e.g. "John Do" -> "john* do*"
+# returns "" when no word is usable, callers fall back to a label scan then
+def fulltext_query(values):
+    terms = []
+    for value in values:
+        for word in re.findall(r"\w+", str(value).lower()):
+            if len(word) > 1 and word not in FULLTEXT_STOP_WORDS:
+                terms.append(f"{word}*")
+
+    return " ".join(terms)
+
+# the connection pool shared by all request threads; connections are retried with backoff
+# on connection errors and timeouts, keyword arguments override the settings
+def create_pool(**kwargs):
+    settings = dict(
+        host=FALKOR_HOST,
+        port=int(FALKOR_PORT),
+        max_connections=FALKOR_POOL_SIZE,
+        timeout=FALKOR_POOL_TIMEOUT,
+        health_check_interval=FALKOR_HEALTH_CHECK_INTERVAL,
+        socket_keepalive=True,
+        retry=Retry(ExponentialBackoff(cap=1, base=0.05), FALKOR_RETRIES),
+        retry_on_error=[ConnectionError, TimeoutError],
+        # FalkorDB sets this itself, but not when given a pool
+        decode_responses=True,
+    )
+    settings.update(kwargs)
+    return BlockingConnectionPool(**settings)
+
+# the properties stored on an edge: everything but its endpoints and type, as far as
+# FalkorDB can store it (scalars and lists of scalars)
+def edge_properties(data):
+    properties = {}
+    for key, val in data.items():
+        if key in EDGE_STRUCTURE_FIELDS or val is None:
+            continue
+        if isinstance(val, (str, int, float, bool)) or (
+                isinstance(val, list) and all(isinstance(item, (str, int, float, bool)) for item in val)):
+            properties[key.replace(' ', '_')] = val
+
+    return properties
+
 class FalkorDBIntegration(DatabaseIntegration):
     def __init__(self, schema_file_path="schema.json"):
-        # Connect to FalkorDB
-        self.db = FalkorDB(host=FALKOR_HOST, port=FALKOR_PORT)
-        self.g  = self.db.select_graph(FALKOR_GRAPH_ID)
+        # Connect to FalkorDB through a pool shared by all request threads
+        self.pool = create_pool()
+        self.db = FalkorDB(connection_pool=self.pool)
+        self._local = threading.local()
+
+        self.schema = self._load_schema(schema_file_path)
+        # labels searches can route through db.idx.fulltext.queryNodes
+        self.fulltext_labels = set()
+        if FALKOR_CREATE_INDEXES:
+            self._ensure_indexes()
+
+    def _load_schema(self, schema_file_path):
+        # Load and return the schema from the schema.json file
+        with open(schema_file_path, "r") as file:
+            schema = json.load(file)
+        return schema
+
+    def _ensure_indexes(self):
+        """
+        Create the indexes described by schema.json, for every entity type:
+        - a range index on name, for exact lookups
+        - a full-text index on name and description, for searches
+        Indexes that already exist are left alone.
+        """
+        for label in self.schema:
+            try:
+                self.g.query(f"CREATE INDEX FOR (n:`{label}`) ON (n.name)")
+            except ResponseError as e:
+                if "already indexed" not in str(e):
+                    print(f"Error creating range index on {label}.name: {e}")
+
+            fields = ", ".join(f"'{field}'" for field in FULLTEXT_FIELDS)
+            try:
+                self.g.query(f"CALL db.idx.fulltext.createNodeIndex('{label}', {fields})")
+                self.fulltext_labels.add(label)
+            except ResponseError as e:
+                if "already indexed" in str(e):
+                    self.fulltext_labels.add(label)
+                else:
+                    print(f"Error creating full-text index on {label}: {e}")
+
+    @property
+    def g(self):
+        # Each thread gets its own Graph handle, so the client-side schema
+        # cache is never shared; every command checks a connection out of the pool
+        graph = getattr(self._local, "graph", None)
+        if graph is None:
+            graph = self._local.graph = self.db.select_graph(FALKOR_GRAPH_ID)
+
+        return graph
+
+    def ping(self):
+        # health check for the pool, reconnects on the way if needed
+        return self.db.connection.ping()
+
+    def pipeline_queries(self, queries, read_only=True):
+        """
+        Send several independent queries in a single round trip.
+
+        Args:
+            queries (list): (query, params) tuples.
+            read_only (bool): Use GRAPH.RO_QUERY.
+
+        Returns:
+            list: QueryResult per query, in order.
+        """
+        g   = self.g
+        cmd = "GRAPH.RO_QUERY" if read_only else "GRAPH.QUERY"
+
+        pipe = self.db.connection.pipeline(transaction=False)
+        for q, params in queries:
+            pipe.execute_command(cmd, g.name, params_header(params) + q, "--compact")
+
+        try:
+            responses = pipe.execute()
+        except Exception as e:
+            # e.g. the client schema is out of date; the regular query path handles that
+            print(f"Pipelined queries failed, running them one by one: {e}")
+            run = g.ro_query if read_only else g.query
+            return [run(q, params) for q, params in queries]
+
+        return [QueryResult(g, response) for response in responses]
 
     def add_entity(self, entity_type, data):
         data['data'] = remove_spaces(data['data'])
@@ -39,43 +205,135 @@ class FalkorDBIntegration(DatabaseIntegration):
         # return entity ID
         return result[0][0]
 
+    def export_pages(self, page_size=FALKOR_PAGE_SIZE):
+        """
+        Export the whole graph in pages, as a generator, with every property.
+
+        Nodes are read in windows of page_size node IDs, together with their
+        outgoing edges, so every node is materialized once.
+
+        Yields:
+            dict: {"entities": {label: {id: {"entity_type", "data"}}}, "relationships": [...]} per page,
+            relationships carrying their properties along with relationship, from/to_id and from/to_type.
+        """
+        q = """MATCH (n)
+               WHERE ID(n) >= $start AND ID(n) < $end
+               OPTIONAL MATCH (n)-[e]->(dest)
+               RETURN ID(n), labels(n)[0], properties(n),
+                      collect(CASE WHEN e IS NULL THEN NULL ELSE [type(e), ID(dest), labels(dest)[0], properties(e)] END)"""
+
+        for rows in self._node_windows(q, page_size):
+            page = {"entities": {}, "relationships": []}
+            for node_id, lbl, properties, edges in rows:
+                page['entities'].setdefault(lbl, {})[node_id] = {'entity_type': lbl, 'data': dict(properties or {})}
+
+                for relation, dest_id, dest_lbl, edge_properties in edges:
+                    page['relationships'].append({
+                        **(edge_properties or {}),
+                        "relationship": relation,
+                        "from_id": node_id,
+                        "to_id": dest_id,
+                        "from_type": lbl,
+                        "to_type": dest_lbl,
+                        })
+
+            yield page
+
+    def _node_windows(self, q, page_size, limit=None):
+        # rows of q for consecutive windows of page_size node IDs ($start, $end), up to limit rows
+        result = self.g.ro_query("MATCH (n) RETURN max(ID(n))").result_set
+        max_id = result[0][0] if result else None
+        if max_id is None:
+            return
+
+        remaining = limit
+        for start in range(0, max_id + 1, page_size):
+            rows = self.g.ro_query(q, {'start': start, 'end': start + page_size}).result_set
+            if remaining is not None:
+                rows = rows[:remaining]
+                remaining -= len(rows)
+
+            yield rows
+
+            if remaining is not None and remaining <= 0:
+                return
+
+    def iter_full_graph(self, page_size=FALKOR_PAGE_SIZE, limit=None):
+        """
+        Pages of the graph for the visualization, as a generator.
+
+        Only the properties the UI needs are returned: id, label and name for
+        nodes, endpoints and type for edges. export_pages returns everything.
+
+        Args:
+            page_size (int): Width of each node ID window.
+            limit (int): Stop after this many nodes (a sample), None for all.
+
+        Yields:
+            dict: {"entities": {label: {id: entity}}, "relationships": [...]} per page.
+        """
+        q = """MATCH (n)
+               WHERE ID(n) >= $start AND ID(n) < $end
+               OPTIONAL MATCH (n)-[e]->(dest)
+               RETURN ID(n), labels(n)[0], n.name,
+                      collect(CASE WHEN e IS NULL THEN NULL ELSE [type(e), ID(dest), labels(dest)[0]] END)"""
+
+        for rows in self._node_windows(q, page_size, limit):
+            page = {"entities": {}, "relationships": []}
+            for node_id, lbl, name, edges in rows:
+                page['entities'].setdefault(lbl, {})[node_id] = {'entity_type': lbl, 'data': {'id': node_id, 'name': name}}
+
+                for relation, dest_id, dest_lbl in edges:
+                    page['relationships'].append({
+                        "relationship": relation,
+                        "snippet": relation,
+                        "from_id": node_id,
+                        "to_id": dest_id,
+                        "from_type": lbl,
+                        "to_type": dest_lbl,
+                        "from_entity": '',
+                        "to_entity": '',
+                        "relationship_type": relation
+                        })
+
+            yield page
+
     def get_full_graph(self):
+        """
+        Return the whole graph, with every property of nodes and edges.
+        """
         graph = {
             "entities": {},
             "relationships": [],
         }
 
-        # get nodes
-        nodes = self.g.query("MATCH (n) RETURN n").result_set
-        for node in nodes:
-            node = node[0]
-            lbl = node.labels[0]
-
-            if lbl not in graph['entities']:
-                graph['entities'][lbl] = {}
-
-            graph['entities'][lbl][node.id] = {'entity_type': lbl, 'data': node.properties}
-
-        # get edges
-        results = self.g.query("MATCH (src)-[e]->(dest) RETURN src, e, dest").result_set
-        for row in results:
-            src  = row[0]
-            e    = row[1]
-            dest = row[2]
-
-            desc = {
-                    "relationship": e.relation,
-                    "snippet": e.relation,
-                    "from_id": src.id,
-                    "to_id": dest.id,
-                    "from_type": src.labels[0],
-                    "to_type": dest.labels[0],
-                    "from_entity": '',
-                    "to_entity": '',
-                    "relationship_type": e.relation
-                    }
-
-            graph['relationships'].append(desc)
+        for page in self.export_pages():
+            for lbl, entities in page['entities'].items():
+                graph['entities'].setdefault(lbl, {}).update(entities)
+            graph['relationships'].extend(page['relationships'])
+
+        return graph
+
+    def get_graph_view(self, limit=FALKOR_GRAPH_SAMPLE_SIZE):
+        """
+        Return the graph as the visualization shows it: names only, and a sample of
+        `limit` nodes when FALKOR_GRAPH_SAMPLE_SIZE is set (0 for no limit).
+        """
+        graph = {
+            "entities": {},
+            "relationships": [],
+        }
+
+        limit = int(limit) or None
+        for page in self.iter_full_graph(limit=limit):
+            for lbl, entities in page['entities'].items():
+                graph['entities'].setdefault(lbl, {}).update(entities)
+            graph['relationships'].extend(page['relationships'])
+
+        # a sample only keeps edges between sampled nodes
+        if limit is not None:
+            node_ids = {node_id for entities in graph['entities'].values() for node_id in entities}
+            graph['relationships'] = [r for r in graph['relationships'] if r['to_id'] in node_ids]
 
         return graph
 
@@ -127,44 +385,66 @@ class FalkorDBIntegration(DatabaseIntegration):
         src_id     = int(data["from_id"])
         dst_id     = int(data["to_id"])
         edge_type  = data["relationship"].strip().replace(' ', '_')
-        src_entity = data["from_entity"]
-        dst_entity = data["to_entity"]
 
         q = f"""MATCH (src), (dest)
                 WHERE ID(src) = $src_id AND ID(dest) = $dest_id
-                CREATE (src)-[:{edge_type}]->(dest)"""
+                CREATE (src)-[e:{edge_type}]->(dest)
+                SET e = $attr"""
 
-        result = self.g.query(q, {'src_id': src_id, 'dest_id': dst_id})
+        result = self.g.query(q, {'src_id': src_id, 'dest_id': dst_id, 'attr': edge_properties(data)})
 
         return result.relationships_created == 1
 
+    # case-insensitive substring filters, same semantics as the in-memory backend
+    # values are passed as positional parameters since keys may not be valid parameter names
+    def _contains_filters(self, search_params):
+        filters = []
+        params  = {}
+        for i, (key, value) in enumerate(search_params.items()):
+            filters.append(f"toLower(toString(n.`{key}`)) CONTAINS toLower($p{i})")
+            params[f"p{i}"] = str(value)
+
+        return " AND ".join(filters) or "true", params
+
     def search_entities(self, search_params):
-        search_params = remove_spaces(search_params)
+        search_params   = remove_spaces(search_params)
+        filters, params = self._contains_filters(search_params)
 
-        filters = " AND ".join([f"n.{key} = ${key}" for key in search_params])
         q = f"""MATCH (n)
                 WHERE {filters}
                 RETURN n"""
-        
-        nodes = self.g.query(q, search_params).result_set
+
+        nodes = self.g.query(q, params).result_set
 
         results = []
         for n in nodes:
             n = n[0]
-            results.append({"type": entity_type, "id": n.id, **n.properties})
+            results.append({"type": n.labels[0], "id": n.id, **n.properties})
 
         return results
 
-    def search_entities_with_type(self, entity_type, search_params):
-        search_params = remove_spaces(search_params)
-
-        filters = " AND ".join([f"n.{key} = ${key}" for key in search_params])
-        q = f"""MATCH (n:{entity_type})
-                WHERE {filters}
-                RETURN n"""
-        
-        nodes = self.g.query(q, search_params).result_set
-
+    # fulltext=False builds the label scan, which searches that found nothing in the index fall back on
+    def _search_entities_with_type_query(self, entity_type, search_params, fulltext=True):
+        search_params   = remove_spaces(search_params)
+        filters, params = self._contains_filters(search_params)
+
+        # use the full-text index to find candidates, the filters keep substring semantics
+        query = fulltext_query([search_params[key] for key in FULLTEXT_FIELDS if key in search_params])
+        if fulltext and query and entity_type in self.fulltext_labels:
+            params["label"] = entity_type
+            params["fulltext_query"] = query
+            q = f"""CALL db.idx.fulltext.queryNodes($label, $fulltext_query) YIELD node
+                    WITH node AS n
+                    WHERE {filters}
+                    RETURN n"""
+        else:
+            q = f"""MATCH (n:`{entity_type}`)
+                    WHERE {filters}
+                    RETURN n"""
+
+        return q, params
+
+    def _entity_results(self, entity_type, nodes):
         results = []
         for n in nodes:
             n = n[0]
@@ -172,6 +452,32 @@ class FalkorDBIntegration(DatabaseIntegration):
 
         return results
 
+    # the full-text index only matches word prefixes, so a search it finds nothing for is run again as a
+    # label scan, which also finds fragments from the middle of a word ("lic" in "Alice")
+    def search_entities_with_type(self, entity_type, search_params):
+        q, params = self._search_entities_with_type_query(entity_type, search_params)
+
+        nodes = self.g.query(q, params).result_set
+        if not nodes and "fulltext_query" in params:
+            q, params = self._search_entities_with_type_query(entity_type, search_params, fulltext=False)
+            nodes = self.g.query(q, params).result_set
+
+        return self._entity_results(entity_type, nodes)
+
+    def search_entities_with_type_batch(self, entity_type, search_params_list):
+        queries = [self._search_entities_with_type_query(entity_type, params) for params in search_params_list]
+        results = [result.result_set for result in self.pipeline_queries(queries)]
+
+        misses = [i for i, (nodes, (_, params)) in enumerate(zip(results, queries))
+                  if not nodes and "fulltext_query" in params]
+        if misses:
+            scans = [self._search_entities_with_type_query(entity_type, search_params_list[i], fulltext=False)
+                     for i in misses]
+            for i, result in zip(misses, self.pipeline_queries(scans)):
+                results[i] = result.result_set
+
+        return [self._entity_results(entity_type, nodes) for nodes in results]
+
     def search_relationships(self, search_params):
         search_params = remove_spaces(search_params)
 
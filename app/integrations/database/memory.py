@@ -14,18 +14,55 @@
 # This representation is basic and intended for demonstration or prototyping. For production use, a database and an ORM (Object-Relational Mapping) should be utilized for data persistence and management.
 
 # This is a very basic representation. For a real application, use a database and ORM.
+import atexit
+import itertools
+import os
+import time
+
 from .base import DatabaseIntegration
 
+# Warm start from a binary snapshot (snapshot_file.py) written by save_snapshot, and save it again on exit
+# ("" disables both)
+MEMORY_SNAPSHOT_PATH = os.environ.get("MEMORY_SNAPSHOT_PATH", "")
+
 next_id = 1
+# Versions of the graph's structure, unique across instances so no two states share one
+_versions = itertools.count(1)
 
 
 class InMemoryDatabase(DatabaseIntegration):
+  version = 0
 
-  def __init__(self):
+  def __init__(self, snapshot_path=MEMORY_SNAPSHOT_PATH):
     self.graph = {
         "entities": {},  # Stores all entities by type and then by ID
         "relationships": [],  # Stores relationships
     }
+    self.snapshot_path = snapshot_path
+    if snapshot_path:
+      if os.path.exists(snapshot_path):
+        self.load_snapshot(snapshot_path)
+      atexit.register(self.save_snapshot)
+
+  def load_snapshot(self, path):
+    # The graph stays in the mapped file and is decoded as it is read
+    global next_id
+    # snapshot_file needs NumPy, which the default in-memory startup doesn't load
+    from .snapshot_file import SnapshotFile
+    started = time.perf_counter()
+    snapshot = SnapshotFile(path)
+    self.graph = snapshot.graph()
+    highest = max((entities.max_int_id() for entities in self.graph["entities"].values()), default=0)
+    next_id = max(next_id, highest + 1)
+    print(f"Loaded snapshot {path}: {snapshot.entity_count} entities, {snapshot.relationship_count} "
+          f"relationships in {time.perf_counter() - started:.3f}s")
+    return snapshot
+
+  def save_snapshot(self, path=None):
+    path = path or self.snapshot_path
+    if path:
+      from .snapshot_file import write_snapshot
+      write_snapshot(path, self.graph)
 
   def add_entity(self, entity_type, data):
     print("add_entity")
@@ -36,12 +73,30 @@ class InMemoryDatabase(DatabaseIntegration):
       self.graph["entities"][entity_type] = {}
     self.graph["entities"][entity_type][entity_id] = data
     next_id += 1
+    self._changed()
     print(f"Added {entity_type} with ID: {entity_id}, next ID: {next_id}")
     return entity_id
 
+  def add_entities(self, entity_type, data_list):
+    # The bulk path: no per-entity logging
+    global next_id
+    entities = self.graph["entities"].setdefault(entity_type, {})
+    entity_ids = list(range(next_id, next_id + len(data_list)))
+    entities.update(zip(entity_ids, data_list))
+    next_id += len(data_list)
+    self._changed()
+    return entity_ids
+
   def get_full_graph(self):
     return self.graph
 
+  def data_version(self):
+    return self.version
+
+  def _changed(self):
+    # After every write that changes the graph, updates included: snapshots copy the entity names
+    self.version = next(_versions)
+
   def get_entity(self, entity_type, entity_id):
     return self.graph["entities"].get(entity_type, {}).get(entity_id)
 
@@ -52,10 +107,14 @@ class InMemoryDatabase(DatabaseIntegration):
     entities = self.graph["entities"].get(entity_type)
     if entities and entity_id in entities:
       entities[entity_id].update(data)
+      self._changed()
       return True
     return False
 
   def delete_entity(self, entity_type, entity_id):
+    # The DELETE route passes the ID through as a string
+    if isinstance(entity_id, str) and entity_id.isdigit():
+      entity_id = int(entity_id)
     entities = self.graph["entities"].get(entity_type)
     if entities and entity_id in entities:
       # Delete the entity from the entities dictionary
@@ -67,14 +126,22 @@ class InMemoryDatabase(DatabaseIntegration):
           if relationship["from_id"] != entity_id
           and relationship["to_id"] != entity_id
       ]
+      self._changed()
 
       return True
     return False
 
   def add_relationship(self, data):
     self.graph["relationships"].append(data)
+    self._changed()
     return len(self.graph["relationships"])
 
+  def add_relationships(self, data_list):
+    start = len(self.graph["relationships"])
+    self.graph["relationships"].extend(data_list)
+    self._changed()
+    return list(range(start + 1, start + len(data_list) + 1))
+
   def search_entities(self, search_params):
     results = []
     for entity_type, entities in self.graph["entities"].items():
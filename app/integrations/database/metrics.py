@@ -0,0 +1,67 @@
+# Per-operation latency recording for the database integrations.
+#
+# Every operation keeps a call count, the total and maximum time, and a window of its most recent samples from
+# which p50/p90/p99 are computed when stats() is called.
+import functools
+import threading
+import time
+from collections import defaultdict, deque
+
+
+class LatencyRecorder:
+    def __init__(self, window=1024):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._counts = defaultdict(int)
+        self._totals = defaultdict(float)
+        self._maxima = defaultdict(float)
+
+    def record(self, operation, seconds):
+        with self._lock:
+            self._samples[operation].append(seconds)
+            self._counts[operation] += 1
+            self._totals[operation] += seconds
+            self._maxima[operation] = max(self._maxima[operation], seconds)
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+            self._totals.clear()
+            self._maxima.clear()
+
+    def stats(self):
+        with self._lock:
+            snapshot = {operation: sorted(samples) for operation, samples in self._samples.items()}
+            counts = dict(self._counts)
+            totals = dict(self._totals)
+            maxima = dict(self._maxima)
+
+        def percentile(values, fraction):
+            return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+        return {
+            operation: {
+                "count": counts[operation],
+                "mean_ms": round(totals[operation] / counts[operation] * 1000, 3),
+                "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+                "p90_ms": round(percentile(values, 0.90) * 1000, 3),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+                "max_ms": round(maxima[operation] * 1000, 3),
+            }
+            for operation, values in snapshot.items()
+        }
+
+
+# Method decorator recording the call's latency in self.latency under the method's name
+def timed(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.latency.record(method.__name__, time.perf_counter() - started)
+
+    return wrapper
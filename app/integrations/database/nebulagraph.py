@@ -1,14 +1,21 @@
-import ctypes
+import atexit
 import json
 import os
+import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from nebula3.gclient.net import ConnectionPool
 from nebula3.gclient.net.SessionPool import SessionPool
 from nebula3.Config import Config, SessionPoolConfig
 
 from .base import DatabaseIntegration
+from .cache import LRUCache
 from .memory import InMemoryDatabase
+from .metrics import LatencyRecorder, timed
+from .murmur import murmur64, murmur64_batch
+from .snapshot_file import read_snapshot, write_snapshot
 
 
 NEBULA_USER = os.environ.get("NEBULA_USER", "root")
@@ -20,83 +27,99 @@ NEBULA_SPACE_REPLICAS = os.environ.get("NEBULA_SPACE_REPLICAS", 1)
 NEBULA_DDL_WAIT_BACKOFF_SECONDS = os.environ.get("NEBULA_DDL_WAIT_BACKOFF_SECONDS", 15)
 NEBULA_DDL_WAIT_RETRIES = os.environ.get("NEBULA_DDL_WAIT_RETRIES", 3)
 NEBULA_GRAPH_SAMPLE_SIZE = os.environ.get("NEBULA_GRAPH_SAMPLE_SIZE", 2000)
-
-
-def murmur64(string: str, seed: int = 0xC70F6907) -> int:
-    """
-    MurmurHash3 64-bit implementation. Same as the one used in NebulaGraph.
-
-    This is needed as MindGraph is using numeric IDs for entities.
-
-    In NebulaGraph, the built-in hash function is used to hash the vertex ID when
-    Vertex ID Type is int64.
-
-    Query `RETURN hash("foobar")` in Nebula Console to see
-    the hash value of a string.
-
-    Args:
-        string (str): The string to hash.
-        seed (int): The seed value.
-
-    Returns:
-        int: The 64-bit hash value.
-    """
-    data = bytes(string, encoding="utf8")
-
-    def bytes_to_long(bytes):
-        assert len(bytes) == 8
-        return sum((b << (k * 8) for k, b in enumerate(bytes)))
-
-    m = ctypes.c_uint64(0xC6A4A7935BD1E995).value
-
-    r = ctypes.c_uint32(47).value
-
-    MASK = ctypes.c_uint64(2**64 - 1).value
-
-    data_as_bytes = bytearray(data)
-
-    seed = ctypes.c_uint64(seed).value
-
-    h = seed ^ ((m * len(data_as_bytes)) & MASK)
-
-    off = int(len(data_as_bytes) / 8) * 8
-    for ll in range(0, off, 8):
-        k = bytes_to_long(data_as_bytes[ll : ll + 8])
-        k = (k * m) & MASK
-        k = k ^ ((k >> r) & MASK)
-        k = (k * m) & MASK
-        h = h ^ k
-        h = (h * m) & MASK
-
-    l = len(data_as_bytes) & 7
-
-    if l >= 7:
-        h = h ^ (data_as_bytes[off + 6] << 48)
-
-    if l >= 6:
-        h = h ^ (data_as_bytes[off + 5] << 40)
-
-    if l >= 5:
-        h = h ^ (data_as_bytes[off + 4] << 32)
-
-    if l >= 4:
-        h = h ^ (data_as_bytes[off + 3] << 24)
-
-    if l >= 3:
-        h = h ^ (data_as_bytes[off + 2] << 16)
-
-    if l >= 2:
-        h = h ^ (data_as_bytes[off + 1] << 8)
-
-    if l >= 1:
-        h = h ^ data_as_bytes[off]
-        h = (h * m) & MASK
-
-    h = h ^ ((h >> r) & MASK)
-    h = (h * m) & MASK
-    h = h ^ ((h >> r) & MASK)
-
-    return ctypes.c_longlong(h).value
+# Session pool: sessions are opened on demand between the min and max size; a session idle for
+# NEBULA_POOL_IDLE_TIME_MS is closed (0: never), checked every NEBULA_POOL_INTERVAL_CHECK_SECONDS (-1: never)
+NEBULA_POOL_MIN_SIZE = int(os.environ.get("NEBULA_POOL_MIN_SIZE", 1))
+NEBULA_POOL_MAX_SIZE = int(os.environ.get("NEBULA_POOL_MAX_SIZE", 16))
+NEBULA_POOL_TIMEOUT_MS = int(os.environ.get("NEBULA_POOL_TIMEOUT_MS", 0))
+NEBULA_POOL_IDLE_TIME_MS = int(os.environ.get("NEBULA_POOL_IDLE_TIME_MS", 0))
+NEBULA_POOL_INTERVAL_CHECK_SECONDS = int(os.environ.get("NEBULA_POOL_INTERVAL_CHECK_SECONDS", -1))
+# Statements sent per execute by execute_batch
+NEBULA_BATCH_SIZE = int(os.environ.get("NEBULA_BATCH_SIZE", 50))
+# Threads running independent queries in parallel, each on its own pooled session
+NEBULA_FANOUT_WORKERS = int(os.environ.get("NEBULA_FANOUT_WORKERS", NEBULA_POOL_MAX_SIZE))
+# Create the tag/edge indexes searches run on (LOOKUP needs at least one index per tag/edge)
+NEBULA_CREATE_INDEXES = os.environ.get("NEBULA_CREATE_INDEXES", "True") == "True"
+# Full-text indexes need an Elasticsearch listener registered with the cluster (SIGN IN TEXT SERVICE)
+NEBULA_FULLTEXT_INDEXES = os.environ.get("NEBULA_FULLTEXT_INDEXES", "False") == "True"
+# Indexed prefix length of string properties
+NEBULA_INDEX_LENGTH = int(os.environ.get("NEBULA_INDEX_LENGTH", 64))
+# How searches match without a full-text index (with one they always go through ES_QUERY):
+# "prefix": case-sensitive STARTS WITH, answered by an index probe
+# "contains": case-insensitive substring match, the same results as the in-memory backend, but a scan of the
+#   whole index on every search, so only for small spaces
+NEBULA_SEARCH_MATCH = os.environ.get("NEBULA_SEARCH_MATCH", "prefix")
+# Rows fetched per search query, and the most rows a single search returns
+NEBULA_SEARCH_PAGE_SIZE = int(os.environ.get("NEBULA_SEARCH_PAGE_SIZE", 1000))
+NEBULA_SEARCH_LIMIT = int(os.environ.get("NEBULA_SEARCH_LIMIT", 10000))
+# Entities cached by vertex id, search results and the graph sample expire after NEBULA_CACHE_TTL_SECONDS (0: never)
+NEBULA_CACHE_SIZE = int(os.environ.get("NEBULA_CACHE_SIZE", 10000))
+NEBULA_SEARCH_CACHE_SIZE = int(os.environ.get("NEBULA_SEARCH_CACHE_SIZE", 1000))
+NEBULA_CACHE_TTL_SECONDS = float(os.environ.get("NEBULA_CACHE_TTL_SECONDS", 60))
+# Binary snapshot of the graph sample: seeds the caches on startup and is written again on exit ("" disables it)
+NEBULA_SNAPSHOT_PATH = os.environ.get("NEBULA_SNAPSHOT_PATH", "")
+
+# Indexed properties of every tag and every edge type
+ENTITY_INDEX_FIELDS = ["name", "description"]
+RELATIONSHIP_INDEX_FIELDS = ["snippet"]
+
+# Columns a relationship search yields from GO, shaped like the relationship dicts of the other backends
+RELATIONSHIP_YIELD = (
+    "type(edge) AS relationship, src(edge) AS from_id, dst(edge) AS to_id, "
+    "properties(edge).snippet AS snippet, properties(edge).relationship_type AS relationship_type, "
+    "properties($^).name AS from_entity, properties($$).name AS to_entity, "
+    "tags($^)[0] AS from_type, tags($$)[0] AS to_type"
+)
+
+
+def quote(value) -> str:
+    """Return value as a double quoted nGQL string literal."""
+    escaped = (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+        .replace("\t", "\\t")
+    )
+    return f'"{escaped}"'
+
+
+def index_name(prefix, schema_name, field):
+    # Index names can't hold the spaces and slashes some schema.json types use
+    name = re.sub(r"\W+", "_", schema_name)
+    return f"{prefix}_{name}_{field}"
+
+
+def fulltext_index_name(kind, schema_name):
+    # Full-text index names must start with nebula_ and use lowercase letters, digits and underscores
+    name = re.sub(r"\W+", "_", schema_name).lower()
+    return f"nebula_{kind}_{name}"
+
+
+def es_query(values):
+    # Elasticsearch query_string matching words that start with each term of the search values
+    terms = [
+        f"{word}*" for value in values for word in re.findall(r"\w+", str(value).lower())
+    ]
+    return " AND ".join(terms)
+
+
+def matches(record, search_params):
+    # Same match rule as the in-memory backend: case-insensitive substring per parameter
+    return all(
+        str(value).lower() in str(record.get(key, "")).lower()
+        for key, value in search_params.items()
+    )
+
+
+def result_rows(result):
+    keys = result.keys()
+    columns = [result.column_values(key) for key in keys]
+    return [
+        {key: None if value.is_null() else value.cast() for key, value in zip(keys, row)}
+        for row in zip(*columns)
+    ]
 
 
 class NebulaGraphIntegration(InMemoryDatabase, DatabaseIntegration):
@@ -108,12 +131,26 @@ class NebulaGraphIntegration(InMemoryDatabase, DatabaseIntegration):
 
         self.nebula_connection = ConnectionPool()
         self.client = None
+        self.latency = LatencyRecorder()
+        self._fanout_executor = None
         self._ensure_nebula_connection()
 
         self.schema = self._load_schema(schema_file_path)
+        self.edge_types = []
+        # tag/edge name -> full-text index name, for the ones that could be created
+        self.fulltext_indexes = {}
         self._ensure_nebulagraph_schema()
-        # cache and fast track implementation for search_entities
-        self.graph = {"entities": {}, "relationships": []}
+        # Write-through caches. Every mutation writes the entity cache and bumps self.version;
+        # search results and the graph sample are keyed by the version they were read at.
+        self.version = 0
+        self._version_lock = threading.Lock()
+        self.entity_cache = LRUCache(NEBULA_CACHE_SIZE, NEBULA_CACHE_TTL_SECONDS)
+        self.search_cache = LRUCache(NEBULA_SEARCH_CACHE_SIZE, NEBULA_CACHE_TTL_SECONDS)
+        # The graph keyed by vertex id and its renumbered view
+        self.graph_cache = LRUCache(2, NEBULA_CACHE_TTL_SECONDS)
+        if NEBULA_SNAPSHOT_PATH:
+            self.seed_caches()
+            atexit.register(self._save_snapshot_on_exit)
 
     def _ensure_nebula_connection(self):
         # Ensure a connection to Nebula Graph is established
@@ -179,7 +216,65 @@ class NebulaGraphIntegration(InMemoryDatabase, DatabaseIntegration):
             self.nebula_space,
             self.nebula_connection._addresses,
         )
-        self.client.init(SessionPoolConfig())
+        pool_config = SessionPoolConfig()
+        pool_config.min_size = NEBULA_POOL_MIN_SIZE
+        pool_config.max_size = NEBULA_POOL_MAX_SIZE
+        pool_config.timeout = NEBULA_POOL_TIMEOUT_MS
+        pool_config.idle_time = NEBULA_POOL_IDLE_TIME_MS
+        pool_config.interval_check = NEBULA_POOL_INTERVAL_CHECK_SECONDS
+        self.client.init(pool_config)
+
+    def _execute(self, query):
+        # Every round trip goes through here so that its latency is recorded
+        started = time.perf_counter()
+        try:
+            return self.client.execute(query)
+        finally:
+            self.latency.record("round_trip", time.perf_counter() - started)
+
+    def execute_batch(self, statements, batch_size=NEBULA_BATCH_SIZE):
+        """
+        Execute statements with several of them per round trip.
+
+        nGQL runs the statements of one execute in order and stops at the first failure,
+        so each batch either fully succeeds or raises.
+
+        Args:
+            statements (list): nGQL statements, each ending with a semicolon.
+            batch_size (int): The statements sent per execute.
+
+        Returns:
+            list: The result of the last statement of every batch.
+        """
+        results = []
+        for start in range(0, len(statements), batch_size):
+            query = "\n".join(statements[start:start + batch_size])
+            result = self._execute(query)
+            assert result.is_succeeded(), f"Failed to execute batch: {result.error_msg()}\n query: {query}"
+            results.append(result)
+        return results
+
+    def _fan_out(self, function, arguments):
+        """
+        Call function once per item of arguments, in parallel across pooled sessions.
+
+        Returns:
+            list: The results, in the order of arguments.
+        """
+        arguments = list(arguments)
+        if len(arguments) <= 1 or NEBULA_FANOUT_WORKERS <= 1:
+            return [function(*args) for args in arguments]
+        if self._fanout_executor is None:
+            self._fanout_executor = ThreadPoolExecutor(
+                max_workers=NEBULA_FANOUT_WORKERS, thread_name_prefix="nebula-fanout"
+            )
+        return list(self._fanout_executor.map(lambda args: function(*args), arguments))
+
+    def latency_stats(self):
+        """
+        Return count, mean and p50/p90/p99 latency per operation, plus per round trip.
+        """
+        return self.latency.stats()
 
     def _load_schema(self, schema_file_path):
         # Load and return the schema from the schema.json file
@@ -188,9 +283,9 @@ class NebulaGraphIntegration(InMemoryDatabase, DatabaseIntegration):
         return schema
 
     def _get_nebula_schema(self):
-        tags_raw = self.client.execute("SHOW TAGS").column_values("Name")
+        tags_raw = self._execute("SHOW TAGS").column_values("Name")
         tags = [tag.cast() for tag in tags_raw]
-        edges_raw = self.client.execute("SHOW EDGES").column_values("Name")
+        edges_raw = self._execute("SHOW EDGES").column_values("Name")
         edges = [edge.cast() for edge in edges_raw]
         return {"entities": tags, "relationships": edges}
 
@@ -244,7 +339,7 @@ class NebulaGraphIntegration(InMemoryDatabase, DatabaseIntegration):
             try:
                 # Execute Schema Creation Queries
                 query = "\n".join(tag_queries + edge_queries)
-                execute_result = self.client.execute(query)
+                execute_result = self._execute(query)
                 assert (
                     execute_result.is_succeeded()
                 ), f"Failed to create tags and edges: {execute_result.error_msg()}\n query: {query}"
@@ -254,22 +349,167 @@ class NebulaGraphIntegration(InMemoryDatabase, DatabaseIntegration):
             else:
                 print(f"Successfully created tags and edges: {query}")
 
+        self.edge_types = sorted(edge_names)
+        if NEBULA_CREATE_INDEXES:
+            self._ensure_nebulagraph_indexes(tag_names, edge_names)
+
+    def _execute_ddl(self, query):
+        # Schema changes reach the graph service on the next heartbeat, so statements that depend on
+        # a just created tag, edge or index are retried with the same backoff as USE <space>
+        retries = int(NEBULA_DDL_WAIT_RETRIES)
+        backoff_seconds = int(NEBULA_DDL_WAIT_BACKOFF_SECONDS)
+        for attempt in range(retries):
+            result = self._execute(query)
+            if result.is_succeeded():
+                return result
+            if attempt < retries - 1:
+                print(f"Attempt {attempt + 1} of {query} failed with error: {result.error_msg()}. Retrying...")
+                time.sleep(backoff_seconds * 2**attempt)
+        raise Exception(f"Failed to execute {query}: {result.error_msg()}")
+
+    def _ensure_nebulagraph_indexes(self, tag_names, edge_names):
+        """
+        Create the indexes the search methods push down to:
+        - a native index on name and on description of every tag
+        - a native index on snippet of every edge type
+        - with NEBULA_FULLTEXT_INDEXES, a full-text index on the same properties
+
+        New native indexes are rebuilt so that they also cover existing data.
+        """
+        existing = {
+            value.cast() for value in self._execute("SHOW TAG INDEXES").column_values("Index Name")
+        }
+        existing |= {
+            value.cast() for value in self._execute("SHOW EDGE INDEXES").column_values("Index Name")
+        }
+
+        created = {"TAG": [], "EDGE": []}
+        statements = []
+        targets = [("TAG", "idx", tag, ENTITY_INDEX_FIELDS) for tag in tag_names]
+        targets += [("EDGE", "eidx", edge, RELATIONSHIP_INDEX_FIELDS) for edge in edge_names]
+        for kind, prefix, schema_name, fields in targets:
+            for field in fields:
+                name = index_name(prefix, schema_name, field)
+                if name in existing:
+                    continue
+                statements.append(
+                    f"CREATE {kind} INDEX IF NOT EXISTS `{name}` "
+                    f"ON `{schema_name}`({field}({NEBULA_INDEX_LENGTH}));"
+                )
+                created[kind].append(name)
+
+        if not statements:
+            return self._ensure_nebulagraph_fulltext_indexes(tag_names, edge_names)
+
+        # IF NOT EXISTS makes a batch safe to retry after a partial failure
+        print(f"Creating indexes: {created}")
+        try:
+            for start in range(0, len(statements), NEBULA_BATCH_SIZE):
+                self._execute_ddl("\n".join(statements[start:start + NEBULA_BATCH_SIZE]))
+        except Exception as e:
+            print(f"Error creating indexes: {e}")
+            return
+
+        rebuilds = [
+            f"REBUILD {kind} INDEX {', '.join(f'`{name}`' for name in names)};"
+            for kind, names in created.items() if names
+        ]
+        try:
+            self._execute_ddl("\n".join(rebuilds))
+        except Exception as e:
+            print(f"Error rebuilding indexes: {e}")
+
+        self._ensure_nebulagraph_fulltext_indexes(tag_names, edge_names)
+
+    def _ensure_nebulagraph_fulltext_indexes(self, tag_names, edge_names):
+        if not NEBULA_FULLTEXT_INDEXES:
+            return
+        result = self._execute("SHOW FULLTEXT INDEXES")
+        if not result.is_succeeded():
+            print(f"Full-text indexes are not available: {result.error_msg()}")
+            return
+        existing = {value.cast() for value in result.column_values("Name")}
+
+        targets = [("TAG", tag, ENTITY_INDEX_FIELDS) for tag in tag_names]
+        targets += [("EDGE", edge, RELATIONSHIP_INDEX_FIELDS) for edge in edge_names]
+        created = False
+        for kind, schema_name, fields in targets:
+            name = fulltext_index_name(kind.lower(), schema_name)
+            if name not in existing:
+                try:
+                    self._execute_ddl(
+                        f"CREATE FULLTEXT {kind} INDEX {name} ON `{schema_name}`({', '.join(fields)});"
+                    )
+                    created = True
+                except Exception as e:
+                    print(f"Error creating full-text index {name}: {e}")
+                    continue
+            self.fulltext_indexes[schema_name] = name
+
+        if created:
+            try:
+                self._execute_ddl("REBUILD FULLTEXT INDEX;")
+            except Exception as e:
+                print(f"Error rebuilding full-text indexes: {e}")
+
+    def _bump_version(self):
+        with self._version_lock:
+            self.version += 1
+
+    def _cache_entity(self, entity_type, entity_id, data):
+        record = {"entity_type": entity_type, "data": data}
+        self.entity_cache.set(int(entity_id), record)
+        return record
+
+    def cache_stats(self):
+        """
+        Return the size and hit ratio of every cache, along with the current version.
+        """
+        return {
+            "version": self.version,
+            "entities": self.entity_cache.stats(),
+            "searches": self.search_cache.stats(),
+            "graph": self.graph_cache.stats(),
+        }
+
+    @timed
     def get_full_graph(self, limit=NEBULA_GRAPH_SAMPLE_SIZE):
         """
-        Return the sampled full graph. sample size is configurable with NEBULA_GRAPH_SAMPLE_SIZE.
+        Return up to limit relationships and their endpoints, keyed by vertex id like every other read.
+        The limit is configurable with NEBULA_GRAPH_SAMPLE_SIZE.
+
+        The graph is cached until the next write or NEBULA_CACHE_TTL_SECONDS.
 
         Returns:
             dict: The full graph.
         """
-        graph_sample = {
+        return self._get_cache_full_graph(limit=limit)
+
+    @timed
+    def get_graph_view(self, limit=NEBULA_GRAPH_SAMPLE_SIZE):
+        """
+        Return the graph as the UI gets it: get_full_graph with the vertices renumbered from 0 (temp_id).
+        Every entity keeps its vertex id as entity_id.
+        """
+        key = ("view", self.version, limit)
+        graph = self.graph_cache.get(key)
+        if graph is None:
+            graph = self._sample_graph(self.get_full_graph(limit=limit))
+            self.graph_cache.set(key, graph)
+        return graph
+
+    def _fetch_full_graph(self, limit=NEBULA_GRAPH_SAMPLE_SIZE):
+        return self._named_graph(self._fetch_graph(limit=limit))
+
+    def _fetch_graph(self, limit=NEBULA_GRAPH_SAMPLE_SIZE):
+        # Up to limit edges and their endpoints, keyed by vertex id
+        graph = {
             "entities": {},
             "relationships": [],
         }
-        vector_id_map = {}
-        next_id = 0
 
         # Get edges
-        edges = self.client.execute(
+        edges = self._execute(
             f"MATCH ()-[e]->() RETURN e LIMIT {limit} ;"
         ).column_values("e")
         vertex_ids = set()
@@ -283,59 +523,112 @@ class NebulaGraphIntegration(InMemoryDatabase, DatabaseIntegration):
                     "relationship": edge.edge_name(),
                     "from_id": edge.start_vertex_id().cast(),
                     "to_id": edge.end_vertex_id().cast(),
-                    "from_entity": "",
-                    "to_entity": "",
                 }
             )
-            graph_sample["relationships"].append(data)
+            graph["relationships"].append(data)
             vertex_ids.add(edge.start_vertex_id().cast())
             vertex_ids.add(edge.end_vertex_id().cast())
 
         # Get vertices
         vertices_id_str = ", ".join(str(v) for v in vertex_ids)
-        vertices = self.client.execute(
+        vertices = self._execute(
             f"MATCH (v) WHERE id(v) IN [{vertices_id_str}] RETURN v;"
         ).column_values("v")
 
         for vertex_raw in vertices:
             vertex = vertex_raw.cast()
             for tag in vertex.tags():
-                entity_type = tag
-                entity_id = vertex.get_id().cast()
-                entity_id = entity_id
                 data_raw = vertex.properties(tag)
                 data = {k: v.cast() for k, v in data_raw.items()}
-                temp_id = int(next_id)
-                vector_id_map[entity_id] = {
-                    "temp_id": next_id,
-                    "name": data.get("name", f"{entity_type}_{entity_id}"),
-                }
-                next_id += 1
-                data["temp_id"] = temp_id
-                record = {"entity_type": entity_type, "data": data}
-                if tag in graph_sample["entities"]:
-                    graph_sample["entities"][entity_type][temp_id] = record
-                else:
-                    graph_sample["entities"][entity_type] = {temp_id: record}
-
-        # update from entity and to entity with entity name
-        for relationship in graph_sample["relationships"]:
-            from_id = relationship["from_id"]
-            to_id = relationship["to_id"]
-            relationship["from_entity"] = vector_id_map.get(from_id, {}).get("name", "")
-            relationship["to_entity"] = vector_id_map.get(to_id, {}).get("name", "")
-            temp_from_id = vector_id_map.get(from_id, {}).get("temp_id", "")
-            temp_to_id = vector_id_map.get(to_id, {}).get("temp_id", "")
-            relationship["from_id"] = temp_from_id
-            relationship["to_id"] = temp_to_id
+                graph["entities"].setdefault(tag, {})[vertex.get_id().cast()] = {"entity_type": tag, "data": data}
+
+        return graph
+
+    def _named_graph(self, graph):
+        # The graph keyed by vertex id, with endpoint names on the relationships; warms the entity cache
+        named = {"entities": {}, "relationships": []}
+        names = {}
+        for entity_type, entities in graph["entities"].items():
+            for entity_id, entity in entities.items():
+                data = dict(entity["data"])
+                names[entity_id] = data.get("name", f"{entity_type}_{entity_id}")
+                self._cache_entity(entity_type, entity_id, dict(data))
+                named["entities"].setdefault(entity_type, {})[entity_id] = {"entity_type": entity_type, "data": data}
+        for edge in graph["relationships"]:
+            relationship = dict(edge)
+            relationship["from_entity"] = names.get(relationship["from_id"], "")
+            relationship["to_entity"] = names.get(relationship["to_id"], "")
+            named["relationships"].append(relationship)
+        return named
+
+    def _sample_graph(self, graph):
+        # The graph of _named_graph with its vertices renumbered from 0 (temp_id), for the UI
+        graph_sample = {
+            "entities": {},
+            "relationships": [],
+        }
+        temp_ids = {}
+
+        for entity_type, entities in graph["entities"].items():
+            for entity_id, entity in entities.items():
+                temp_id = temp_ids[entity_id] = len(temp_ids)
+                data = {**entity["data"], "temp_id": temp_id}
+                record = {"entity_type": entity_type, "entity_id": entity_id, "data": data}
+                graph_sample["entities"].setdefault(entity_type, {})[temp_id] = record
+
+        for edge in graph["relationships"]:
+            relationship = dict(edge)
+            relationship["from_id"] = temp_ids.get(relationship["from_id"], "")
+            relationship["to_id"] = temp_ids.get(relationship["to_id"], "")
+            graph_sample["relationships"].append(relationship)
 
         return graph_sample
 
-    def _get_cache_full_graph(self, limit=NEBULA_GRAPH_SAMPLE_SIZE, force=False):
-        if force or not self.graph["entities"] or not self.graph["relationships"]:
-            self.graph = self.get_full_graph(limit=limit)
-        return self.graph
+    def save_snapshot(self, path=NEBULA_SNAPSHOT_PATH, limit=NEBULA_GRAPH_SAMPLE_SIZE):
+        """
+        Write the graph sample, keyed by vertex id, to a binary snapshot (snapshot_file.py) for seed_caches.
+        """
+        if path:
+            write_snapshot(path, self._fetch_graph(limit=limit), {"space": self.nebula_space, "limit": limit})
+
+    def seed_caches(self, path=NEBULA_SNAPSHOT_PATH):
+        """
+        Fill the graph and entity caches from a snapshot written by save_snapshot, so that the first
+        requests after a restart don't wait for the sample queries.
+
+        The seeded entries expire like any others, after NEBULA_CACHE_TTL_SECONDS or the next write.
+
+        Returns:
+            bool: Whether a snapshot of this space was loaded.
+        """
+        if not path or not os.path.exists(path):
+            return False
+        try:
+            graph, metadata = read_snapshot(path)
+        except ValueError as e:
+            print(f"Error loading NebulaGraph snapshot: {e}")
+            return False
+        if metadata.get("space") != self.nebula_space:
+            return False
+        self.graph_cache.set(("graph", self.version, metadata["limit"]), self._named_graph(graph))
+        print(f"Seeded NebulaGraph caches from {path}")
+        return True
+
+    def _save_snapshot_on_exit(self):
+        try:
+            self.save_snapshot()
+        except Exception as e:
+            print(f"Error saving NebulaGraph snapshot: {e}")
 
+    def _get_cache_full_graph(self, limit=NEBULA_GRAPH_SAMPLE_SIZE, force=False):
+        key = ("graph", self.version, limit)
+        graph = None if force else self.graph_cache.get(key)
+        if graph is None:
+            graph = self._fetch_full_graph(limit=limit)
+            self.graph_cache.set(key, graph)
+        return graph
+
+    @timed
     def get_entity(self, entity_type, entity_id):
         """
         Get an entity from the graph.
@@ -345,16 +638,30 @@ class NebulaGraphIntegration(InMemoryDatabase, DatabaseIntegration):
             entity_id (str): The ID of the entity.
 
         Returns:
-            dict: The entity.
+            dict: The entity, {"entity_type": ..., "data": {...}}, or None when it doesn't exist.
         """
-        result = self.client.execute(
-            f"MATCH (v:`{entity_type}`) WHERE id(v) == {entity_id} RETURN v;"
+        try:
+            vertex_id = int(entity_id)
+        except (TypeError, ValueError):
+            return None
+        record = self.entity_cache.get(vertex_id)
+        if record is not None:
+            # A vertex can carry several tags, the cache holds the one it was last seen with
+            if record["entity_type"] == entity_type:
+                return record
+
+        result = self._execute(
+            f"FETCH PROP ON `{entity_type}` {vertex_id} "
+            f"YIELD properties(vertex).name AS name, properties(vertex).description AS description;"
         )
-        if result.is_succeeded() and result.row_size() > 0:
-            for vertex in result.column_values("v"):
-                return vertex.properties(entity_type)
-        return {}
-
+        assert result.is_succeeded(), f"Failed to fetch vertex: {result.error_msg()}"
+        for row in result_rows(result):
+            if row["name"] is not None:
+                data = {key: row[key] or "" for key in ENTITY_INDEX_FIELDS}
+                return self._cache_entity(entity_type, vertex_id, data)
+        return None
+
+    @timed
     def get_all_entities(self, entity_type):
         """
         Get all entities of a given type.
@@ -366,7 +673,7 @@ class NebulaGraphIntegration(InMemoryDatabase, DatabaseIntegration):
             dict: The entities.
         """
         entities = {}
-        result = self.client.execute(f"MATCH (v:`{entity_type}`) RETURN v;")
+        result = self._execute(f"MATCH (v:`{entity_type}`) RETURN v;")
         if result.is_succeeded():
             for vertex in result:
                 entity_id = vertex.get_id().cast()
@@ -374,6 +681,7 @@ class NebulaGraphIntegration(InMemoryDatabase, DatabaseIntegration):
                 entities[entity_id] = data
         return entities
 
+    @timed
     def add_entity(self, entity_type, data):
         """
         Add an entity to the graph.
@@ -401,18 +709,56 @@ class NebulaGraphIntegration(InMemoryDatabase, DatabaseIntegration):
         vertex_id = murmur64(prop_name)
 
         # Insert into NebulaGraph
-        query = f"INSERT VERTEX {vertex_tag}(name, description) VALUES {vertex_id}:('{prop_name}', '{prop_description}');"
-        result = self.client.execute(query)
+        query = f"INSERT VERTEX `{vertex_tag}`(name, description) VALUES {vertex_id}:({quote(prop_name)}, {quote(prop_description)});"
+        result = self._execute(query)
         assert result.is_succeeded(), f"Failed to insert vertex: {result.error_msg()}"
 
-        # Added to cache
-        if entity_type in self.graph["entities"]:
-            self.graph["entities"][entity_type][vertex_id] = actual_data
-        else:
-            self.graph["entities"][entity_type] = {vertex_id: actual_data}
+        self._cache_entity(
+            entity_type, vertex_id, {"name": prop_name, "description": prop_description}
+        )
+        self._bump_version()
 
         return str(vertex_id)
 
+    @timed
+    def add_entities(self, entity_type, data_list):
+        """
+        Add many entities of one type, for bulk loads.
+
+        Vertex IDs are hashed in one murmur64_batch call and the vertices are inserted
+        NEBULA_BATCH_SIZE per INSERT statement, with several statements per round trip.
+
+        Args:
+            entity_type (str): The type of entity.
+            data_list (list): Entity payloads, as passed to add_entity.
+
+        Returns:
+            list: The IDs of the new entities, in the order of data_list.
+        """
+        rows = [data["data"] for data in data_list]
+        if any(not row.get("name", "") for row in rows):
+            raise ValueError("Entity name is required.")
+        vertex_ids = murmur64_batch(row["name"] for row in rows).tolist()
+
+        values = [
+            f"{vertex_id}:({quote(row['name'])}, {quote(row.get('description', ''))})"
+            for vertex_id, row in zip(vertex_ids, rows)
+        ]
+        statements = [
+            f"INSERT VERTEX `{entity_type}`(name, description) VALUES {', '.join(values[start:start + NEBULA_BATCH_SIZE])};"
+            for start in range(0, len(values), NEBULA_BATCH_SIZE)
+        ]
+        self.execute_batch(statements)
+
+        for vertex_id, row in zip(vertex_ids, rows):
+            self._cache_entity(
+                entity_type, vertex_id, {"name": row["name"], "description": row.get("description", "")}
+            )
+        self._bump_version()
+
+        return [str(vertex_id) for vertex_id in vertex_ids]
+
+    @timed
     def update_entity(self, entity_type, entity_id, data):
         """
         Update an entity in the graph.
@@ -435,24 +781,27 @@ class NebulaGraphIntegration(InMemoryDatabase, DatabaseIntegration):
 
         actual_data = data["data"]
         prop_name = actual_data.get("name", "")
-        if prop_name:
-            vertex_id = murmur64(prop_name)
-            if vertex_id != entity_id:
-                raise ValueError("Entity name cannot be changed for now.")
-        vertex_id = entity_id
+        vertex_id = int(entity_id)
+        if prop_name and murmur64(prop_name) != vertex_id:
+            raise ValueError("Entity name cannot be changed for now.")
 
         description = actual_data.get("description", "")
         if description:
-            query = f"UPDATE VERTEX ON {entity_type} \"{vertex_id}\" SET description = '{description}' WHEN description != '{description}' YIELD description;"
-            result = self.client.execute(query)
+            query = f"UPDATE VERTEX ON `{entity_type}` {vertex_id} SET description = {quote(description)} WHEN description != {quote(description)} YIELD description;"
+            result = self._execute(query)
             if not result.is_succeeded():
                 print(f"Failed to update vertex: {result.error_msg()}")
                 return False
-            # Update cache
-            self.graph["entities"][entity_type][vertex_id].update(actual_data)
+            cached = self.entity_cache.get(vertex_id)
+            if cached is not None and cached["entity_type"] == entity_type:
+                self._cache_entity(entity_type, vertex_id, {**cached["data"], "description": description})
+            else:
+                self.entity_cache.pop(vertex_id)
+            self._bump_version()
             return True
         return False
 
+    @timed
     def add_relationship(self, data):
         """
         Add a relationship to the graph.
@@ -484,123 +833,253 @@ class NebulaGraphIntegration(InMemoryDatabase, DatabaseIntegration):
             # src_entity = data["from_entity"]
             # dst_entity = data["to_entity"]
             relationship_type = data.get("relationship_type", "associated")
-            query = f"INSERT EDGE `{edge_type}`(snippet, relationship_type) VALUES {src_id} -> {dst_id}:('{snippet}', '{relationship_type}');"
-            result = self.client.execute(query)
+            query = f"INSERT EDGE `{edge_type}`(snippet, relationship_type) VALUES {src_id} -> {dst_id}:({quote(snippet)}, {quote(relationship_type)});"
+            result = self._execute(query)
             assert result.is_succeeded(), f"Failed to insert edge: {result.error_msg()}"
         except Exception as e:
             print(f"Error adding relationship: {e}")
             raise e
 
-        # Update cache
-        self.graph["relationships"].append(data)
+        self._bump_version()
 
         return murmur64(f"{src_id}{edge_type}{dst_id}")
 
+    @timed
     def delete_entity(self, entity_type, entity_id):
         """
-        Delete an entity from the graph.
-        """
+        Delete an entity from the graph, along with the neighbours that are connected to nothing else.
 
-        # Ensure such entity exists
+        The existence check and the neighbour traversal are independent and run in parallel,
+        then all vertices go in a single DELETE: two round trips instead of four.
+        """
+        vertex_id = int(entity_id)
 
-        result = self.client.execute(
-            f"MATCH (v:`{entity_type}`) WHERE id(v) == {entity_id} RETURN v;"
-        )
-        assert result.is_succeeded(), f"Failed to find vertex: {result.error_msg()}"
-        if result.row_size() == 0:
+        # (entity_id)-[]-(involved) but not (involved)-[]-(other_entities)
+        exists, involved = self._fan_out(self._execute, [
+            (f"FETCH PROP ON `{entity_type}` {vertex_id} YIELD id(vertex) AS id;", ),
+            (
+                f"GO FROM {vertex_id} OVER * BIDIRECT YIELD DISTINCT id($$) AS associated_node "
+                f"MINUS "
+                f"(GO FROM {vertex_id} OVER * BIDIRECT YIELD DISTINCT id($$) AS associated_node | "
+                f"GO FROM $-.associated_node OVER * BIDIRECT "
+                f"WHERE id($$) != {vertex_id} YIELD DISTINCT $-.associated_node AS associated_node);",
+            ),
+        ])
+        assert exists.is_succeeded(), f"Failed to find vertex: {exists.error_msg()}"
+        if exists.row_size() == 0:
             return False
+        assert involved.is_succeeded(), f"Failed to find involved vertices: {involved.error_msg()}"
 
-        # Get edges
-
-        # Invovled vertices to be removed:
-
-        invloved_vertices = []
-
-        # (entity_id)-[]-(involved) but not (involved)-[]-(other_entities)
+        invloved_vertices = [int(v.cast()) for v in involved.column_values("associated_node")]
+        if invloved_vertices:
+            print(f"Invloved vertices: {invloved_vertices}")
 
-        invloved_vertices_raw = self.client.execute(
-            f"GO FROM {entity_id} OVER * BIDIRECT YIELD DISTINCT id($$) AS associated_node "
-            f"MINUS "
-            f"(GO FROM {entity_id} OVER * BIDIRECT YIELD DISTINCT id($$) AS associated_node | "
-            f"GO FROM $-.associated_node OVER * BIDIRECT "
-            f"WHERE id($$) != {entity_id} YIELD DISTINCT $-.associated_node AS associated_node);"
-        ).column_values("associated_node")
+        # Remove the entity and all its associated nodes, with their edges
+        vid_list_str = ", ".join(str(v) for v in [vertex_id, *invloved_vertices])
+        result = self._execute(f"DELETE VERTEX {vid_list_str} WITH EDGE;")
+        assert result.is_succeeded(), f"Failed to delete vertex: {result.error_msg()}"
 
-        if invloved_vertices_raw:
-            invloved_vertices = [int(v.cast()) for v in invloved_vertices_raw]
-            print(f"Invloved vertices: {invloved_vertices}")
+        for deleted_id in [vertex_id, *invloved_vertices]:
+            self.entity_cache.pop(deleted_id)
+        self._bump_version()
 
-            # Remove the entity and all its associated nodes
-            # Remove the edges between the entity and its associated nodes
+        return True
 
-            vid_list_str = ", ".join(str(v) for v in invloved_vertices)
+    def _paged_rows(self, query, cursor=None, order=(), limit=NEBULA_SEARCH_LIMIT,
+                    page_size=NEBULA_SEARCH_PAGE_SIZE):
+        """
+        Run a query page by page and yield its rows as dicts.
 
-            result = self.client.execute(f"DELETE VERTEX {vid_list_str} WITH EDGE;")
-            assert (
-                result.is_succeeded()
-            ), f"Failed to delete vertex: {result.error_msg()}"
+        Pages are sorted, so that they neither repeat nor skip rows. With a cursor column, one that is unique
+        per row such as the vertex id of a tag lookup, every page continues after the last value of the
+        previous page; otherwise the rows are sorted by the order columns and paged by offset.
 
-        result = self.client.execute(f"DELETE VERTEX {entity_id} WITH EDGE;")
-        assert result.is_succeeded(), f"Failed to delete vertex: {result.error_msg()}"
+        Args:
+            query (str): The nGQL query, without a trailing semicolon.
+            cursor (str): The unique column to page on.
+            order (tuple): The columns to sort by without a cursor.
+            limit (int): The most rows to yield.
+            page_size (int): The rows fetched per round trip.
+
+        Yields:
+            dict: A row, keyed by the yielded column names.
+        """
+        order_by = ", ".join(f"$-.{column}" for column in ((cursor, ) if cursor else order))
+        sort = f" | ORDER BY {order_by}" if order_by else ""
+        offset = 0
+        last = None
+        while offset < limit:
+            size = min(page_size, limit - offset)
+            if cursor is None:
+                page = f"{query}{sort} | LIMIT {offset}, {size};"
+            elif last is None:
+                page = f"{query}{sort} | LIMIT {size};"
+            else:
+                page = f"{query} | WHERE $-.{cursor} > {last}{sort} | LIMIT {size};"
+            result = self._execute(page)
+            assert result.is_succeeded(), f"Failed to search: {result.error_msg()}\n query: {page}"
+            rows = result_rows(result)
+            yield from rows
+            if len(rows) < size:
+                return
+            offset += size
+            if cursor is not None:
+                last = rows[-1][cursor]
+
+    def _lookup_query(self, schema_name, search_params, fields, yields):
+        """
+        Build the LOOKUP answering a search on one tag or edge type.
 
-        # Update cache
-        if (
-            entity_type in self.graph["entities"]
-            and entity_id in self.graph["entities"][entity_type]
-        ):
-            del self.graph["entities"][entity_type][entity_id]
-        # Filter out relationships involving the deleted entity
-        self.graph["relationships"] = [
-            relationship
-            for relationship in self.graph["relationships"]
-            if relationship["from_id"] != entity_id
-            and relationship["to_id"] != entity_id
-        ]
+        With a full-text index the values are matched through ES_QUERY. Otherwise NEBULA_SEARCH_MATCH picks
+        either STARTS WITH conditions the index answers directly (the default), or the slow fallback: a scan
+        of the whole index filtered with a case-insensitive CONTAINS. ES_QUERY and CONTAINS return a superset
+        of the in-memory matches, and callers still filter the rows with matches().
 
-        return True
+        Returns:
+            str: The query, or None when no row of this tag or edge type can match.
+        """
+        values = {key: value for key, value in search_params.items() if str(value)}
+        if any(key not in fields for key in values):
+            # Only the indexed properties exist on Nebula tags and edges
+            return None
+
+        lookup = f"LOOKUP ON `{schema_name}`"
+        if not values:
+            return f"{lookup} YIELD {yields}"
+
+        fulltext_index = self.fulltext_indexes.get(schema_name)
+        query_string = es_query(values.values())
+        if fulltext_index and query_string:
+            return f"{lookup} WHERE ES_QUERY({fulltext_index}, {quote(query_string)}) YIELD {yields}"
+
+        if NEBULA_SEARCH_MATCH == "prefix":
+            conditions = " AND ".join(
+                f"`{schema_name}`.{key} STARTS WITH {quote(value)}" for key, value in values.items()
+            )
+            return f"{lookup} WHERE {conditions} YIELD {yields}"
 
+        conditions = " AND ".join(
+            f"toLower($-.{key}) CONTAINS {quote(str(value).lower())}" for key, value in values.items()
+        )
+        return f"{lookup} YIELD {yields} | WHERE {conditions}"
+
+    def _cached_search(self, key, search):
+        # Keys carry the version read before the query, so results computed across a concurrent write
+        # are stored under the old version and never served; entries of old versions age out of the LRU
+        key = (self.version, *key)
+        results = self.search_cache.get(key)
+        if results is None:
+            results = search()
+            self.search_cache.set(key, results)
+        return list(results)
+
+    @timed
     def search_entities(self, search_params):
-        # TODO: Implement search_entities on NebulaGraph side
-        self._get_cache_full_graph()
+        """
+        Search entities of every type, see search_entities_with_type.
+        """
         results = []
-        for entity_type, entities in self.graph["entities"].items():
-            for entity_id, entity_details in entities.items():
-                entity_info = entity_details.get("data", {})
-                # Convert values to strings for comparison
-                if all(
-                    str(value).lower() in str(entity_info.get(key, "")).lower()
-                    for key, value in search_params.items()
-                ):
-                    results.append(
-                        {"type": entity_type, "id": entity_id, **entity_info}
-                    )
-        return results
+        for entity_results in self._fan_out(
+            self.search_entities_with_type, ((entity_type, search_params) for entity_type in self.schema)
+        ):
+            results.extend(entity_results)
+        return results[:NEBULA_SEARCH_LIMIT]
+
+    @timed
+    def search_entities_with_type_batch(self, entity_type, search_params_list):
+        # Independent searches, sent in parallel over pooled sessions
+        return self._fan_out(
+            self.search_entities_with_type,
+            ((entity_type, search_params) for search_params in search_params_list),
+        )
 
+    @timed
     def search_entities_with_type(self, entity_type, search_params):
-        # TODO: Implement search_entities on NebulaGraph side
-        self._get_cache_full_graph()
+        """
+        Search entities of a type with a LOOKUP on the tag indexes.
+
+        Args:
+            entity_type (str): The type of entity.
+            search_params (dict): Property values to match, case-insensitive substrings.
+
+        Returns:
+            list: Matching entities, at most NEBULA_SEARCH_LIMIT.
+        """
+        key = ("entities", entity_type, tuple(sorted((k, str(v)) for k, v in search_params.items())))
+        return self._cached_search(key, lambda: self._search_entities_with_type(entity_type, search_params))
+
+    def _search_entities_with_type(self, entity_type, search_params):
+        yields = (
+            "id(vertex) AS id, properties(vertex).name AS name, "
+            "properties(vertex).description AS description"
+        )
+        query = self._lookup_query(entity_type, search_params, ENTITY_INDEX_FIELDS, yields)
+        if query is None:
+            return []
+
         results = []
-        for entity_id, entity_details in (
-            self.graph["entities"].get(entity_type, {}).items()
-        ):
-            entity_info = entity_details.get("data", {})
-            # Convert values to strings for comparison
-            if all(
-                str(value).lower() in str(entity_info.get(key, "")).lower()
-                for key, value in search_params.items()
-            ):
-                results.append({"type": entity_type, "id": entity_id, **entity_info})
+        for row in self._paged_rows(query, cursor="id"):
+            entity_info = {key: row[key] or "" for key in ENTITY_INDEX_FIELDS}
+            if matches(entity_info, search_params):
+                results.append({"type": entity_type, "id": row["id"], **entity_info})
+                self._cache_entity(entity_type, row["id"], entity_info)
         return results
 
+    @timed
     def search_relationships(self, search_params):
-        # TODO: Implement search_relationships on NebulaGraph side
-        self._get_cache_full_graph()
+        """
+        Search relationships.
+
+        With from_id or to_id the search walks that vertex's edges with GO. Otherwise every edge type is
+        looked up through its snippet index and the edges are expanded with GO for their endpoints.
+        IDs match exactly, everything else as case-insensitive substrings.
+
+        Args:
+            search_params (dict): Relationship values to match.
+
+        Returns:
+            list: Matching relationships, at most NEBULA_SEARCH_LIMIT.
+        """
+        key = ("relationships", tuple(sorted((k, str(v)) for k, v in search_params.items())))
+        return self._cached_search(key, lambda: self._search_relationships(search_params))
+
+    def _search_relationships(self, search_params):
+        queries = []
+        for key, reversely in (("from_id", ""), ("to_id", " REVERSELY")):
+            if key in search_params:
+                try:
+                    vertex_id = int(search_params[key])
+                except (TypeError, ValueError):
+                    return []
+                queries = [f"GO FROM {vertex_id} OVER *{reversely} YIELD DISTINCT {RELATIONSHIP_YIELD}"]
+                break
+        else:
+            relationship = str(search_params.get("relationship", "")).lower()
+            snippet_params = {key: value for key, value in search_params.items() if key == "snippet"}
+            for edge_type in self.edge_types:
+                if relationship not in edge_type.lower():
+                    continue
+                lookup = self._lookup_query(
+                    edge_type, snippet_params, RELATIONSHIP_INDEX_FIELDS,
+                    "src(edge) AS src, dst(edge) AS dst, properties(edge).snippet AS snippet",
+                )
+                queries.append(
+                    f"{lookup} | GO FROM $-.src OVER `{edge_type}` WHERE id($$) == $-.dst "
+                    f"YIELD DISTINCT {RELATIONSHIP_YIELD}"
+                )
+
         results = []
-        for relationship in self.graph["relationships"]:
-            # Convert values to strings for comparison
-            if all(
-                str(value).lower() in str(relationship.get(key, "")).lower()
-                for key, value in search_params.items()
-            ):
-                results.append(relationship)
-        return results
+        order = ("from_id", "to_id", "relationship")
+        for rows in self._fan_out(lambda query: list(self._paged_rows(query, order=order)),
+                                  ((query, ) for query in queries)):
+            for row in rows:
+                relationship = {key: "" if value is None else value for key, value in row.items()}
+                if all(
+                    str(relationship[key]) == str(search_params[key])
+                    for key in ("from_id", "to_id") if key in search_params
+                ) and matches(
+                    relationship,
+                    {k: v for k, v in search_params.items() if k not in ("from_id", "to_id")},
+                ):
+                    results.append(relationship)
+        return results[:NEBULA_SEARCH_LIMIT]
@@ -10,14 +10,21 @@
 # We are currently looking for design partners and investors! If interested please reach
 # out to us at info@nexusdb.io
 
+import atexit
 import json
 import os
+import threading
+import time
 from typeid import TypeID, get_prefix_and_suffix as typeid_prefix
 
 from nexus_python.nexusdb import NexusDB
 
+from app import models
+
 from .base import DatabaseIntegration
 from .memory import InMemoryDatabase
+from .snapshot_file import is_snapshot_file, read_snapshot, write_snapshot
+from .write_behind import WriteBehindQueue
 
 relation_prefix = os.environ.get("NEXUSDB_SCHEMA_PREFIX")
 if os.environ.get("NEXUSDB_USE_SHARED_GRAPH") == "True":
@@ -25,6 +32,49 @@ if os.environ.get("NEXUSDB_USE_SHARED_GRAPH") == "True":
 else:
   graph_relation = f"{relation_prefix}_Graph"
 
+# How the graph is loaded on startup:
+# - "background": serve the local snapshot right away and sync with NexusDB in a background thread
+# - "lazy": sync on the first read
+# - "eager": sync before the integration is returned
+NEXUSDB_LOAD_MODE = os.environ.get("NEXUSDB_LOAD_MODE", "background")
+# Local copy of the graph with its high-water mark, in the binary snapshot format (snapshot_file.py); restarts
+# only fetch newer rows ("" disables it). JSON snapshots of earlier versions are still read.
+NEXUSDB_SNAPSHOT_PATH = os.environ.get(
+    "NEXUSDB_SNAPSHOT_PATH", os.path.join(".cache", f"nexusdb_{graph_relation}.snapshot"))
+# Seconds between full syncs in the background, in every load mode. Incremental syncs only fetch rows with an
+# endpoint newer than the high-water mark, and the graph relation has no row ID or timestamp to key them on, so
+# relationships added between already known entities only arrive with a full sync (0: never)
+NEXUSDB_FULL_SYNC_SECONDS = int(os.environ.get("NEXUSDB_FULL_SYNC_SECONDS", 300))
+# Mutations are sent by a write-behind queue: flushed once NEXUSDB_WRITE_BATCH_SIZE are queued or
+# NEXUSDB_WRITE_FLUSH_SECONDS after the first one; NEXUSDB_WRITE_BEHIND=False sends them on the request path
+NEXUSDB_WRITE_BEHIND = os.environ.get("NEXUSDB_WRITE_BEHIND", "True") == "True"
+NEXUSDB_WRITE_BATCH_SIZE = int(os.environ.get("NEXUSDB_WRITE_BATCH_SIZE", 100))
+NEXUSDB_WRITE_FLUSH_SECONDS = float(os.environ.get("NEXUSDB_WRITE_FLUSH_SECONDS", 1.0))
+NEXUSDB_WRITE_RETRIES = int(os.environ.get("NEXUSDB_WRITE_RETRIES", 5))
+NEXUSDB_WRITE_BACKOFF_SECONDS = float(os.environ.get("NEXUSDB_WRITE_BACKOFF_SECONDS", 0.5))
+
+GRAPH_FIELDS = [
+    "relationship", "snippet", "sourceId", "sourceName", "targetId", "targetName"
+]
+# snippet isn't stored, the lookup computes it
+SNIPPET_CONDITION = "snippet=concat(sourceName, ' ', relationship, ' -> ', targetName)"
+# TypeID suffixes are time-ordered UUIDv7s in a fixed-length base32 encoding, so they sort by creation time
+TYPEID_SUFFIX_LENGTH = 26
+
+
+def typeid_suffix(id_str):
+  return id_str[-TYPEID_SUFFIX_LENGTH:]
+
+
+def relationship_key(relationship):
+  return (relationship["from_id"], str(relationship["relationship"]).strip(), relationship["to_id"])
+
+
+def newer_than_condition(high_water_mark):
+  suffix = "slice_string({field}, length({field}) - %d, length({field}))" % TYPEID_SUFFIX_LENGTH
+  return (f"{suffix.format(field='sourceId')} > '{high_water_mark}' || "
+          f"{suffix.format(field='targetId')} > '{high_water_mark}'")
+
 
 class NexusDBIntegration(InMemoryDatabase, DatabaseIntegration):
 
@@ -32,7 +82,39 @@ class NexusDBIntegration(InMemoryDatabase, DatabaseIntegration):
     self.nexus_db = NexusDB()  # Placeholder for NexusDB connection setup
     self.schema = self._load_schema(schema_file_path)
     self._ensure_db_schema()
-    self.graph = self._fetch_initial_graph()
+    self._ensure_graph_relation()
+
+    self.writes = WriteBehindQueue(self._send_write,
+                                   batch_size=NEXUSDB_WRITE_BATCH_SIZE,
+                                   flush_seconds=NEXUSDB_WRITE_FLUSH_SECONDS,
+                                   retries=NEXUSDB_WRITE_RETRIES,
+                                   backoff_seconds=NEXUSDB_WRITE_BACKOFF_SECONDS,
+                                   enabled=NEXUSDB_WRITE_BEHIND)
+    # Queued writes still go out when the process exits normally
+    atexit.register(self.writes.close)
+
+    self._sync_lock = threading.Lock()
+    # Taken by every change of the local graph, syncs included, so none of them is lost
+    self._write_lock = threading.RLock()
+    # Local writes the write-behind queue may not have sent yet, which syncs leave alone:
+    # ("entity", id) or ("relationship", from_id, relationship, to_id) -> sequence number in the queue
+    self._unsent = {}
+    # _loaded is set by the first successful sync, _attempted by the first sync either way;
+    # sync_error holds the error of the last failed one
+    self._loaded = threading.Event()
+    self._attempted = threading.Event()
+    self.sync_error = None
+    self._loader = None
+    self.high_water_mark = ""
+    self.graph = self._load_snapshot()
+
+    if NEXUSDB_LOAD_MODE == "eager":
+      self.sync()
+    if NEXUSDB_LOAD_MODE not in ("eager", "lazy") or NEXUSDB_FULL_SYNC_SECONDS > 0:
+      self._loader = threading.Thread(target=self._background_sync,
+                                      name="nexusdb-loader",
+                                      daemon=True)
+      self._loader.start()
 
   def _load_schema(self, schema_file_path):
     # Load and return the schema from the schema.json file
@@ -104,9 +186,10 @@ class NexusDBIntegration(InMemoryDatabase, DatabaseIntegration):
     print(f"Result of updating schema: {result}\n\n")
     return result
 
-  def _fetch_initial_graph(self):
-    # Placeholder method to fetch initial graph data from NexusDB
-    status = self.nexus_db.lookup(graph_relation, fields=None, condition="")
+  def _ensure_graph_relation(self):
+    status = self.nexus_db.lookup(graph_relation,
+                                  fields=["sourceId"],
+                                  condition="sourceId = ''")
 
     if status == "Error retrieving data from server":
       field_names = [
@@ -122,144 +205,291 @@ class NexusDBIntegration(InMemoryDatabase, DatabaseIntegration):
       create_relation = self.nexus_db.create(graph_relation, fields)
       print(f"Creating relation: {graph_relation} with fields: {fields}\n\n")
 
-    entities_data = self.nexus_db.join(
-        join_type="Outer",
-        relations=[
-            {
-                "relation_name": graph_relation,
-                "fields": ["sourceId", "sourceName"]
-            },
-            {
-                "relation_name": graph_relation,
-                "fields": ["targetId", "targetName"]
-            },
-        ],
-        return_fields=["id", "name"],
-    )
-
+  def _load_snapshot(self):
+    graph = {"entities": {}, "relationships": []}
+    if not NEXUSDB_SNAPSHOT_PATH or not os.path.exists(NEXUSDB_SNAPSHOT_PATH):
+      return graph
     try:
-      entities_data = json.loads(entities_data)
-
-      entities = {}
-
-      for row in entities_data["rows"]:
-        id_str = row[0]["Str"]
-        name = row[1]["Str"]
-
-        if "Err(" in name:
+      if is_snapshot_file(NEXUSDB_SNAPSHOT_PATH):
+        # Entities and relationships are decoded from the mapped file as they are read
+        snapshot, metadata = read_snapshot(NEXUSDB_SNAPSHOT_PATH)
+      else:
+        with open(NEXUSDB_SNAPSHOT_PATH, "r") as file:
+          metadata = snapshot = json.load(file)
+      if metadata.get("graph_relation") != graph_relation:
+        return graph
+      graph = {
+          "entities": snapshot["entities"],
+          "relationships": snapshot["relationships"],
+      }
+      self.high_water_mark = metadata.get("high_water_mark", "")
+      print(
+          f"Loaded NexusDB snapshot {NEXUSDB_SNAPSHOT_PATH}: "
+          f"{sum(len(e) for e in graph['entities'].values())} entities, "
+          f"{len(graph['relationships'])} relationships")
+    except Exception as e:
+      print(f"Error loading NexusDB snapshot: {e}")
+    return graph
+
+  def save_snapshot(self):
+    if not NEXUSDB_SNAPSHOT_PATH:
+      return
+    # write_snapshot writes and renames, so that a crash never leaves a truncated snapshot behind
+    write_snapshot(NEXUSDB_SNAPSHOT_PATH, self.graph, {
+        "graph_relation": graph_relation,
+        "high_water_mark": self.high_water_mark,
+    })
+
+  def _fetch_graph_rows(self, since=""):
+    # One row per relationship, with both endpoints, so entities and relationships come from a single lookup
+    condition = SNIPPET_CONDITION
+    if since:
+      condition = f"{condition}, {newer_than_condition(since)}"
+    response = self.nexus_db.lookup(graph_relation,
+                                    fields=GRAPH_FIELDS,
+                                    condition=condition)
+    return json.loads(response)["rows"]
+
+  def _parse_graph_rows(self, rows):
+    entities = {}
+    relationships = []
+    high_water_mark = self.high_water_mark
+
+    for row in rows:
+      relationship_type, snippet, source_id, source_name, target_id, target_name = (
+          cell.get("Str", "") if isinstance(cell, dict) else "" for cell in row)
+
+      for id_str, name in ((source_id, source_name), (target_id, target_name)):
+        if not id_str or "Err(" in name:
           continue
-
         # Determine the entity type from the ID using the typeid_prefix function
         raw_entity_type, _ = typeid_prefix(id_str)
         entity_type = raw_entity_type.title()
-
-        if entity_type not in entities:
-          entities[entity_type] = {}
-
-        cleaned_name = name.replace('"', "")
-
-        entities[entity_type][id_str] = {
+        entities.setdefault(entity_type, {})[id_str] = {
             "entity_type": entity_type,
             "data": {
                 "id": id_str,
-                "name": cleaned_name
+                "name": name.replace('"', "")
             },
         }
-    except Exception as e:
-      print(f"Error parsing entities data: {e}")
-      entities = {}
-
-    relationships_data = self.nexus_db.lookup(
-        graph_relation,
-        fields=["relationship", "snippet", "sourceId", "targetId"],
-        condition=
-        "snippet=concat(sourceName, ' ', relationship, ' -> ', targetName)",
-    )
+        high_water_mark = max(high_water_mark, typeid_suffix(id_str))
+
+      if "Err(" in snippet:
+        continue
+
+      relationships.append({
+          "relationship": relationship_type,
+          "snippet": snippet.replace('"', ""),
+          "from_id": source_id,
+          "to_id": target_id,
+          "from_type": typeid_prefix(source_id)[0],
+          "to_type": typeid_prefix(target_id)[0],
+          "relationship_type": relationship_type,
+      })
+
+    return entities, relationships, high_water_mark
+
+  def sync(self, full=False):
+    """
+    Fetch rows from the shared graph relation and merge them into the local graph.
+
+    Only rows with an endpoint newer than the high-water mark are fetched, unless full is set
+    or there is no high-water mark yet. A full fetch also removes what was deleted remotely.
+    The merged graph is saved as the local snapshot. A failed sync returns False and leaves
+    its error in sync_error.
+    """
+    with self._sync_lock:
+      started = time.perf_counter()
+      since = "" if full else self.high_water_mark
+      # Writes sent by now are in the rows fetched next
+      settled = self.writes.settled
+      try:
+        rows = self._fetch_graph_rows(since)
+        entities, relationships, high_water_mark = self._parse_graph_rows(rows)
+      except Exception as e:
+        print(f"Error syncing NexusDB graph: {e}")
+        self.sync_error = e
+        self._attempted.set()
+        return False
+
+      if self._merge(entities, relationships, full=not since, settled=settled):
+        models.graph_changed()
+      self.high_water_mark = high_water_mark
+      self.sync_error = None
+      self._loaded.set()
+      self._attempted.set()
+      print(
+          f"Synced {len(rows)} NexusDB rows ({'full' if not since else 'since ' + since}) "
+          f"in {time.perf_counter() - started:.2f}s")
 
     try:
-      relationships_data = json.loads(relationships_data)
-
-      relationships = []
-
-      for row in relationships_data["rows"]:
-        relationship_type = row[0]["Str"]
-        snippet = row[1]["Str"].replace('"', "")
-        source_id = row[2]["Str"]
-        target_id = row[3]["Str"]
-
-        if "Err(" in snippet:
-          continue
+      self.save_snapshot()
+    except Exception as e:
+      print(f"Error saving NexusDB snapshot: {e}")
+    return True
+
+  def _merge(self, entities, relationships, full=False, settled=0):
+    """
+    Merge fetched entities and relationships into the local graph, copy on write: readers iterating
+    the current dicts and list never see them change size.
+
+    Entity data is merged field by field, so fields the graph relation doesn't hold (description,
+    ...) are kept. With full, the rows are all of the remote graph, and local relationships missing
+    from it are removed, with the entities they connected that are missing too. Local writes the
+    write-behind queue hasn't sent as of settled are neither overwritten nor removed.
+
+    Returns:
+        bool: Whether the graph changed.
+    """
+    with self._write_lock:
+      for key, sequence in list(self._unsent.items()):
+        if sequence <= settled:
+          del self._unsent[key]
+      unsent_entities = {key[1] for key in self._unsent if key[0] == "entity"}
+      unsent_relationships = {key[1:] for key in self._unsent if key[0] == "relationship"}
+
+      def unsent(relationship):
+        return (relationship_key(relationship) in unsent_relationships
+                or relationship["from_id"] in unsent_entities
+                or relationship["to_id"] in unsent_entities)
+
+      merged_entities = dict(self.graph["entities"])
+      changed = False
+      for entity_type, records in entities.items():
+        current = merged_entities.get(entity_type, {})
+        updated = {}
+        for entity_id, record in records.items():
+          if entity_id in unsent_entities:
+            continue
+          old = current.get(entity_id)
+          new = record if old is None else {
+              **old, **record, "data": {**old.get("data", {}), **record["data"]}}
+          if new != old:
+            updated[entity_id] = new
+        if updated:
+          merged_entities[entity_type] = {**current, **updated}
+          changed = True
+
+      local_relationships = self.graph["relationships"]
+      kept = local_relationships
+      if full:
+        remote_keys = {relationship_key(r) for r in relationships}
+        kept = [r for r in local_relationships if relationship_key(r) in remote_keys or unsent(r)]
+        # Entities with no relationship aren't in the graph relation at all, so only those that
+        # had one can be told apart from deleted ones
+        remote_ids = {entity_id for records in entities.values() for entity_id in records}
+        connected = {r[end] for r in local_relationships for end in ("from_id", "to_id")}
+        for entity_type, current in list(merged_entities.items()):
+          gone = {entity_id for entity_id in current
+                  if entity_id in connected and entity_id not in remote_ids
+                  and entity_id not in unsent_entities}
+          if gone:
+            merged_entities[entity_type] = {
+                entity_id: record for entity_id, record in current.items() if entity_id not in gone}
+            changed = True
+
+      known = {relationship_key(r) for r in kept}
+      new_relationships = [
+          r for r in relationships
+          if relationship_key(r) not in known and not unsent(r)
+      ]
 
-        source_entity_type, _ = typeid_prefix(source_id)
-        target_entity_type, _ = typeid_prefix(target_id)
-
-        relationship_entry = {
-            "relationship": relationship_type,
-            "snippet": snippet,
-            "from_id": source_id,
-            "to_id": target_id,
-            "from_type": source_entity_type,
-            "to_type": target_entity_type,
-            "relationship_type": relationship_type,
-        }
-        relationships.append(relationship_entry)
-    except json.JSONDecodeError as e:
-      relationships = []
-
-    print(f"\n\nentities:\n{entities}\n\nrelationships:\n{relationships}\n\n")
-    return {
-        "entities": entities,
-        "relationships": relationships,
-    }
+      if changed:
+        self.graph["entities"] = merged_entities
+      if new_relationships or len(kept) != len(local_relationships):
+        self.graph["relationships"] = list(kept) + new_relationships
+        changed = True
+      if changed:
+        self._changed()
+      return changed
+
+  def _background_sync(self):
+    if NEXUSDB_LOAD_MODE not in ("eager", "lazy"):
+      self.sync()
+    while NEXUSDB_FULL_SYNC_SECONDS > 0:
+      time.sleep(NEXUSDB_FULL_SYNC_SECONDS)
+      self.sync(full=True)
+
+  def _ensure_loaded(self):
+    # Don't retry on every read when NexusDB is unreachable
+    if NEXUSDB_LOAD_MODE == "lazy" and not self._attempted.is_set():
+      self.sync()
+
+  def wait_until_loaded(self, timeout=None):
+    # Block until the first sync has been attempted (background mode), mostly for scripts and tests.
+    # False when it failed (see sync_error) or timed out.
+    self._ensure_loaded()
+    self._attempted.wait(timeout)
+    return self._loaded.is_set()
+
+  def get_full_graph(self):
+    self._ensure_loaded()
+    return super().get_full_graph()
+
+  def get_entity(self, entity_type, entity_id):
+    self._ensure_loaded()
+    return super().get_entity(entity_type, entity_id)
+
+  def get_all_entities(self, entity_type):
+    self._ensure_loaded()
+    return super().get_all_entities(entity_type)
+
+  def search_entities(self, search_params):
+    self._ensure_loaded()
+    return super().search_entities(search_params)
+
+  def search_entities_with_type(self, entity_type, search_params):
+    self._ensure_loaded()
+    return super().search_entities_with_type(entity_type, search_params)
+
+  def search_relationships(self, search_params):
+    self._ensure_loaded()
+    return super().search_relationships(search_params)
+
+  def _send_write(self, operation, relation, payload):
+    if operation == "delete":
+      return self.nexus_db.delete(relation, payload)
+    fields, values = payload
+    return getattr(self.nexus_db, operation)(relation, fields, values)
+
+  def write_stats(self):
+    # Queue depth, remote calls, retries, failures and latency of the write-behind queue
+    return self.writes.stats()
 
   def add_entity(self, entity_type, data):
     relation_name = entity_type.lower()
     type_id = TypeID(prefix=relation_name)
     entity_id = str(type_id)
     # Update in-memory graph
-    if entity_type not in self.graph["entities"]:
-      self.graph["entities"][entity_type] = {}
-    self.graph["entities"][entity_type][entity_id] = data
-    # Update NexusDB
+    # Queue the NexusDB insert; fields are sorted so that rows with the same keys share one call
     actual_data = data["data"]
     relation = f"{relation_prefix}_{entity_type}"
-
-    # Dynamically extract all fields and their values from actual_data
-    fields = ["id"] + list(actual_data.keys())
-    values = [[entity_id] +
-              [actual_data[field] for field in fields if field != "id"]]
-
-    print(f"name: {actual_data.get('name', '')}")
-    print(f"description: {actual_data.get('description', '')}")
-    print(f"actual_data: {actual_data}")
-
-    print(
-        f"\nInserting into NexusDB: {relation} with fields: {fields} and values: {values}\n\n"
-    )
-    self.nexus_db.insert(relation, fields, values)
+    fields = ["id"] + sorted(field for field in actual_data if field != "id")
+    with self._write_lock:
+      if entity_type not in self.graph["entities"]:
+        self.graph["entities"][entity_type] = {}
+      self.graph["entities"][entity_type][entity_id] = data
+      self._changed()
+      self._unsent[("entity", entity_id)] = self.writes.insert(
+          relation, fields, [entity_id] + [actual_data[field] for field in fields[1:]])
 
     return entity_id
 
   def update_entity(self, entity_type, entity_id, data):
-    entities = self.graph["entities"].get(entity_type)
-    if entities and entity_id in entities:
+    # Queue the NexusDB update
+    actual_data = data[
+        "data"]  # Assuming 'data' has a 'data' key with the actual update data
+    relation = f"{relation_prefix}_{entity_type}"
+    fields = ["id"] + sorted(field for field in actual_data if field != "id")
+    with self._write_lock:
+      entities = self.graph["entities"].get(entity_type)
+      if not entities or entity_id not in entities:
+        return False
       entities[entity_id].update(data)
-      # Update NexusDB
-      actual_data = data[
-          "data"]  # Assuming 'data' has a 'data' key with the actual update data
-      relation = f"{relation_prefix}_{entity_type}"
-
-      # Dynamically prepare fields and values for the update operation
-      fields = list(actual_data.keys())
-      values = [[actual_data[key] for key in fields]]
-
-      # Since it's an update, prepend 'id' to fields and the actual entity_id to each row of values
-      fields.insert(0, "id")
-      for row in values:
-        row.insert(0, entity_id)
-      self.nexus_db.update(relation, fields, values)
-      return True
-    return False
+      self._changed()
+      self._unsent[("entity", entity_id)] = self.writes.update(
+          relation, fields, [entity_id] + [actual_data[field] for field in fields[1:]])
+    return True
 
   def add_relationship(self, data):
     print(f"Adding relationship: {data}")
@@ -274,34 +504,31 @@ class NexusDBIntegration(InMemoryDatabase, DatabaseIntegration):
           "sourceName",
           "targetName",
       ]
-      values = [[
+      values = [
           relationship,
           data["from_id"],
           data["to_id"],
           data["from_entity"],
           data["to_entity"],
-      ]]
-
-      # Update NexusDB
-      print("\n\n values: ", values, "\n\n")
-      print(
-          f"Inserting into NexusDB: relation={graph_relation}, fields={fields}, values={values}"
-      )
-      self.nexus_db.upsert(graph_relation, fields, values)
-
+      ]
     except Exception as e:
       print(f"Error adding relationship: {e}")
       return False
 
-    # Update in-memory graph
-    self.graph["relationships"].append(data)
-
-    return len(self.graph["relationships"])
+    # Update in-memory graph and queue the NexusDB upsert
+    with self._write_lock:
+      key = ("relationship", data["from_id"], relationship, data["to_id"])
+      self._unsent[key] = self.writes.upsert(graph_relation, fields, values)
+      self.graph["relationships"].append(data)
+      self._changed()
+      return len(self.graph["relationships"])
 
   def delete_entity(self, entity_type, entity_id):
-    entities = self.graph["entities"].get(entity_type)
+    with self._write_lock:
+      entities = self.graph["entities"].get(entity_type)
+      if not entities or entity_id not in entities:
+        return False
 
-    if entities and entity_id in entities:
       # Delete the entity from the entities dictionary
       del entities[entity_id]
 
@@ -311,23 +538,12 @@ class NexusDBIntegration(InMemoryDatabase, DatabaseIntegration):
           if relationship["from_id"] != entity_id
           and relationship["to_id"] != entity_id
       ]
+      self._changed()
 
-      # Update NexusDB
+      # Queue the NexusDB deletes: one for the entity row and one for its relationships,
+      # coalesced with other deletes on the same relation when the queue flushes
       relation = f"{relation_prefix}_{entity_type.title()}"
-      print(f"Deleting from NexusDB: {relation} where id = {entity_id}")
-
-      relation_delete_condition = f"id = '{entity_id}'"
-      relation_response = self.nexus_db.delete(relation,
-                                               relation_delete_condition)
-
-      target_condition = f"targetId = '{entity_id}'"
-      target_response = self.nexus_db.delete(graph_relation, target_condition)
-
-      source_condition = f"sourceId = '{entity_id}'"
-      source_response = self.nexus_db.delete(graph_relation, source_condition)
-
-      print(f"relation_response: {relation_response}")
-      print(f"target_response: {target_response}")
-      print(f"source_response: {source_response}")
-      return True
-    return False
+      self.writes.delete(relation, f"id = '{entity_id}'")
+      self._unsent[("entity", entity_id)] = self.writes.delete(
+          graph_relation, f"sourceId = '{entity_id}' || targetId = '{entity_id}'")
+    return True
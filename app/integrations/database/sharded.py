@@ -0,0 +1,366 @@
+# A graph partitioned across local worker processes, for searches that scale with cores.
+#
+# ShardedDatabaseIntegration starts SHARD_COUNT processes, each owning a ShardStore (an InMemoryDatabase), and
+# places every entity on the shard murmur64(str(id)) % SHARD_COUNT picks. IDs are allocated by the coordinating
+# process, so they stay globally unique.
+# - a relationship is stored on the shards of both its endpoints; the from_id shard holds the primary copy, which
+#   is the one searches and get_full_graph return
+# - reads of a single entity go to its shard; searches, get_all_entities and get_full_graph are sent to every
+#   shard at once (scatter) and the partial results are merged in ID order (gather)
+# - get_neighbors walks relationships hop by hop, asking only the shards that own the current frontier
+# - deleting an entity also drops its relationships' copies on the other endpoints' shards
+#
+# Every shard is reached through its own pipe, so calls to different shards run in parallel in the workers
+# while the coordinator waits.
+import atexit
+import multiprocessing
+import os
+import threading
+from collections import defaultdict
+
+from .base import DatabaseIntegration
+from .memory import InMemoryDatabase
+from .murmur import murmur64
+
+SHARD_COUNT = int(os.environ.get("SHARD_COUNT", os.cpu_count() or 1))
+# "spawn" keeps the workers free of the web server's threads and sockets; "fork" starts faster
+SHARD_START_METHOD = os.environ.get("SHARD_START_METHOD", "spawn")
+
+
+def shard_of(entity_id, shard_count):
+    # Hashing the string form puts an ID on the same shard whether the route passes it as int or str
+    return murmur64(str(entity_id)) % shard_count
+
+
+class ShardStore(InMemoryDatabase):
+    # One shard's part of the graph, living in a worker process
+
+    def __init__(self):
+        # Shards never warm-start from MEMORY_SNAPSHOT_PATH: each would load the whole graph
+        super().__init__(snapshot_path="")
+        self.relationships = {}  # relationship ID -> (data, primary)
+        self.adjacency = defaultdict(set)  # str(entity ID) -> relationship IDs
+
+    def put_entity(self, entity_type, entity_id, data):
+        self.graph["entities"].setdefault(entity_type, {})[entity_id] = data
+
+    def put_entities(self, entity_type, items):
+        self.graph["entities"].setdefault(entity_type, {}).update(items)
+
+    def remove_entity(self, entity_type, entity_id):
+        # Returns the other endpoints of the entity's relationships, whose shards hold copies of them
+        entities = self.graph["entities"].get(entity_type)
+        if not entities or entity_id not in entities:
+            return None
+        del entities[entity_id]
+        endpoints = set()
+        for relationship_id in self.adjacency.pop(str(entity_id), set()):
+            data, _ = self.relationships.pop(relationship_id)
+            endpoints.update((str(data.get("from_id")), str(data.get("to_id"))))
+            self._unlink(relationship_id, data)
+        endpoints.discard(str(entity_id))
+        return sorted(endpoints)
+
+    def drop_relationships(self, entity_id):
+        for relationship_id in self.adjacency.pop(str(entity_id), set()):
+            data, _ = self.relationships.pop(relationship_id)
+            self._unlink(relationship_id, data)
+
+    def _unlink(self, relationship_id, data):
+        for endpoint in (str(data.get("from_id")), str(data.get("to_id"))):
+            if endpoint in self.adjacency:
+                self.adjacency[endpoint].discard(relationship_id)
+
+    def put_relationship(self, relationship_id, data, primary):
+        self.relationships[relationship_id] = (data, primary)
+        self.adjacency[str(data.get("from_id"))].add(relationship_id)
+        self.adjacency[str(data.get("to_id"))].add(relationship_id)
+
+    def put_relationships(self, items):
+        for relationship_id, data, primary in items:
+            self.put_relationship(relationship_id, data, primary)
+
+    def primary_relationships(self, search_params):
+        return [
+            (relationship_id, data)
+            for relationship_id, (data, primary) in self.relationships.items()
+            if primary and all(
+                str(value).lower() in str(data.get(key, "")).lower() for key, value in search_params.items())
+        ]
+
+    def full_graph(self):
+        return self.graph["entities"], self.primary_relationships({})
+
+    def neighbors(self, entity_ids):
+        # Relationships touching any of entity_ids, with the IDs at their other ends
+        found = {}
+        for entity_id in entity_ids:
+            for relationship_id in self.adjacency.get(str(entity_id), ()):
+                found[relationship_id] = self.relationships[relationship_id][0]
+        return found
+
+    def entities_by_id(self, entity_ids):
+        wanted = set(entity_ids)
+        return {
+            entity_type: {entity_id: data for entity_id, data in entities.items() if str(entity_id) in wanted}
+            for entity_type, entities in self.graph["entities"].items()
+        }
+
+    def stats(self):
+        return {
+            "entities": sum(len(entities) for entities in self.graph["entities"].values()),
+            "relationships": len(self.relationships),
+        }
+
+
+def serve_shard(connection):
+    # Worker loop: run (method, args) against the shard's store and send back ("ok", result) or ("error", e)
+    store = ShardStore()
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        method, args = message
+        try:
+            connection.send(("ok", getattr(store, method)(*args)))
+        except Exception as e:
+            connection.send(("error", e))
+
+
+class Shard:
+
+    def __init__(self, context, index):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=serve_shard, args=(child, ), name=f"graph-shard-{index}",
+                                       daemon=True)
+        self.process.start()
+        child.close()
+        self.lock = threading.Lock()
+
+    def send(self, method, *args):
+        self.connection.send((method, args))
+
+    def receive(self):
+        status, result = self.connection.recv()
+        if status == "error":
+            raise result
+        return result
+
+    def call(self, method, *args):
+        with self.lock:
+            self.send(method, *args)
+            return self.receive()
+
+    def close(self):
+        with self.lock:
+            try:
+                self.connection.send(None)
+            except OSError:
+                pass
+        self.process.join(timeout=5)
+        self.connection.close()
+
+
+class ShardedDatabaseIntegration(DatabaseIntegration):
+
+    def __init__(self, shard_count=SHARD_COUNT, start_method=SHARD_START_METHOD):
+        context = multiprocessing.get_context(start_method)
+        self.shards = [Shard(context, index) for index in range(max(1, shard_count))]
+        self._id_lock = threading.Lock()
+        self.next_id = 1
+        self.next_relationship_id = 1
+        atexit.register(self.close)
+        print(f"Started {len(self.shards)} graph shards")
+
+    def _shard(self, entity_id):
+        return self.shards[shard_of(entity_id, len(self.shards))]
+
+    def _scatter(self, calls):
+        # calls: {shard index: (method, args)}. Every shard is sent its call before any result is read, so the
+        # shards work in parallel. Locks are taken in shard order, which keeps concurrent scatters deadlock free.
+        indexes = sorted(calls)
+        for index in indexes:
+            self.shards[index].lock.acquire()
+        try:
+            for index in indexes:
+                method, args = calls[index]
+                self.shards[index].send(method, *args)
+            results, error = {}, None
+            for index in indexes:
+                # Read every reply, even after a failure, so no pipe is left with an unread result
+                try:
+                    results[index] = self.shards[index].receive()
+                except Exception as e:
+                    error = error or e
+            if error:
+                raise error
+            return results
+        finally:
+            for index in indexes:
+                self.shards[index].lock.release()
+
+    def _broadcast(self, method, *args):
+        return list(self._scatter({index: (method, args) for index in range(len(self.shards))}).values())
+
+    def _group(self, entity_ids):
+        groups = defaultdict(list)
+        for entity_id in entity_ids:
+            groups[shard_of(entity_id, len(self.shards))].append(entity_id)
+        return groups
+
+    def add_entity(self, entity_type, data):
+        with self._id_lock:
+            entity_id = self.next_id
+            self.next_id += 1
+        self._shard(entity_id).call("put_entity", entity_type, entity_id, data)
+        print(f"Added {entity_type} with ID: {entity_id}")
+        return entity_id
+
+    def add_entities(self, entity_type, data_list):
+        # One message per shard for the whole list
+        with self._id_lock:
+            entity_ids = list(range(self.next_id, self.next_id + len(data_list)))
+            self.next_id += len(data_list)
+        items = defaultdict(list)
+        for entity_id, data in zip(entity_ids, data_list):
+            items[shard_of(entity_id, len(self.shards))].append((entity_id, data))
+        self._scatter({index: ("put_entities", (entity_type, shard_items)) for index, shard_items in items.items()})
+        return entity_ids
+
+    def get_full_graph(self):
+        entities = defaultdict(dict)
+        relationships = []
+        for shard_entities, shard_relationships in self._broadcast("full_graph"):
+            for entity_type, by_id in shard_entities.items():
+                entities[entity_type].update(by_id)
+            relationships.extend(shard_relationships)
+        return {
+            "entities": {
+                entity_type: dict(sorted(by_id.items()))
+                for entity_type, by_id in entities.items()
+            },
+            "relationships": [data for _, data in sorted(relationships, key=lambda item: item[0])],
+        }
+
+    def get_entity(self, entity_type, entity_id):
+        return self._shard(entity_id).call("get_entity", entity_type, entity_id)
+
+    def get_all_entities(self, entity_type):
+        merged = {}
+        for entities in self._broadcast("get_all_entities", entity_type):
+            merged.update(entities)
+        return dict(sorted(merged.items()))
+
+    def update_entity(self, entity_type, entity_id, data):
+        return self._shard(entity_id).call("update_entity", entity_type, entity_id, data)
+
+    def delete_entity(self, entity_type, entity_id):
+        # The DELETE route passes the ID through as a string
+        if isinstance(entity_id, str) and entity_id.isdigit():
+            entity_id = int(entity_id)
+        endpoints = self._shard(entity_id).call("remove_entity", entity_type, entity_id)
+        if endpoints is None:
+            return False
+        calls = {index: ("drop_relationships", (entity_id, )) for index in self._group(endpoints)}
+        calls.pop(shard_of(entity_id, len(self.shards)), None)
+        if calls:
+            self._scatter(calls)
+        return True
+
+    def add_relationship(self, data):
+        with self._id_lock:
+            relationship_id = self.next_relationship_id
+            self.next_relationship_id += 1
+        primary = shard_of(data.get("from_id"), len(self.shards))
+        secondary = shard_of(data.get("to_id"), len(self.shards))
+        calls = {primary: ("put_relationship", (relationship_id, data, True))}
+        if secondary != primary:
+            calls[secondary] = ("put_relationship", (relationship_id, data, False))
+        self._scatter(calls)
+        return relationship_id
+
+    def add_relationships(self, data_list):
+        with self._id_lock:
+            relationship_ids = list(range(self.next_relationship_id, self.next_relationship_id + len(data_list)))
+            self.next_relationship_id += len(data_list)
+        items = defaultdict(list)
+        for relationship_id, data in zip(relationship_ids, data_list):
+            primary = shard_of(data.get("from_id"), len(self.shards))
+            secondary = shard_of(data.get("to_id"), len(self.shards))
+            items[primary].append((relationship_id, data, True))
+            if secondary != primary:
+                items[secondary].append((relationship_id, data, False))
+        self._scatter({index: ("put_relationships", (shard_items, )) for index, shard_items in items.items()})
+        return relationship_ids
+
+    def search_entities(self, search_params):
+        results = [result for results in self._broadcast("search_entities", search_params) for result in results]
+        return sorted(results, key=lambda result: result["id"])
+
+    def search_entities_with_type(self, entity_type, search_params):
+        results = [
+            result for results in self._broadcast("search_entities_with_type", entity_type, search_params)
+            for result in results
+        ]
+        return sorted(results, key=lambda result: result["id"])
+
+    def search_entities_with_type_batch(self, entity_type, search_params_list):
+        # One message per shard carries every search
+        merged = [[] for _ in search_params_list]
+        for shard_results in self._broadcast("search_entities_with_type_batch", entity_type, search_params_list):
+            for results, partial in zip(merged, shard_results):
+                results.extend(partial)
+        return [sorted(results, key=lambda result: result["id"]) for results in merged]
+
+    def search_relationships(self, search_params):
+        relationships = [
+            relationship for relationships in self._broadcast("primary_relationships", search_params)
+            for relationship in relationships
+        ]
+        return [data for _, data in sorted(relationships, key=lambda item: item[0])]
+
+    def get_neighbors(self, entity_id, depth=1):
+        """
+        The subgraph within depth hops of an entity, in the get_full_graph format.
+
+        Every hop asks only the shards that own the current frontier for the relationships touching it.
+        """
+        seen = {str(entity_id)}
+        frontier = [entity_id]
+        relationships = {}
+        for _ in range(depth):
+            calls = {index: ("neighbors", (ids, )) for index, ids in self._group(frontier).items()}
+            found = {}
+            for partial in self._scatter(calls).values():
+                found.update(partial)
+            relationships.update(found)
+
+            frontier = []
+            for data in found.values():
+                for endpoint in (data.get("from_id"), data.get("to_id")):
+                    if str(endpoint) not in seen:
+                        seen.add(str(endpoint))
+                        frontier.append(endpoint)
+            if not frontier:
+                break
+
+        entities = defaultdict(dict)
+        calls = {index: ("entities_by_id", (ids, )) for index, ids in self._group(seen).items()}
+        for partial in self._scatter(calls).values():
+            for entity_type, by_id in partial.items():
+                entities[entity_type].update(by_id)
+        return {
+            "entities": {entity_type: by_id for entity_type, by_id in entities.items() if by_id},
+            "relationships": [data for _, data in sorted(relationships.items())],
+        }
+
+    def shard_stats(self):
+        return self._broadcast("stats")
+
+    def close(self):
+        for shard in self.shards:
+            if shard.process.is_alive():
+                shard.close()
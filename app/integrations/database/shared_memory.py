@@ -0,0 +1,450 @@
+# A graph store in a shared memory-mapped region, for prefork deployments (e.g. gunicorn workers).
+#
+# Every worker process maps the same files (by default under /dev/shm), so all workers serve one consistent graph
+# from one copy in RAM, and reads run in parallel on all cores instead of each worker holding its own
+# InMemoryDatabase. The region is an append-only log of records:
+# - <path>: a 64-byte header, then the records. Each record is 8-byte aligned and holds its kind, ID, the
+#   generations it was created and deleted in, the offset of the version it replaced, the entity type, the JSON
+#   payload and the lowercased values searches run against
+# - <path>.offsets: the start offset of every record, in append order
+# - <path>.index: the offset of every entity's latest version, by entity ID
+#
+# Single writer, many readers:
+# - writers take an exclusive flock on <path>.lock, so one process writes at a time. New records are written past
+#   the committed end, the versions they replace are stamped with the new generation, and only then is the header
+#   (generation, end, record count) published under a seqlock. A write that fails before it is published has its
+#   stamps and index entries restored, so the next write, which reuses the generation, doesn't apply them
+# - readers take a header snapshot without locking and only see records created at or before its generation and
+#   not deleted by it, so they never observe a half-applied write
+#
+# Searches run mmap.find over the shared pages, which scans them in C, map every hit to its record through the
+# offsets file and only decode those candidates. Nothing but the results is copied into the worker.
+#
+# Updates and deletes leave the old versions in the log; stats() reports live and dead records. Entity IDs come
+# from the header, so they are unique across workers. The files outlive the processes: delete them to start over.
+import bisect
+import fcntl
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from collections import namedtuple
+
+from .base import DatabaseIntegration
+
+SHARED_MEMORY_PATH = os.environ.get(
+    "SHARED_MEMORY_PATH",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "mindgraph.graph"))
+# Initial size of the record region; the files double whenever they fill up
+SHARED_MEMORY_INITIAL_BYTES = int(os.environ.get("SHARED_MEMORY_INITIAL_BYTES", 16 * 1024 * 1024))
+
+MAGIC = b"MGSHM001"
+# magic, seqlock sequence, generation, committed end, record count, next entity ID, relationship count
+HEADER = struct.Struct("<8sQQQQQQ")
+HEADER_SIZE = 64
+SEQUENCE_OFFSET = 8
+# length, kind, ID, created generation, deleted generation, previous version offset,
+# type length, payload length, search text length
+RECORD = struct.Struct("<IIqQQqIII4x")
+DELETED_OFFSET = 24
+OFFSET = struct.Struct("<q")
+
+ENTITY = 1
+RELATIONSHIP = 2
+# Joins the searchable values, so a hit can't span two of them
+SEPARATOR = "\x00"
+
+Snapshot = namedtuple("Snapshot", "generation end count next_id relationships")
+Record = namedtuple("Record", "offset length kind id created deleted previous type_length payload_length search_length")
+
+
+def search_text(values):
+    return SEPARATOR.join(str(value).lower() for value in values)
+
+
+def matches(info, search_params):
+    # The same case-insensitive substring match as InMemoryDatabase
+    return all(str(value).lower() in str(info.get(key, "")).lower() for key, value in search_params.items())
+
+
+def normalize_id(entity_id):
+    # The DELETE route passes the ID through as a string
+    if isinstance(entity_id, str) and entity_id.isdigit():
+        return int(entity_id)
+    return entity_id if isinstance(entity_id, int) else None
+
+
+class Region:
+    # A file-backed shared mapping. Only the writer grows the file; readers remap when it outgrew their mapping.
+
+    def __init__(self, path, initial_size):
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self.fd).st_size < initial_size:
+            os.ftruncate(self.fd, initial_size)
+        self._remap()
+
+    def _remap(self):
+        self.map = mmap.mmap(self.fd, os.fstat(self.fd).st_size)
+        self.words = memoryview(self.map).cast("q")
+
+    def cover(self, size):
+        if size > len(self.map):
+            self._remap()
+        return self.map
+
+    def reserve(self, size):
+        # Writer only
+        if size > len(self.map):
+            current = os.fstat(self.fd).st_size
+            if size > current:
+                new_size = current
+                while new_size < size:
+                    new_size *= 2
+                os.ftruncate(self.fd, new_size)
+            self._remap()
+        return self.map
+
+    def close(self):
+        self.words.release()
+        self.map.close()
+        os.close(self.fd)
+
+
+class SharedMemoryDatabase(DatabaseIntegration):
+
+    def __init__(self, path=SHARED_MEMORY_PATH, initial_bytes=SHARED_MEMORY_INITIAL_BYTES):
+        self.path = path
+        self._open_lock()
+        with self._locked():
+            self.data = Region(path, max(initial_bytes, HEADER_SIZE))
+            self.offsets = Region(f"{path}.offsets", max(initial_bytes // 16, mmap.PAGESIZE))
+            self.index = Region(f"{path}.index", max(initial_bytes // 16, mmap.PAGESIZE))
+            if self.data.map[:len(MAGIC)] != MAGIC:
+                HEADER.pack_into(self.data.map, 0, MAGIC, 0, 0, HEADER_SIZE, 0, 1, 0)
+        print(f"Shared memory graph at {path}: {self._snapshot().count} records")
+
+    # Locking
+
+    def _open_lock(self):
+        self._pid = os.getpid()
+        self._lock_fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        self._thread_lock = threading.Lock()
+
+    def _locked(self):
+        # A forked worker shares its parent's lock file description, which flock wouldn't tell apart
+        if os.getpid() != self._pid:
+            self._open_lock()
+        return FileLock(self._thread_lock, self._lock_fd)
+
+    # Reading
+
+    def _snapshot(self):
+        data = self.data.map
+        while True:
+            _, sequence, *fields = HEADER.unpack_from(data, 0)
+            if sequence & 1:
+                continue
+            if struct.unpack_from("<Q", data, SEQUENCE_OFFSET)[0] == sequence:
+                snapshot = Snapshot(*fields)
+                self.data.cover(snapshot.end)
+                self.offsets.cover(snapshot.count * OFFSET.size)
+                return snapshot
+
+    def _record(self, offset):
+        return Record(offset, *RECORD.unpack_from(self.data.map, offset))
+
+    def _entity_type(self, record):
+        start = record.offset + RECORD.size
+        return self.data.map[start:start + record.type_length].decode("utf8")
+
+    def _payload(self, record):
+        start = record.offset + RECORD.size + record.type_length
+        return json.loads(self.data.map[start:start + record.payload_length])
+
+    def _visible(self, record, snapshot):
+        return record.created <= snapshot.generation and (
+            record.deleted == 0 or record.deleted > snapshot.generation)
+
+    def _all_records(self, snapshot, kind):
+        offsets = self.offsets.words
+        for index in range(snapshot.count):
+            record = self._record(offsets[index])
+            if record.kind == kind and self._visible(record, snapshot):
+                yield record
+
+    def _candidates(self, snapshot, kind, search_params):
+        # Records whose search text contains the longest needle; everything when there is none
+        needle = max((str(value).lower() for value in search_params.values()), key=len, default="")
+        if not needle:
+            yield from self._all_records(snapshot, kind)
+            return
+
+        needle = needle.encode("utf8")
+        data = self.data.map
+        offsets = self.offsets.words
+        position = data.find(needle, HEADER_SIZE, snapshot.end)
+        while position != -1:
+            record = self._record(offsets[bisect.bisect_right(offsets, position, 0, snapshot.count) - 1])
+            search_start = record.offset + RECORD.size + record.type_length + record.payload_length
+            if position < search_start:
+                # A hit in the type or payload, look on from this record's search text
+                position = data.find(needle, search_start, snapshot.end)
+                continue
+            if position + len(needle) <= search_start + record.search_length:
+                if record.kind == kind and self._visible(record, snapshot):
+                    yield record
+                position = data.find(needle, record.offset + record.length, snapshot.end)
+            else:
+                position = data.find(needle, position + 1, snapshot.end)
+
+    def _latest(self, entity_id, snapshot):
+        # The version of an entity visible in the snapshot, following replaced versions back
+        if entity_id is None or entity_id < 0:
+            return None
+        index = self.index.cover((entity_id + 1) * OFFSET.size)
+        if (entity_id + 1) * OFFSET.size > len(index):
+            return None
+        offset = OFFSET.unpack_from(index, entity_id * OFFSET.size)[0]
+        while offset:
+            self.data.cover(offset + RECORD.size)
+            record = self._record(offset)
+            if record.created <= snapshot.generation:
+                return record if self._visible(record, snapshot) else None
+            offset = record.previous
+        return None
+
+    def data_version(self):
+        # Every published write, from any process, advances the generation
+        return self._snapshot().generation
+
+    def get_full_graph(self):
+        snapshot = self._snapshot()
+        entities = {}
+        for record in self._all_records(snapshot, ENTITY):
+            entities.setdefault(self._entity_type(record), {})[record.id] = self._payload(record)
+        relationships = [self._payload(record) for record in self._all_records(snapshot, RELATIONSHIP)]
+        return {"entities": entities, "relationships": relationships}
+
+    def get_entity(self, entity_type, entity_id):
+        record = self._latest(normalize_id(entity_id), self._snapshot())
+        if record and self._entity_type(record) == entity_type:
+            return self._payload(record)
+        return None
+
+    def get_all_entities(self, entity_type):
+        return {
+            record.id: self._payload(record)
+            for record in self._all_records(self._snapshot(), ENTITY)
+            if self._entity_type(record) == entity_type
+        }
+
+    def search_entities(self, search_params):
+        results = []
+        for record in self._candidates(self._snapshot(), ENTITY, search_params):
+            entity_info = self._payload(record).get("data", {})
+            if matches(entity_info, search_params):
+                results.append({"type": self._entity_type(record), "id": record.id, **entity_info})
+        return results
+
+    def search_entities_with_type(self, entity_type, search_params):
+        results = []
+        for record in self._candidates(self._snapshot(), ENTITY, search_params):
+            if self._entity_type(record) != entity_type:
+                continue
+            entity_info = self._payload(record).get("data", {})
+            if matches(entity_info, search_params):
+                results.append({"type": entity_type, "id": record.id, **entity_info})
+        return results
+
+    def search_relationships(self, search_params):
+        results = []
+        for record in self._candidates(self._snapshot(), RELATIONSHIP, search_params):
+            relationship = self._payload(record)
+            if matches(relationship, search_params):
+                results.append(relationship)
+        return results
+
+    # Writing
+
+    def _append(self, state, kind, record_id, entity_type, payload, values, previous=0):
+        type_bytes = entity_type.encode("utf8")
+        payload_bytes = json.dumps(payload, ensure_ascii=False).encode("utf8")
+        search_bytes = search_text(values).encode("utf8")
+        size = RECORD.size + len(type_bytes) + len(payload_bytes) + len(search_bytes)
+        length = (size + 7) & ~7
+
+        offset = state["end"]
+        data = self.data.reserve(offset + length)
+        RECORD.pack_into(data, offset, length, kind, record_id, state["generation"], 0, previous,
+                         len(type_bytes), len(payload_bytes), len(search_bytes))
+        data[offset + RECORD.size:offset + size] = type_bytes + payload_bytes + search_bytes
+
+        offsets = self.offsets.reserve((state["count"] + 1) * OFFSET.size)
+        OFFSET.pack_into(offsets, state["count"] * OFFSET.size, offset)
+        state["end"] += length
+        state["count"] += 1
+        return offset
+
+    def _stamp(self, state, region, fmt, position, value):
+        # Writes a word in place, remembering the old one so _write can restore it
+        state["undo"].append((region, fmt, position, struct.unpack_from(fmt, region.map, position)[0]))
+        struct.pack_into(fmt, region.map, position, value)
+
+    def _delete_record(self, state, record):
+        # Readers of older generations still see it
+        self._stamp(state, self.data, "<Q", record.offset + DELETED_OFFSET, state["generation"])
+
+    def _set_index(self, state, entity_id, offset):
+        self.index.reserve((entity_id + 1) * OFFSET.size)
+        self._stamp(state, self.index, "<q", entity_id * OFFSET.size, offset)
+
+    def _publish(self, state):
+        data = self.data.map
+        sequence = struct.unpack_from("<Q", data, SEQUENCE_OFFSET)[0]
+        struct.pack_into("<Q", data, SEQUENCE_OFFSET, sequence + 1)
+        HEADER.pack_into(data, 0, MAGIC, sequence + 1, state["generation"], state["end"], state["count"],
+                         state["next_id"], state["relationships"])
+        struct.pack_into("<Q", data, SEQUENCE_OFFSET, sequence + 2)
+
+    def _write(self, apply):
+        # Runs apply(state, snapshot) as the single writer; a truthy result publishes its changes
+        with self._locked():
+            snapshot = self._snapshot()
+            state = snapshot._asdict()
+            state["generation"] += 1
+            state["undo"] = []
+            try:
+                result = apply(state, snapshot)
+            except BaseException:
+                # Nothing was published; appended records lie past the committed end and are overwritten later
+                for region, fmt, position, value in reversed(state["undo"]):
+                    struct.pack_into(fmt, region.map, position, value)
+                raise
+            if result:
+                self._publish(state)
+            return result
+
+    def add_entity(self, entity_type, data):
+
+        def apply(state, snapshot):
+            entity_id = state["next_id"]
+            state["next_id"] += 1
+            offset = self._append(state, ENTITY, entity_id, entity_type, data, data.get("data", {}).values())
+            self._set_index(state, entity_id, offset)
+            return entity_id
+
+        entity_id = self._write(apply)
+        print(f"Added {entity_type} with ID: {entity_id}")
+        return entity_id
+
+    def add_entities(self, entity_type, data_list):
+        # All of them in one write, published once
+
+        def apply(state, snapshot):
+            entity_ids = []
+            for data in data_list:
+                entity_id = state["next_id"]
+                state["next_id"] += 1
+                offset = self._append(state, ENTITY, entity_id, entity_type, data, data.get("data", {}).values())
+                self._set_index(state, entity_id, offset)
+                entity_ids.append(entity_id)
+            return entity_ids
+
+        return self._write(apply) if data_list else []
+
+    def update_entity(self, entity_type, entity_id, data):
+        entity_id = normalize_id(entity_id)
+
+        def apply(state, snapshot):
+            record = self._latest(entity_id, snapshot)
+            if not record or self._entity_type(record) != entity_type:
+                return False
+            entity = self._payload(record)
+            entity.update(data)
+            # The new version first, so a failing append leaves the old one untouched
+            offset = self._append(state, ENTITY, entity_id, entity_type, entity, entity.get("data", {}).values(),
+                                  previous=record.offset)
+            self._set_index(state, entity_id, offset)
+            self._delete_record(state, record)
+            return True
+
+        return self._write(apply)
+
+    def delete_entity(self, entity_type, entity_id):
+        entity_id = normalize_id(entity_id)
+
+        def apply(state, snapshot):
+            record = self._latest(entity_id, snapshot)
+            if not record or self._entity_type(record) != entity_type:
+                return False
+            # Relationships involving the deleted entity go with it; the entity is stamped last
+            for relationship in self._all_records(snapshot, RELATIONSHIP):
+                payload = self._payload(relationship)
+                if payload.get("from_id") == entity_id or payload.get("to_id") == entity_id:
+                    self._delete_record(state, relationship)
+            self._delete_record(state, record)
+            return True
+
+        return self._write(apply)
+
+    def add_relationship(self, data):
+
+        def apply(state, snapshot):
+            state["relationships"] += 1
+            self._append(state, RELATIONSHIP, state["relationships"], "", data, data.values())
+            return state["relationships"]
+
+        return self._write(apply)
+
+    def add_relationships(self, data_list):
+
+        def apply(state, snapshot):
+            relationship_ids = []
+            for data in data_list:
+                state["relationships"] += 1
+                self._append(state, RELATIONSHIP, state["relationships"], "", data, data.values())
+                relationship_ids.append(state["relationships"])
+            return relationship_ids
+
+        return self._write(apply) if data_list else []
+
+    def stats(self):
+        snapshot = self._snapshot()
+        live = dead = 0
+        offsets = self.offsets.words
+        for index in range(snapshot.count):
+            if self._visible(self._record(offsets[index]), snapshot):
+                live += 1
+            else:
+                dead += 1
+        return {
+            "generation": snapshot.generation,
+            "records": snapshot.count,
+            "live_records": live,
+            "dead_records": dead,
+            "bytes_used": snapshot.end,
+            "bytes_mapped": len(self.data.map),
+        }
+
+    def close(self):
+        for region in (self.data, self.offsets, self.index):
+            region.close()
+        os.close(self._lock_fd)
+
+
+class FileLock:
+    # The thread lock orders writers within a process, the flock across processes
+
+    def __init__(self, thread_lock, fd):
+        self.thread_lock = thread_lock
+        self.fd = fd
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.thread_lock.release()
@@ -0,0 +1,490 @@
+# A compact, versioned binary file format for graph snapshots, read through mmap.
+#
+# A snapshot holds a graph in the shape get_full_graph returns ({"entities": {type: {id: record}},
+# "relationships": [record]}) plus a JSON metadata dict for the integration that wrote it. Layout:
+#   header     "MGSNAPSH", format version (u32), reserved (u32), directory offset and length (u64 each)
+#   sections   8-byte aligned little-endian arrays, referenced from the directory
+#   directory  JSON: the metadata, the string table and one block per entity type plus one for the relationships
+#
+# Strings are interned in a single string table (u64 offsets into a UTF-8 blob), so repeated values such as
+# relationship labels and entity types are stored once. Records are stored by column: every block lists the keys its
+# records use, each key a column of the block's length with a kind picked from its values:
+#   int (i8), float (f8), bool (u1), str (u4 string index) and json (u4 index of the JSON text) for anything else
+# plus a u1 presence mask when some records lack the key. Entity blocks are laid out per type, with the keys of the
+# entities' "data" dicts and their other keys as separate columns, and an ID column.
+#
+# SnapshotFile.graph() returns lazy containers over the mapped file: entity dicts and relationships are
+# materialized on first access and kept, so loading costs the same for any graph size and only what is read is
+# decoded. The containers are mutable; changes stay in memory until the snapshot is written again.
+import json
+import mmap
+import os
+import struct
+import threading
+from collections.abc import MutableMapping, MutableSequence
+from operator import itemgetter
+
+import numpy as np
+
+MAGIC = b"MGSNAPSH"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIIQQ")
+ALIGNMENT = 8
+
+INT64_MIN, INT64_MAX = -(2**63), 2**63 - 1
+KIND_DTYPES = {"int": "<i8", "float": "<f8", "bool": "u1", "str": "<u4", "json": "<u4"}
+_MISSING = object()
+
+
+def is_snapshot_file(path):
+    try:
+        with open(path, "rb") as file:
+            return file.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+PYTHON_KINDS = {bool: "bool", int: "int", float: "float", str: "str"}
+
+
+def _kind(values):
+    # One kind for all values, json when they mix types
+    types = set(map(type, values))
+    if len(types) != 1:
+        return "json"
+    kind = PYTHON_KINDS.get(types.pop(), "json")
+    if kind == "int" and not INT64_MIN <= min(values) <= max(values) <= INT64_MAX:
+        return "json"
+    return kind
+
+
+class _Writer:
+
+    def __init__(self, file):
+        self.file = file
+        self.strings = {}
+        self.file.write(b"\0" * HEADER.size)
+
+    def intern(self, values):
+        # String table indices of values
+        strings = self.strings
+        return [strings.setdefault(value, len(strings)) for value in values]
+
+    def section(self, array):
+        padding = -self.file.tell() % ALIGNMENT
+        self.file.write(b"\0" * padding)
+        offset = self.file.tell()
+        self.file.write(array.tobytes())
+        return {"offset": offset, "dtype": array.dtype.str, "length": len(array)}
+
+    def column(self, name, values, count, rows=None, scope="top"):
+        # values of the rows that have the key; rows is None when all of them do
+        kind = _kind(values)
+        if kind == "str":
+            encoded = self.intern(values)
+        elif kind == "json":
+            encoded = self.intern([json.dumps(value, default=str) for value in values])
+        else:
+            encoded = values
+        array = np.zeros(count, dtype=KIND_DTYPES[kind])
+        present = None
+        if rows is None:
+            array[:] = encoded
+        else:
+            array[rows] = encoded
+            mask = np.zeros(count, dtype=np.uint8)
+            mask[rows] = 1
+            present = self.section(mask)
+        return {"name": name, "scope": scope, "kind": kind, "values": self.section(array), "present": present}
+
+    def columns(self, dicts, scope):
+        # One column per key, in the order the keys first appear
+        layouts = {tuple(record) for record in dicts}
+        keys = list(dict.fromkeys(key for layout in layouts for key in layout))
+        count = len(dicts)
+        columns = []
+        for key in keys:
+            if len(layouts) == 1:
+                rows, values = None, list(map(itemgetter(key), dicts))
+            else:
+                rows = [row for row, record in enumerate(dicts) if key in record]
+                values = [dicts[row][key] for row in rows]
+                if len(rows) == count:
+                    rows = None
+            columns.append(self.column(str(key), values, count, rows, scope))
+        return columns
+
+    def entity_block(self, entity_type, entities):
+        ids, data, top, has_data = [], [], [], []
+        for entity_id, record in entities.items():
+            ids.append(entity_id)
+            record = record if isinstance(record, dict) else {"value": record}
+            nested = isinstance(record.get("data"), dict)
+            has_data.append(nested)
+            data.append(record["data"] if nested else {})
+            top.append({key: value for key, value in record.items() if not (nested and key == "data")})
+        return {
+            "name": entity_type,
+            "count": len(ids),
+            "ids": self.column("id", ids, len(ids)),
+            "has_data": self.section(np.array(has_data, dtype=np.uint8)),
+            "columns": self.columns(data, "data") + self.columns(top, "top"),
+        }
+
+    def finish(self, directory):
+        strings = [value.encode("utf8") for value in self.strings]
+        offsets = np.zeros(len(strings) + 1, dtype="<u8")
+        np.cumsum([len(value) for value in strings], out=offsets[1:])
+        directory["strings"] = {
+            "offsets": self.section(offsets),
+            "blob": self.section(np.frombuffer(b"".join(strings), dtype=np.uint8)),
+        }
+        encoded = json.dumps(directory).encode("utf8")
+        offset = self.file.tell()
+        self.file.write(encoded)
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, offset, len(encoded)))
+
+
+def write_snapshot(path, graph, metadata=None):
+    """
+    Write a graph to path in the snapshot format.
+
+    The file is written next to path and renamed over it, so readers never see a partial snapshot.
+
+    Args:
+        graph (dict): The graph, as returned by get_full_graph.
+        metadata (dict): JSON-serializable data stored with the graph.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as file:
+        writer = _Writer(file)
+        relationships = list(graph.get("relationships", []))
+        writer.finish({
+            "metadata": metadata or {},
+            "entity_types": [
+                writer.entity_block(entity_type, entities)
+                for entity_type, entities in graph.get("entities", {}).items()
+            ],
+            "relationships": {
+                "count": len(relationships),
+                "columns": writer.columns(relationships, "top"),
+            },
+        })
+    os.replace(temp_path, path)
+
+
+class _Column:
+
+    def __init__(self, snapshot, spec):
+        self.snapshot = snapshot
+        self.name = spec["name"]
+        self.scope = spec["scope"]
+        self.kind = spec["kind"]
+        self.values = snapshot.array(spec["values"])
+        self.present = snapshot.array(spec["present"]) if spec["present"] else None
+
+    def get(self, row):
+        value = self.values[row].item()
+        if self.kind == "str":
+            return self.snapshot.string(value)
+        if self.kind == "json":
+            return json.loads(self.snapshot.string(value))
+        if self.kind == "bool":
+            return bool(value)
+        return value
+
+    def all(self):
+        # Every row's value, decoded in bulk; _MISSING for rows without the key
+        values = self.values.tolist()
+        present = self.present.tolist() if self.present is not None else None
+        if self.kind in ("str", "json"):
+            strings = self.snapshot.strings()
+            decode = json.loads if self.kind == "json" else None
+            if present is None:
+                values = [strings[index] for index in values]
+                if decode:
+                    values = [decode(value) for value in values]
+                return values
+            return [
+                (decode(strings[index]) if decode else strings[index]) if has else _MISSING
+                for index, has in zip(values, present)
+            ]
+        if self.kind == "bool":
+            values = [bool(value) for value in values]
+        if present is not None:
+            values = [value if has else _MISSING for value, has in zip(values, present)]
+        return values
+
+
+class _Block:
+    # The records of one entity type, or the relationships
+
+    def __init__(self, snapshot, spec):
+        self.count = spec["count"]
+        columns = [_Column(snapshot, column) for column in spec["columns"]]
+        self.data_columns = [column for column in columns if column.scope == "data"]
+        self.top_columns = [column for column in columns if column.scope == "top"]
+        self.ids = _Column(snapshot, spec["ids"]) if "ids" in spec else None
+        self.has_data = snapshot.array(spec["has_data"]) if "has_data" in spec else None
+
+    @staticmethod
+    def _fields(columns, row):
+        return {
+            column.name: column.get(row)
+            for column in columns if column.present is None or column.present[row]
+        }
+
+    def record(self, row):
+        record = self._fields(self.top_columns, row)
+        if self.has_data is not None and self.has_data[row]:
+            record["data"] = self._fields(self.data_columns, row)
+        return record
+
+    @staticmethod
+    def _all_fields(columns, count):
+        if not columns:
+            return [{} for _ in range(count)]
+        names = [column.name for column in columns]
+        rows = zip(*(column.all() for column in columns))
+        if all(column.present is None for column in columns):
+            return [dict(zip(names, row)) for row in rows]
+        return [
+            {name: value for name, value in zip(names, row) if value is not _MISSING}
+            for row in rows
+        ]
+
+    def records(self):
+        # Every record, decoded column by column
+        records = self._all_fields(self.top_columns, self.count)
+        if self.has_data is not None:
+            data = self._all_fields(self.data_columns, self.count)
+            for record, fields, has_data in zip(records, data, self.has_data.tolist()):
+                if has_data:
+                    record["data"] = fields
+        return records
+
+
+class LazyEntities(MutableMapping):
+    """
+    The entities of one type, ID -> record.
+
+    Single records are decoded on first access and kept. Iterating over the records decodes all of them at once,
+    after which this is a plain dict in all but type. Decoding and writes take a lock, since request threads may
+    write while another one decodes.
+    """
+
+    def __init__(self, block):
+        self._block = block
+        self._rows = None  # ID -> row in the block, -1 for entities added since loading
+        self._records = {}
+        self._complete = False
+        self._lock = threading.RLock()
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            with self._lock:
+                if self._rows is None:
+                    self._rows = dict(zip(self._block.ids.all(), range(self._block.count)))
+        return self._rows
+
+    def materialize(self):
+        if not self._complete:
+            with self._lock:
+                if not self._complete:
+                    decoded = self._block.records()
+                    records = self._records
+                    self._records = {
+                        entity_id: records[entity_id] if entity_id in records else decoded[row]
+                        for entity_id, row in list(self.rows.items())
+                    }
+                    self._complete = True
+        return self._records
+
+    def __getitem__(self, entity_id):
+        record = self._records.get(entity_id, _MISSING)
+        if record is _MISSING:
+            with self._lock:
+                record = self._records.get(entity_id, _MISSING)
+                if record is _MISSING:
+                    if self._complete:
+                        raise KeyError(entity_id)
+                    record = self._records[entity_id] = self._block.record(self.rows[entity_id])
+        return record
+
+    def __setitem__(self, entity_id, record):
+        with self._lock:
+            self.rows.setdefault(entity_id, -1)
+            self._records[entity_id] = record
+
+    def __delitem__(self, entity_id):
+        with self._lock:
+            del self.rows[entity_id]
+            self._records.pop(entity_id, None)
+
+    def __contains__(self, entity_id):
+        return entity_id in self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return self._block.count if self._rows is None else len(self._rows)
+
+    def items(self):
+        return self.materialize().items()
+
+    def values(self):
+        return self.materialize().values()
+
+    def max_int_id(self):
+        # The largest integer ID, without building the ID index
+        ids = self._block.ids
+        if ids.kind == "int" and self._rows is None and self._block.count:
+            return int(ids.values.max())
+        return max((entity_id for entity_id in self if isinstance(entity_id, int)), default=0)
+
+
+class LazyRelationships(MutableSequence):
+    # The relationship records: single records are decoded on first access, iterating or changing them decodes all
+    # of them into a list, once, under a lock
+
+    def __init__(self, block):
+        self._block = block
+        self._records = {}
+        self._list = None
+        self._lock = threading.Lock()
+
+    def materialize(self):
+        if self._list is None:
+            with self._lock:
+                if self._list is None:
+                    decoded = self._block.records()
+                    for index, record in list(self._records.items()):
+                        decoded[index] = record
+                    self._list = decoded
+        return self._list
+
+    def __getitem__(self, index):
+        if self._list is not None:
+            return self._list[index]
+        if isinstance(index, slice):
+            return [self[row] for row in range(*index.indices(self._block.count))]
+        if index < 0:
+            index += self._block.count
+        if not 0 <= index < self._block.count:
+            raise IndexError("relationship index out of range")
+        record = self._records.get(index)
+        if record is None:
+            record = self._records[index] = self._block.record(index)
+        return record
+
+    def __setitem__(self, index, record):
+        self.materialize()[index] = record
+
+    def __delitem__(self, index):
+        del self.materialize()[index]
+
+    def __iter__(self):
+        return iter(self.materialize())
+
+    def __len__(self):
+        return self._block.count if self._list is None else len(self._list)
+
+    def insert(self, index, record):
+        self.materialize().insert(index, record)
+
+    def append(self, record):
+        self.materialize().append(record)
+
+    def extend(self, records):
+        self.materialize().extend(records)
+
+
+class SnapshotFile:
+    """
+    A snapshot file mapped into memory.
+
+    Opening one only reads the header and the directory; arrays are views of the mapping and records are decoded
+    on access. The mapping stays open while any container returned by graph() is in use.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < HEADER.size:
+            raise ValueError(f"{path} is not a graph snapshot")
+        magic, version, _, offset, length = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a graph snapshot")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} is a version {version} snapshot, this reader supports version {FORMAT_VERSION}")
+        self.directory = json.loads(self._mmap[offset:offset + length])
+        self.metadata = self.directory["metadata"]
+
+        strings = self.directory["strings"]
+        self._string_offsets = self.array(strings["offsets"])
+        self._blob = self.array(strings["blob"])
+        self._string_cache = {}
+        self._strings = None
+
+    def array(self, section):
+        return np.frombuffer(self._mmap, dtype=section["dtype"], count=section["length"], offset=section["offset"])
+
+    def string(self, index):
+        value = self._string_cache.get(index)
+        if value is None:
+            start, end = self._string_offsets[index:index + 2].tolist()
+            value = self._blob[start:end].tobytes().decode("utf8")
+            if end - start <= 64:
+                # Short strings are the repeated ones: types, labels, keys
+                self._string_cache[index] = value
+        return value
+
+    def strings(self):
+        # The whole string table, decoded once for bulk reads
+        if self._strings is None:
+            blob = self._blob.tobytes()
+            offsets = self._string_offsets.tolist()
+            self._strings = [blob[start:end].decode("utf8") for start, end in zip(offsets, offsets[1:])]
+        return self._strings
+
+    @property
+    def entity_types(self):
+        return [block["name"] for block in self.directory["entity_types"]]
+
+    @property
+    def entity_count(self):
+        return sum(block["count"] for block in self.directory["entity_types"])
+
+    @property
+    def relationship_count(self):
+        return self.directory["relationships"]["count"]
+
+    def graph(self):
+        return {
+            "entities": {
+                block["name"]: LazyEntities(_Block(self, block)) for block in self.directory["entity_types"]
+            },
+            "relationships": LazyRelationships(_Block(self, self.directory["relationships"])),
+        }
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "bytes": len(self._mmap),
+            "entities": self.entity_count,
+            "relationships": self.relationship_count,
+            "strings": len(self._string_offsets) - 1,
+        }
+
+
+def read_snapshot(path):
+    # The lazy graph and the metadata of a snapshot file
+    snapshot = SnapshotFile(path)
+    return snapshot.graph(), snapshot.metadata
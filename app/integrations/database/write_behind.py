@@ -0,0 +1,199 @@
+# A write-behind buffer for remote mutations.
+#
+# Mutations are queued instead of being sent on the request path. A background thread flushes the queue when it
+# holds batch_size mutations or flush_seconds after the first one was queued, coalescing them into one remote
+# call per relation, operation and field set:
+# - insert / upsert / update rows with the same fields are sent as a single multi-row call
+# - delete conditions on the same relation are OR-ed into a single call
+#
+# Within a relation, a flush runs inserts, then upserts, then updates, then deletes, so a row written and deleted
+# in the same window ends up deleted. Failed calls are retried with exponential backoff; a call that still fails
+# is dropped and counted. stats() reports queue depth, call counts, retries, failures and flush latency.
+#
+# Every mutation gets a sequence number, returned when it is queued; settled is the highest number up to which
+# every mutation has been sent (or dropped), so callers can tell whether a write has reached the remote yet.
+import threading
+import time
+from collections import OrderedDict
+
+from .metrics import LatencyRecorder
+
+OPERATION_ORDER = ["insert", "upsert", "update", "delete"]
+
+
+def is_error_response(response):
+    # The NexusDB client returns the response text; failures are reported as "Error..." strings
+    return response is None or str(response).lstrip().lower().startswith("error")
+
+
+class WriteBehindQueue:
+    def __init__(self, send, batch_size=100, flush_seconds=1.0, retries=3, backoff_seconds=0.5, enabled=True):
+        """
+        Args:
+            send (callable): send(operation, relation, payload) performs one remote call and returns its
+                response. payload is (fields, rows) for insert/upsert/update and a condition for delete.
+            batch_size (int): Queued mutations that trigger a flush.
+            flush_seconds (float): The longest a mutation waits in the queue.
+            retries (int): Attempts per remote call.
+            backoff_seconds (float): Delay before the first retry, doubled on every further retry.
+            enabled (bool): When False every mutation is sent right away, on the caller's thread.
+        """
+        self.send = send
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.enabled = enabled
+
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._pending = OrderedDict()  # (relation, operation, fields) -> rows or conditions
+        self._pending_count = 0
+        self._first_queued_at = None
+        self._closed = False
+        self.settled = 0
+
+        self.latency = LatencyRecorder()
+        self.counters = {
+            "queued": 0,
+            "flushes": 0,
+            "remote_calls": 0,
+            "rows_sent": 0,
+            "retries": 0,
+            "failed_calls": 0,
+            "dropped_rows": 0,
+        }
+
+        self._thread = None
+        if self.enabled:
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def insert(self, relation, fields, row):
+        return self._queue(relation, "insert", fields, row)
+
+    def upsert(self, relation, fields, row):
+        return self._queue(relation, "upsert", fields, row)
+
+    def update(self, relation, fields, row):
+        return self._queue(relation, "update", fields, row)
+
+    def delete(self, relation, condition):
+        return self._queue(relation, "delete", None, condition)
+
+    def _queue(self, relation, operation, fields, item):
+        # Returns the mutation's sequence number, see settled
+        key = (relation, operation, tuple(fields) if fields is not None else None)
+        with self._condition:
+            self._pending.setdefault(key, []).append(item)
+            self._pending_count += 1
+            self.counters["queued"] += 1
+            sequence = self.counters["queued"]
+            if self._first_queued_at is None:
+                self._first_queued_at = time.monotonic()
+            if self._pending_count >= self.batch_size:
+                self._condition.notify()
+        if not self.enabled:
+            self.flush()
+        return sequence
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    if self._pending_count >= self.batch_size:
+                        break
+                    if self._first_queued_at is not None:
+                        remaining = self._first_queued_at + self.flush_seconds - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def _take(self):
+        # The queued mutations, and the sequence number of the last of them
+        with self._condition:
+            pending = self._pending
+            self._pending = OrderedDict()
+            self._pending_count = 0
+            self._first_queued_at = None
+            through = self.counters["queued"]
+        return pending, through
+
+    def flush(self):
+        """
+        Send everything queued so far, blocking until done.
+
+        Returns:
+            int: The number of remote calls that failed after all retries.
+        """
+        with self._flush_lock:
+            pending, through = self._take()
+            if not pending:
+                self.settled = through
+                return 0
+
+            started = time.perf_counter()
+            failures = 0
+            relations = list(OrderedDict.fromkeys(relation for relation, _, _ in pending))
+            for relation in relations:
+                for operation in OPERATION_ORDER:
+                    for (key_relation, key_operation, fields), items in pending.items():
+                        if key_relation != relation or key_operation != operation:
+                            continue
+                        if operation == "delete":
+                            payload = " || ".join(f"({condition})" for condition in dict.fromkeys(items))
+                        else:
+                            payload = (list(fields), items)
+                        if not self._send_with_retries(operation, relation, payload, len(items)):
+                            failures += 1
+
+            self.counters["flushes"] += 1
+            self.settled = through
+            self.latency.record("flush", time.perf_counter() - started)
+            return failures
+
+    def _send_with_retries(self, operation, relation, payload, row_count):
+        for attempt in range(self.retries):
+            started = time.perf_counter()
+            try:
+                response = self.send(operation, relation, payload)
+                error = response if is_error_response(response) else None
+            except Exception as e:
+                error = e
+            self.latency.record(operation, time.perf_counter() - started)
+            self.counters["remote_calls"] += 1
+
+            if error is None:
+                self.counters["rows_sent"] += row_count
+                return True
+            if attempt < self.retries - 1:
+                self.counters["retries"] += 1
+                time.sleep(self.backoff_seconds * 2**attempt)
+
+        self.counters["failed_calls"] += 1
+        self.counters["dropped_rows"] += row_count
+        print(f"Dropping {operation} of {row_count} rows on {relation} after {self.retries} attempts: {error}")
+        return False
+
+    def close(self):
+        # Flush what is left and stop the background thread
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            self.flush()
+
+    def stats(self):
+        return {
+            "pending": self._pending_count,
+            **self.counters,
+            "latency": self.latency.stats(),
+        }
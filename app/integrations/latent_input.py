@@ -1,7 +1,10 @@
+import os
 import openai
 from flask import jsonify
 from app.integration_manager import get_integration_function
 
+openai.api_base = os.environ.get('OPENAI_BASE_URL', openai.api_base)
+
 
 def latent_input(app, data):
     with app.app_context():
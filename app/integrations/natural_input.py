@@ -56,12 +56,13 @@
 # into structured data through automated knowledge graph generation and the conditional addition of this data into the application's
 # operational context, leveraging the `add_multiple_conditional_function` for dynamic data integration based on AI-generated content.
 
-from flask import Flask, request, jsonify
+import os
+from flask import request, jsonify
 import openai
 import json
 from app.integration_manager import get_integration_function
 
-app = Flask(__name__)
+openai.api_base = os.environ.get('OPENAI_BASE_URL', openai.api_base)
 
 
 def create_knowledge_graph(app, natural_input):
@@ -1,10 +1,9 @@
-from flask import jsonify, Flask
+from flask import jsonify
 import requests
 from bs4 import BeautifulSoup
 from app.integration_manager import get_integration_function 
 from urllib.parse import unquote
 
-app = Flask(__name__)
 
 def url_input(app, data):
     with app.app_context():
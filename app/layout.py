@@ -0,0 +1,262 @@
+# Force-directed layout of the graph, computed on the server so the visualization can place nodes as given
+# (Cytoscape's preset layout) instead of running cose in the browser.
+#
+# force_layout is Fruchterman-Reingold with NumPy: every step, edges pull their endpoints together (d^2 / k) and
+# all nodes push each other apart (k^2 / d), and nodes move along the sum, at most the current temperature, which
+# cools every step. Repulsion is exact (pairwise, in chunks) up to LAYOUT_EXACT_NODES nodes. Above that it is
+# approximated on a grid: node counts are binned onto LAYOUT_GRID x LAYOUT_GRID cells and convolved with the
+# repulsion kernel by FFT, so a step costs O(nodes + edges + cells log cells) instead of O(nodes^2).
+#
+# get_graph_layout() caches the positions per graph version. A new version starts from the previous positions:
+# nodes that were already placed stay where they were and only new ones are laid out, next to their placed
+# neighbors, so the picture is stable between refreshes. Once more than LAYOUT_RELAYOUT_RATIO of the nodes are new,
+# the whole graph is laid out again, starting from the known positions.
+#
+# With LAYOUT_BACKGROUND_REFRESH, writes queue a new layout on the async signal bus once a layout has been asked
+# for, and readers that pass wait=False, such as /get-graph-data, get the previous version meanwhile instead of
+# waiting for the snapshot and the layout to be computed.
+import os
+import threading
+
+import numpy as np
+
+from . import models
+from .signals import connect_async, entity_created, entity_deleted
+
+LAYOUT_ITERATIONS = int(os.environ.get("LAYOUT_ITERATIONS", 100))
+LAYOUT_INCREMENTAL_ITERATIONS = int(os.environ.get("LAYOUT_INCREMENTAL_ITERATIONS", 40))
+LAYOUT_EXACT_NODES = int(os.environ.get("LAYOUT_EXACT_NODES", 500))
+LAYOUT_GRID = int(os.environ.get("LAYOUT_GRID", 256))
+LAYOUT_GRAVITY = float(os.environ.get("LAYOUT_GRAVITY", 0.5))
+LAYOUT_RELAYOUT_RATIO = float(os.environ.get("LAYOUT_RELAYOUT_RATIO", 0.5))
+# Pixels between neighboring nodes in the returned positions
+LAYOUT_SPACING = float(os.environ.get("LAYOUT_SPACING", 120))
+LAYOUT_BACKGROUND_REFRESH = os.environ.get("LAYOUT_BACKGROUND_REFRESH", "True") == "True"
+# Rows of the pairwise distance matrix computed at once by the exact repulsion
+CHUNK_ROWS = 512
+
+
+def exact_repulsion(positions, movable, k):
+  # Sum of k^2 / d along the unit vectors from every node, for the movable nodes
+  forces = np.zeros((len(movable), 2))
+  x, y = positions[:, 0], positions[:, 1]
+  for start in range(0, len(movable), CHUNK_ROWS):
+    rows = movable[start:start + CHUNK_ROWS]
+    dx = x[rows, None] - x[None, :]
+    dy = y[rows, None] - y[None, :]
+    scale = dx * dx + dy * dy
+    np.maximum(scale, 1e-4 * k * k, out=scale)
+    np.divide(k * k, scale, out=scale)
+    scale[np.arange(len(rows)), rows] = 0  # no force on itself
+    forces[start:start + len(rows), 0] = np.einsum("ij,ij->i", dx, scale)
+    forces[start:start + len(rows), 1] = np.einsum("ij,ij->i", dy, scale)
+  return forces
+
+
+def grid_repulsion(positions, movable, k, grid=LAYOUT_GRID):
+  # exact_repulsion approximated on a grid: bin the nodes, convolve the counts with the force kernel by FFT and
+  # read the force at every movable node's cell
+  low = positions.min(axis=0) - k
+  cell = max((positions.max(axis=0) + k - low).max() / grid, 1e-9)
+  cells = np.clip(((positions - low) / cell).astype(np.int64), 0, grid - 1)
+  counts = np.bincount(cells[:, 0] * grid + cells[:, 1], minlength=grid * grid).reshape(grid, grid)
+
+  # The kernel covers every offset between two cells; a grid of twice the size keeps the convolution linear
+  size = 2 * grid
+  offsets = np.fft.fftfreq(size, 1.0 / size) * cell
+  dx, dy = np.meshgrid(offsets, offsets, indexing="ij")
+  distance2 = dx * dx + dy * dy
+  distance2[0, 0] = np.inf
+  np.maximum(distance2, cell * cell / 4, out=distance2)
+  counts_spectrum = np.fft.rfft2(counts, s=(size, size))
+  field_x = np.fft.irfft2(counts_spectrum * np.fft.rfft2(k * k * dx / distance2), s=(size, size))
+  field_y = np.fft.irfft2(counts_spectrum * np.fft.rfft2(k * k * dy / distance2), s=(size, size))
+
+  x, y = cells[movable, 0], cells[movable, 1]
+  forces = np.stack([field_x[x, y], field_y[x, y]], axis=1)
+
+  # Nodes sharing a cell don't see each other in the field: push them away from the other nodes of their cell,
+  # taken as one mass at the cell's center
+  flat = cells[:, 0] * grid + cells[:, 1]
+  counts = counts.ravel()
+  others = counts[flat[movable]] - 1
+  crowded = others > 0
+  if crowded.any():
+    rows = movable[crowded]
+    center = np.stack([np.bincount(flat, weights=positions[:, axis], minlength=grid * grid) for axis in range(2)], 1)
+    # The center of the other nodes of the cell
+    center = (center[flat[rows]] - positions[rows]) / others[crowded, None]
+    delta = positions[rows] - center
+    distance2 = np.maximum(np.einsum("ij,ij->i", delta, delta), 1e-4 * k * k)
+    forces[crowded] += k * k * delta * (others[crowded] / distance2)[:, None]
+  return forces
+
+
+def attraction(positions, sources, targets, k):
+  # d^2 / k along every edge, added to the source and subtracted from the target
+  delta = positions[targets] - positions[sources]
+  pull = delta * (np.sqrt(np.einsum("ij,ij->i", delta, delta)) / k)[:, None]
+  count = len(positions)
+  forces = np.empty((count, 2))
+  for axis in range(2):
+    forces[:, axis] = (np.bincount(sources, weights=pull[:, axis], minlength=count)
+                       - np.bincount(targets, weights=pull[:, axis], minlength=count))
+  return forces
+
+
+def force_layout(sources, targets, positions, movable=None, iterations=LAYOUT_ITERATIONS,
+                 exact_nodes=LAYOUT_EXACT_NODES, grid=LAYOUT_GRID, gravity=LAYOUT_GRAVITY):
+  """
+  Move nodes to where the forces between them balance.
+
+  Args:
+      sources, targets (np.ndarray): The edges, as node indices.
+      positions (np.ndarray): Starting positions, one (x, y) row per node, in units of the ideal edge length.
+      movable (np.ndarray): Indices of the nodes that may move, all of them if None.
+
+  Returns:
+      np.ndarray: The new positions.
+  """
+  positions = np.array(positions, dtype=np.float64)
+  count = len(positions)
+  movable = np.arange(count) if movable is None else np.asarray(movable)
+  if not count or not len(movable):
+    return positions
+  k = 1.0
+  # A grid a few cells per node of width, as the nodes spread out over about sqrt(count) ideal edge lengths
+  grid = int(min(grid, max(32, 2 ** np.ceil(np.log2(2 * np.sqrt(count))))))
+  repulsion = exact_repulsion if count <= exact_nodes else (
+      lambda p, m, k: grid_repulsion(p, m, k, grid))
+  # Starts at a tenth of the layout's width and cools linearly
+  temperature = max(np.sqrt(count) * k / 10, k)
+  cooling = temperature / (iterations + 1)
+
+  for _ in range(iterations):
+    forces = repulsion(positions, movable, k) + attraction(positions, sources, targets, k)[movable]
+    # A pull to the center keeps disconnected components from drifting apart and the layout about sqrt(count) wide
+    forces -= gravity * positions[movable]
+    length = np.sqrt(np.einsum("ij,ij->i", forces, forces))
+    step = np.minimum(length, temperature) / np.maximum(length, 1e-12)
+    positions[movable] += forces * step[:, None]
+    temperature -= cooling
+  return positions
+
+
+def initial_positions(snapshot, known, rng):
+  # Known positions where there are any; new nodes next to the mean of their placed neighbors, or at random
+  count = snapshot.node_count
+  positions = rng.uniform(-1, 1, (count, 2)) * max(np.sqrt(count), 1.0)
+  placed = np.zeros(count, dtype=bool)
+  for position, entity_id in enumerate(snapshot.ids):
+    xy = known.get(entity_id)
+    if xy is not None:
+      positions[position] = xy
+      placed[position] = True
+  new = np.flatnonzero(~placed)
+  if placed.any() and len(new):
+    sources = np.repeat(np.arange(count), snapshot.out_degree())
+    targets = snapshot.indices
+    for near, far in ((sources, targets), (targets, sources)):
+      anchored = placed[far] & ~placed[near]
+      weights = np.bincount(near[anchored], minlength=count).astype(np.float64)
+      for axis in range(2):
+        sums = np.bincount(near[anchored], weights=positions[far[anchored], axis], minlength=count)
+        has = weights > 0
+        positions[has, axis] = sums[has] / weights[has] + rng.uniform(-0.5, 0.5, has.sum())
+  return positions, new
+
+
+class GraphLayout:
+  # Positions of one snapshot's nodes, in layout units (the ideal edge length is 1)
+
+  def __init__(self, snapshot, previous=None, seed=0):
+    self.version = snapshot.version
+    self.ids = snapshot.ids
+    self._index = None
+    rng = np.random.default_rng(seed)
+    known = previous.by_id() if previous is not None else {}
+    positions, new = initial_positions(snapshot, known, rng)
+    sources = np.repeat(np.arange(snapshot.node_count, dtype=np.int32), snapshot.out_degree())
+    if not known or len(new) > LAYOUT_RELAYOUT_RATIO * snapshot.node_count:
+      self.positions = force_layout(sources, snapshot.indices, positions)
+      self.moved = snapshot.node_count
+    else:
+      self.positions = force_layout(sources, snapshot.indices, positions, movable=new,
+                                    iterations=LAYOUT_INCREMENTAL_ITERATIONS)
+      self.moved = len(new)
+
+  def by_id(self):
+    return dict(zip(self.ids, self.positions))
+
+  def index(self):
+    # Position of every node, by the string form of its entity ID; built on first use and shared by requests
+    if self._index is None:
+      self._index = {str(entity_id): position for position, entity_id in enumerate(self.ids)}
+    return self._index
+
+  def to_json(self, spacing=LAYOUT_SPACING, keys=None):
+    """
+    Cytoscape positions keyed by the string form of the entity IDs, as the client's element IDs are.
+
+    Args:
+        keys (dict): The client's element ID of each entity ID (as a string) to return positions for, such as
+            the entities of a sampled or renumbered view; all entities if None.
+    """
+    if keys is None:
+      scaled = np.round(self.positions * spacing, 1).tolist()
+      return {str(entity_id): {"x": x, "y": y} for entity_id, (x, y) in zip(self.ids, scaled)}
+    # Only the view's rows are scaled, so a sample of a large graph costs what the sample does
+    index = self.index()
+    found = [(key, index[entity_id]) for entity_id, key in keys.items() if entity_id in index]
+    rows = np.fromiter((position for _, position in found), dtype=np.int64, count=len(found))
+    scaled = np.round(self.positions[rows] * spacing, 1).tolist()
+    return {key: {"x": x, "y": y} for (key, _), (x, y) in zip(found, scaled)}
+
+
+_layout = None
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_refresh_connected = False
+
+
+def get_graph_layout(wait=True):
+  """
+  The layout of the current graph version, computed from the previous one on first use.
+
+  With wait=False, the layout of an older version is returned right away, if there is one, while the current
+  version is computed in a background thread.
+  """
+  global _layout
+  layout = _layout
+  if layout is not None and layout.version == models.current_version():
+    return layout
+  if layout is not None and not wait:
+    if _refresh_lock.acquire(blocking=False):
+      threading.Thread(target=_refresh, name="layout-refresh", daemon=True).start()
+    return layout
+  with _lock:
+    snapshot = models.get_graph_snapshot()
+    if _layout is None or _layout.version != snapshot.version:
+      _layout = GraphLayout(snapshot, _layout)
+    return _layout
+
+
+def _refresh():
+  try:
+    get_graph_layout()
+  finally:
+    _refresh_lock.release()
+
+
+def _refresh_after_writes(events):
+  if _layout is not None:
+    get_graph_layout()
+
+
+def enable_background_refresh():
+  # Lay out again after structural writes, once per batch of signals, once the layout has been asked for
+  global _refresh_connected
+  if LAYOUT_BACKGROUND_REFRESH and not _refresh_connected:
+    _refresh_connected = True
+    connect_async(entity_created, _refresh_after_writes, batch=True)
+    connect_async(entity_deleted, _refresh_after_writes, batch=True)
@@ -1,19 +1,89 @@
+import threading
+
 current_db_integration = None
 
+# Advanced by every write that changes the graph (entities added, updated or deleted, relationships added; updates
+# count too, since snapshots copy the entity names); snapshots and analytics computed from the graph are kept per
+# version. Backends whose data can change behind this
+# process's back (other worker processes, syncs, writes that skip this module) report a data_version, and
+# current_version() advances graph_version when it moved.
+graph_version = 0
+_version_lock = threading.Lock()
+_data_version = None
+_snapshot = None
+_snapshot_lock = threading.Lock()
+_snapshot_refresh_lock = threading.Lock()
+
 
 def set_database_integration(db_integration_instance):
   global current_db_integration
   current_db_integration = db_integration_instance
+  graph_changed()
+
+
+def graph_changed():
+  # Also for writes that reach the backend without going through this module
+  global graph_version
+  with _version_lock:
+    graph_version += 1
+
+
+def current_version():
+  # graph_version, advanced first if the backend's data_version changed since it was last seen
+  global graph_version, _data_version
+  db = current_db_integration
+  data_version = db.data_version() if db is not None else None
+  if data_version is not None and data_version != _data_version:
+    with _version_lock:
+      if data_version != _data_version:
+        _data_version = data_version
+        graph_version += 1
+  return graph_version
+
+
+def get_graph_snapshot(wait=True):
+  # The CSR snapshot of the current graph version, compiled on first use. With wait=False, the snapshot of an
+  # older version is returned right away, if there is one, while the current one is compiled in a background thread
+  global _snapshot
+  version = current_version()
+  snapshot = _snapshot
+  if snapshot is not None and snapshot.version == version:
+    return snapshot
+  if snapshot is not None and not wait:
+    if _snapshot_refresh_lock.acquire(blocking=False):
+      threading.Thread(target=_refresh_snapshot, name="snapshot-refresh", daemon=True).start()
+    return snapshot
+  with _snapshot_lock:
+    version = current_version()
+    if _snapshot is None or _snapshot.version != version:
+      # Imported here: it needs NumPy, which the app doesn't load until a snapshot is asked for
+      from .graph_snapshot import GraphSnapshot
+      _snapshot = GraphSnapshot.from_graph(get_full_graph(), version)
+    return _snapshot
+
+
+def _refresh_snapshot():
+  try:
+    get_graph_snapshot()
+  finally:
+    _snapshot_refresh_lock.release()
 
 
 def add_entity(entity_type, data):
-  return current_db_integration.add_entity(entity_type, data)
+  entity_id = current_db_integration.add_entity(entity_type, data)
+  graph_changed()
+  return entity_id
 
 
 def get_full_graph():
   return current_db_integration.get_full_graph()
 
 
+def get_graph_view():
+  # The graph for the visualization, possibly a sample; get_full_graph is the complete one
+  return current_db_integration.get_graph_view()
+
+
 def get_entity(entity_type, entity_id):
   return current_db_integration.get_entity(entity_type, entity_id)
 
@@ -23,15 +93,23 @@ def get_all_entities(entity_type):
 
 
 def update_entity(entity_type, entity_id, data):
-  return current_db_integration.update_entity(entity_type, entity_id, data)
+  updated = current_db_integration.update_entity(entity_type, entity_id, data)
+  if updated:
+    graph_changed()
+  return updated
 
 
 def delete_entity(entity_type, entity_id):
-  return current_db_integration.delete_entity(entity_type, entity_id)
+  deleted = current_db_integration.delete_entity(entity_type, entity_id)
+  if deleted:
+    graph_changed()
+  return deleted
 
 
 def add_relationship(data):
-  return current_db_integration.add_relationship(data)
+  relationship_id = current_db_integration.add_relationship(data)
+  graph_changed()
+  return relationship_id
 
 
 def search_entities(search_params):
@@ -41,5 +119,8 @@ def search_entities(search_params):
 def search_entities_with_type(entity_type, search_params):
   return current_db_integration.search_entities_with_type(entity_type, search_params)
 
+def search_entities_with_type_batch(entity_type, search_params_list):
+  return current_db_integration.search_entities_with_type_batch(entity_type, search_params_list)
+
 def search_relationships(search_params):
   return current_db_integration.search_relationships(search_params)
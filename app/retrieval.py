@@ -0,0 +1,242 @@
+# Token-budgeted context for ai_search: which triplets of the graph go into the prompt, and in which order.
+#
+# assemble_context gathers candidate triplets around the search results from the CSR snapshot, nearest first:
+# relationships the search matched and those touching a matched entity are hop 0, those touching an entity one hop
+# further are hop 1, and so on up to CONTEXT_MAX_HOPS. Expansion stops at CONTEXT_MAX_CANDIDATES triplets (a level
+# that overflows keeps its most central ones), so the work per question depends on the limits and not on the size of
+# the graph. Every candidate is scored as
+#   CONTEXT_RELEVANCE_WEIGHT * share of the query's terms in the triplet's text
+#   + CONTEXT_CENTRALITY_WEIGHT * PageRank of its endpoints, relative to the graph's highest
+#   + CONTEXT_HOP_WEIGHT / (1 + hop)
+# Duplicates (the same endpoints and relationship, or the same text) keep their best scored copy, and triplets are
+# packed best first until CONTEXT_TOKEN_BUDGET tokens, skipping those that no longer fit.
+#
+# The snapshot is read with wait=False, so a question right after a write doesn't wait for the graph to be compiled
+# again: search results the snapshot doesn't have yet are still candidates, without their neighborhood. Seeds are
+# matched by the IDs the backend's searches return, which its get_full_graph, and so the snapshot, share.
+#
+# Tokens are counted with tiktoken in the model's encoding (CONTEXT_ENCODING) when it is installed, and estimated
+# from the number of words and punctuation marks otherwise.
+import os
+import re
+
+import numpy as np
+
+from . import models
+from .analytics import get_graph_analytics
+from .graph_snapshot import record_snippet
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 1500))
+CONTEXT_MAX_HOPS = int(os.environ.get("CONTEXT_MAX_HOPS", 2))
+CONTEXT_MAX_CANDIDATES = int(os.environ.get("CONTEXT_MAX_CANDIDATES", 500))
+CONTEXT_RELEVANCE_WEIGHT = float(os.environ.get("CONTEXT_RELEVANCE_WEIGHT", 1.0))
+CONTEXT_CENTRALITY_WEIGHT = float(os.environ.get("CONTEXT_CENTRALITY_WEIGHT", 0.3))
+CONTEXT_HOP_WEIGHT = float(os.environ.get("CONTEXT_HOP_WEIGHT", 0.5))
+# The encoding of gpt-3.5-turbo
+CONTEXT_ENCODING = os.environ.get("CONTEXT_ENCODING", "cl100k_base")
+SEPARATOR = ", "
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "did", "do", "does", "for", "from", "has", "have", "how", "in",
+    "is", "it", "of", "on", "or", "that", "the", "this", "to", "was", "were", "what", "when", "where", "which", "who",
+    "why", "with",
+}
+WORD = re.compile(r"\w+")
+PIECE = re.compile(r"\w+|[^\w\s]")
+
+_encoding = None
+_centrality = None  # ((snapshot version, analytics version), scores)
+
+
+def get_encoding():
+  # The tiktoken encoding, or False when tiktoken is not installed or the encoding can't be loaded
+  global _encoding
+  if _encoding is None:
+    try:
+      import tiktoken
+      _encoding = tiktoken.get_encoding(CONTEXT_ENCODING)
+    except Exception as e:
+      print(f"Counting tokens approximately, tiktoken is unavailable ({e}): pip install tiktoken")
+      _encoding = False
+  return _encoding
+
+
+def count_tokens(text):
+  encoding = get_encoding()
+  if encoding:
+    return len(encoding.encode(text))
+  # About 4 tokens for every 3 words or punctuation marks, in English
+  return -(-len(PIECE.findall(text)) * 4 // 3)
+
+
+def terms(text):
+  # Lowercase words of a text, without stopwords and plural s
+  words = (word.lower() for word in WORD.findall(str(text)))
+  return {word[:-1] if len(word) > 3 and word.endswith("s") else word for word in words if word not in STOPWORDS}
+
+
+def relevance(query_terms, text):
+  if not query_terms:
+    return 0.0
+  return len(query_terms & terms(text)) / len(query_terms)
+
+
+def candidate_edges(snapshot, seeds, max_hops=CONTEXT_MAX_HOPS, limit=CONTEXT_MAX_CANDIDATES, centrality=None):
+  """
+  Edges around seed nodes, level by level.
+
+  Args:
+      snapshot (GraphSnapshot): The graph.
+      seeds (np.ndarray): Node indices to start from.
+      centrality (np.ndarray): A score per node; a level with more edges than still fit keeps the edges with the
+          highest endpoint scores. Edge order within the level if None.
+
+  Returns:
+      tuple: (edges, hops), out-edge indices and the hop of each.
+  """
+  visited = np.zeros(snapshot.node_count, dtype=bool)
+  taken = np.zeros(snapshot.edge_count, dtype=bool)
+  frontier = np.unique(np.asarray(seeds, dtype=np.int32))
+  visited[frontier] = True
+  edges, hops = [], []
+  count = 0
+  for hop in range(max_hops):
+    if not len(frontier) or count >= limit:
+      break
+    level = snapshot.edges_of(frontier)
+    level = level[~taken[level]]
+    if count + len(level) > limit:
+      if centrality is not None:
+        ends = centrality[snapshot.edge_sources(level)] + centrality[snapshot.indices[level]]
+        level = level[np.argsort(-ends, kind="stable")]
+      level = level[:limit - count]
+    taken[level] = True
+    edges.append(level)
+    hops.append(np.full(len(level), hop, dtype=np.int32))
+    count += len(level)
+    reached = np.concatenate([snapshot.edge_sources(level), snapshot.indices[level]])
+    frontier = np.unique(reached[~visited[reached]])
+    visited[frontier] = True
+  if not edges:
+    return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+  return np.concatenate(edges), np.concatenate(hops)
+
+
+def node_centrality(snapshot, analytics):
+  # PageRank per node of the snapshot, relative to the highest; analytics of an older version are mapped by ID,
+  # once per pair of versions
+  global _centrality
+  key = (snapshot.version, analytics.version if analytics is not None else None)
+  cached = _centrality
+  if cached is not None and cached[0] == key and len(cached[1]) == snapshot.node_count:
+    return cached[1]
+  if analytics is None or not len(analytics.pagerank):
+    scores = np.zeros(snapshot.node_count)
+  else:
+    if analytics.version == snapshot.version:
+      scores = analytics.pagerank
+    else:
+      scores = np.array([analytics.score(entity_id) for entity_id in snapshot.ids], dtype=np.float64)
+    highest = analytics.pagerank.max()
+    scores = scores / highest if highest > 0 else np.zeros(snapshot.node_count)
+  _centrality = (key, scores)
+  return scores
+
+
+def _name(snapshot, position, fallback):
+  name = snapshot.name(position)
+  return name if name else str(fallback)
+
+
+def _normalized(text):
+  return " ".join(text.lower().split())
+
+
+def assemble_context(query, entity_results, relationship_results, search_terms=(), budget=CONTEXT_TOKEN_BUDGET,
+                     max_hops=CONTEXT_MAX_HOPS, max_candidates=CONTEXT_MAX_CANDIDATES):
+  """
+  The triplets to put in the prompt for a question, within a token budget.
+
+  Args:
+      query (str): The user's question.
+      entity_results, relationship_results (list): What the search for the question found.
+      search_terms (iterable): More text to match triplets against, such as the search parameters' values.
+      budget (int): The most tokens the joined triplets may take.
+
+  Returns:
+      dict: triplets, the included texts best first; included, each with its score, relevance, centrality, hop and
+      tokens; and counts of candidates, duplicates and triplets left out for the budget, the tokens used and the
+      tokenizer.
+  """
+  snapshot = models.get_graph_snapshot(wait=False)
+  analytics = get_graph_analytics(wait=False)
+  centrality = node_centrality(snapshot, analytics)
+  query_terms = terms(query)
+  for term in search_terms:
+    query_terms |= terms(term)
+
+  seed_ids = [entity.get("id") for entity in entity_results]
+  for relationship in relationship_results:
+    seed_ids.extend((relationship.get("from_id"), relationship.get("to_id")))
+  seeds = snapshot.positions([entity_id for entity_id in seed_ids if entity_id is not None])
+  edges, hops = candidate_edges(snapshot, seeds, max_hops, max_candidates, centrality)
+
+  candidates = []  # (key, text, hop, centrality)
+  for relationship in relationship_results[:max_candidates]:
+    # Search hits the snapshot may not have, such as those of backends whose IDs it doesn't share
+    key = (str(relationship.get("from_id")), relationship.get("relationship", ""), str(relationship.get("to_id")))
+    ends = snapshot.positions([relationship.get("from_id"), relationship.get("to_id")])
+    text = record_snippet(relationship)
+    if not text:
+      names = [_name(snapshot, ends[0], key[0]), _name(snapshot, ends[1], key[2])] if len(ends) == 2 \
+          else [relationship.get("from_entity") or key[0], relationship.get("to_entity") or key[2]]
+      text = f"{names[0]} {key[1] or 'connected to'} {names[1]}"
+    candidates.append((key, text, 0, float(centrality[ends].mean()) if len(ends) else 0.0))
+  sources = snapshot.edge_sources(edges)
+  targets = snapshot.indices[edges]
+  for edge, source, target, hop in zip(edges, sources, targets, hops):
+    from_id, to_id = snapshot.ids[source], snapshot.ids[target]
+    label = snapshot.relationship_names[snapshot.edge_types[edge]]
+    text = snapshot.snippets.get(int(edge)) or " ".join((_name(snapshot, source, from_id), label or "connected to",
+                                                         _name(snapshot, target, to_id)))
+    candidates.append(((str(from_id), label, str(to_id)), text, int(hop),
+                       float(centrality[source] + centrality[target]) / 2))
+
+  scored = []
+  for key, text, hop, central in candidates:
+    match = relevance(query_terms, text)
+    score = (CONTEXT_RELEVANCE_WEIGHT * match + CONTEXT_CENTRALITY_WEIGHT * central
+             + CONTEXT_HOP_WEIGHT / (1 + hop))
+    scored.append((score, key, text, hop, match, central))
+  scored.sort(key=lambda item: item[0], reverse=True)
+
+  seen_keys, seen_texts = set(), set()
+  included, triplets = [], []
+  duplicates = over_budget = used = 0
+  separator = count_tokens(SEPARATOR)
+  for score, key, text, hop, match, central in scored:
+    normalized = _normalized(text)
+    if key in seen_keys or normalized in seen_texts:
+      duplicates += 1
+      continue
+    seen_keys.add(key)
+    seen_texts.add(normalized)
+    tokens = count_tokens(text) + (separator if triplets else 0)
+    if used + tokens > budget:
+      over_budget += 1
+      continue
+    used += tokens
+    triplets.append(text)
+    included.append({"text": text, "score": round(score, 4), "relevance": round(match, 4),
+                     "centrality": round(central, 4), "hop": hop, "tokens": tokens})
+
+  return {
+      "triplets": triplets,
+      "included": included,
+      "candidates": len(candidates),
+      "duplicates": duplicates,
+      "over_budget": over_budget,
+      "tokens": used,
+      "budget": budget,
+      "tokenizer": CONTEXT_ENCODING if get_encoding() else "approximate",
+  }
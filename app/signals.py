@@ -1,6 +1,164 @@
-from blinker import signal
+from blinker import signal, ANY
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .integrations.database.metrics import LatencyRecorder
 
 # Define the signals at the top level of the module
 entity_created = signal('entity-created')
 entity_updated = signal('entity-updated')
 entity_deleted = signal('entity-deleted')
+
+# Handlers connected with signal.connect run synchronously, inside the request that sent the signal.
+# Handlers connected with connect_async are queued and run on a shared, bounded thread pool instead:
+# - every handler has its own queue of at most SIGNAL_QUEUE_SIZE events; when it is full, the sender waits up to
+#   SIGNAL_BLOCK_SECONDS for room and the event is dropped (and counted) after that
+# - a handler gets at most one pool thread at a time and is given up to batch_size queued events per run, as a
+#   list of (sender, kwargs) with batch=True, or one call per event otherwise
+# - exceptions are caught and counted per handler, so a failing handler neither breaks the request nor the others
+# signal_bus.stats() reports queue depth, delivered, failed and dropped events and delivery latency per handler.
+SIGNAL_WORKERS = int(os.environ.get('SIGNAL_WORKERS', 4))
+SIGNAL_QUEUE_SIZE = int(os.environ.get('SIGNAL_QUEUE_SIZE', 1000))
+SIGNAL_BLOCK_SECONDS = float(os.environ.get('SIGNAL_BLOCK_SECONDS', 0.1))
+SIGNAL_BATCH_SIZE = int(os.environ.get('SIGNAL_BATCH_SIZE', 100))
+
+
+class AsyncHandler:
+    # The blinker receiver of an async handler: queues events and drains them on the bus's pool
+
+    def __init__(self, bus, handler, batch, batch_size, queue_size, block_seconds):
+        self.bus = bus
+        self.handler = handler
+        self.name = f'{handler.__module__}.{handler.__qualname__}'
+        self.batch = batch
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.block_seconds = block_seconds
+
+        self._events = deque()
+        self._condition = threading.Condition()
+        self._scheduled = False
+        self.latency = LatencyRecorder()
+        self.counters = {'received': 0, 'delivered': 0, 'batches': 0, 'failures': 0, 'dropped': 0}
+
+    def __call__(self, sender, **kwargs):
+        with self._condition:
+            if len(self._events) >= self.queue_size and not self._condition.wait_for(
+                    lambda: len(self._events) < self.queue_size, timeout=self.block_seconds):
+                self.counters['dropped'] += 1
+                print(f'Dropped a signal for {self.name}: its queue is full')
+                return
+            self._events.append((sender, kwargs, time.perf_counter()))
+            self.counters['received'] += 1
+            schedule = not self._scheduled
+            self._scheduled = True
+        if schedule:
+            self.bus.submit(self._drain)
+
+    def _drain(self):
+        # One batch per run, then back in the pool's queue, so busy handlers take turns with the others
+        with self._condition:
+            events = [self._events.popleft() for _ in range(min(self.batch_size, len(self._events)))]
+            self._condition.notify_all()
+
+        started = time.perf_counter()
+        for _, _, queued_at in events:
+            self.latency.record('lag', started - queued_at)
+        if self.batch:
+            self._run(lambda: self.handler([(sender, kwargs) for sender, kwargs, _ in events]), len(events))
+        else:
+            for sender, kwargs, _ in events:
+                self._run(lambda: self.handler(sender, **kwargs), 1)
+        self.latency.record('batch', time.perf_counter() - started)
+
+        with self._condition:
+            self.counters['batches'] += 1
+            if self._events:
+                reschedule = True
+            else:
+                reschedule = self._scheduled = False
+                self._condition.notify_all()
+        if reschedule:
+            self.bus.submit(self._drain)
+
+    def _run(self, call, count):
+        try:
+            call()
+            self.counters['delivered'] += count
+        except Exception as e:
+            self.counters['failures'] += count
+            print(f'Signal handler {self.name} failed: {e!r}')
+
+    def wait(self, timeout=None):
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._scheduled, timeout=timeout)
+
+    def stats(self):
+        return {'queued': len(self._events), **self.counters, 'latency': self.latency.stats()}
+
+
+class AsyncSignalBus:
+
+    def __init__(self, workers=SIGNAL_WORKERS):
+        self.workers = workers
+        self.handlers = []
+        self._executor = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, task):
+        with self._lock:
+            if not self._closed:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='signal')
+                self._executor.submit(task)
+                return
+        # After close() the remaining events are handled on the sender's thread
+        task()
+
+    def connect(self, signal, handler, sender=ANY, batch=False, batch_size=SIGNAL_BATCH_SIZE,
+                queue_size=SIGNAL_QUEUE_SIZE, block_seconds=SIGNAL_BLOCK_SECONDS):
+        receiver = AsyncHandler(self, handler, batch, batch_size, queue_size, block_seconds)
+        # The bus keeps the receiver alive, blinker only holds it weakly by default
+        signal.connect(receiver, sender=sender, weak=False)
+        self.handlers.append((signal, receiver))
+        return receiver
+
+    def disconnect(self, receiver):
+        for connected_signal, connected in list(self.handlers):
+            if connected is receiver:
+                connected_signal.disconnect(receiver)
+                self.handlers.remove((connected_signal, connected))
+
+    def flush(self, timeout=None):
+        # Wait until every queued event has been handled
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for _, receiver in list(self.handlers):
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if not receiver.wait(remaining):
+                return False
+        return True
+
+    def close(self, timeout=10):
+        self.flush(timeout)
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self):
+        return {receiver.name: receiver.stats() for _, receiver in self.handlers}
+
+
+signal_bus = AsyncSignalBus()
+atexit.register(signal_bus.close)
+
+
+def connect_async(signal, handler, **options):
+    # Run handler off the request thread; see AsyncSignalBus.connect for the options
+    return signal_bus.connect(signal, handler, **options)
@@ -14,16 +14,19 @@
 
 from flask import (
     Blueprint,
+    Response,
     send_from_directory,
     current_app,
     jsonify,
     request,
     render_template,
 )
+import io
 import os
+from . import bulk, models
 from .models import (
     add_entity,
-    get_full_graph,
+    get_graph_view,
     get_entity,
     get_all_entities,
     update_entity,
@@ -39,6 +42,26 @@ from .integration_manager import get_integration_function
 main = Blueprint("main", __name__)
 
 
+# analytics, clustering and layout need NumPy, so they are imported by the first request that uses them instead
+# of at startup; each one's background refresh starts with it
+def get_graph_analytics(wait=True):
+  from . import analytics
+  analytics.enable_background_refresh()
+  return analytics.get_graph_analytics(wait=wait)
+
+
+def get_cluster_hierarchy(wait=True):
+  from . import clustering
+  clustering.enable_background_refresh()
+  return clustering.get_cluster_hierarchy(wait=wait)
+
+
+def get_graph_layout(wait=True):
+  from . import layout
+  layout.enable_background_refresh()
+  return layout.get_graph_layout(wait=wait)
+
+
 @main.route("/")
 def index():
   return render_template("index.html")
@@ -46,11 +69,28 @@ def index():
 
 @main.route("/get-graph-data", methods=["GET"])
 def get_graph_data():
-  # Assuming get_all_entities returns all the graph data you need
-  all_entities = get_full_graph()
-  print("ALL ENTITIES")
-  print(all_entities)
-  return jsonify(all_entities), 200
+  # The graph as the visualization shows it, which some backends sample
+  all_entities = get_graph_view()
+  if request.args.get("layout", "true").lower() == "false":
+    return jsonify(all_entities), 200
+  # Node positions for the client's preset layout, so large graphs aren't laid out in the browser. Right after a
+  # write, the previous version's layout is served while the current one is computed, and the client lays the
+  # graph out itself if some node has no position yet
+  layout = get_graph_layout(wait=False)
+  return jsonify({**all_entities, "positions": layout.to_json(keys=view_keys(all_entities)),
+                  "layout_version": layout.version}), 200
+
+
+def view_keys(view):
+  # The client's element ID of every entity in the view, so that positions are only sent for those (sampled views
+  # such as FalkorDB's hold a fraction of the graph). Views that renumber the entities (NebulaGraph's) keep each
+  # entity's ID as entity_id
+  keys = {}
+  for entities in view.get("entities", {}).values():
+    for key, record in entities.items():
+      entity_id = record.get("entity_id", key) if isinstance(record, dict) else key
+      keys[str(entity_id)] = str(key)
+  return keys
 
 
 @main.route("/favicon.ico")
@@ -171,4 +211,139 @@ def search_relationship():
   return jsonify(error="Missing search parameters"), 400
 
 
+def ranked_entities(ranking):
+  results = []
+  for entity_id, entity_type, score in ranking:
+    entity = get_entity(entity_type, entity_id) or {}
+    data = entity.get("data", entity) if isinstance(entity, dict) else {}
+    results.append({"id": entity_id, "type": entity_type, "name": data.get("name"), "score": score})
+  return results
+
+
+@main.route("/analytics/pagerank", methods=["GET"])
+def pagerank_route():
+  analytics = get_graph_analytics(wait=False)
+  ranking = analytics.top(analytics.pagerank,
+                          limit=request.args.get("limit", 20, type=int),
+                          entity_type=request.args.get("type"))
+  return jsonify(version=analytics.version, results=ranked_entities(ranking)), 200
+
+
+@main.route("/analytics/degree", methods=["GET"])
+def degree_route():
+  analytics = get_graph_analytics(wait=False)
+  direction = request.args.get("direction", "total")
+  degrees = {
+      "in": analytics.in_degree,
+      "out": analytics.out_degree,
+      "total": analytics.in_degree + analytics.out_degree,
+  }.get(direction)
+  if degrees is None:
+    return jsonify(error="direction must be in, out or total"), 400
+  ranking = analytics.top(degrees,
+                          limit=request.args.get("limit", 20, type=int),
+                          entity_type=request.args.get("type"))
+  return jsonify(version=analytics.version, results=ranked_entities(ranking)), 200
+
+
+@main.route("/analytics/components", methods=["GET"])
+def components_route():
+  # smallest=true lists the islands first, like those left by bad extractions
+  analytics = get_graph_analytics(wait=False)
+  components = analytics.component_list(
+      limit=request.args.get("limit", 20, type=int),
+      max_members=request.args.get("max_members", 50, type=int),
+      smallest_first=request.args.get("smallest", "false").lower() == "true")
+  return jsonify(version=analytics.version,
+                 count=int((analytics.component_sizes > 0).sum()),
+                 components=components), 200
+
+
+def cluster_element_id(level, cluster, hierarchy):
+  # Entities keep their own IDs, clusters are "<level>:<cluster>"
+  if level == 0:
+    return str(hierarchy.snapshot.ids[cluster])
+  return f"{level}:{cluster}"
+
+
+def cluster_view_json(hierarchy, view):
+  level = view["level"]
+  nodes = []
+  for cluster in view["clusters"]:
+    entity = get_entity(cluster["type"], cluster["representative"]) or {}
+    data = entity.get("data", entity) if isinstance(entity, dict) else {}
+    nodes.append({
+        "id": cluster_element_id(level, cluster["cluster"], hierarchy),
+        "name": data.get("name"),
+        **cluster,
+    })
+  return {
+      "version": hierarchy.version,
+      "level": level,
+      "levels": view["levels"],
+      "total": view["total"],
+      "nodes": nodes,
+      "edges": [{
+          "source": cluster_element_id(level, a, hierarchy),
+          "target": cluster_element_id(level, b, hierarchy),
+          "weight": weight,
+      } for a, b, weight in view["edges"]],
+      "external": [{
+          "source": cluster_element_id(level, a, hierarchy),
+          "target": cluster_element_id(level + 1, parent, hierarchy),
+          "weight": weight,
+      } for a, parent, weight in view["external"]],
+  }
+
+
+@main.route("/view", methods=["GET"])
+def cluster_view_route():
+  # One level of the cluster hierarchy, the top one by default; level=0 are the entities
+  hierarchy = get_cluster_hierarchy(wait=False)
+  level = request.args.get("level", hierarchy.top, type=int)
+  if not 0 <= level <= hierarchy.top:
+    return jsonify(error=f"level must be between 0 and {hierarchy.top}"), 400
+  view = hierarchy.view(level, limit=request.args.get("limit", 300, type=int))
+  return jsonify(cluster_view_json(hierarchy, view)), 200
+
+
+@main.route("/view/<int:level>/<int:cluster>", methods=["GET"])
+def expand_cluster_route(level, cluster):
+  # The members of a cluster, one level down, with the edges among them and to the clusters around
+  hierarchy = get_cluster_hierarchy(wait=False)
+  if not 1 <= level <= hierarchy.top or cluster >= hierarchy.levels[level].count:
+    return jsonify(error="Cluster not found"), 404
+  view = hierarchy.view(level - 1, hierarchy.children(level, cluster), limit=request.args.get("limit", 300, type=int))
+  return jsonify(cluster_view_json(hierarchy, view)), 200
+
+
+@main.route("/bulk/export", methods=["GET"])
+def bulk_export_route():
+  # Streams the graph as NDJSON (default) or an Arrow IPC stream
+  export_format = request.args.get("format", "ndjson")
+  records = bulk.iter_records(models.current_db_integration)
+  if export_format == "ndjson":
+    return Response(bulk.to_ndjson(records), mimetype="application/x-ndjson")
+  if export_format == "arrow":
+    return Response(bulk.iter_arrow_stream(records), mimetype="application/vnd.apache.arrow.stream")
+  return jsonify(error="format must be ndjson or arrow"), 400
+
+
+@main.route("/bulk/import", methods=["POST"])
+def bulk_import_route():
+  # Reads the request body as a stream, so memory is bounded by the batch size
+  import_format = request.args.get("format", "ndjson")
+  batch_size = request.args.get("batch_size", bulk.BULK_BATCH_SIZE, type=int)
+  if import_format == "ndjson":
+    records = bulk.from_ndjson(io.TextIOWrapper(request.stream, encoding="utf8"))
+  elif import_format == "arrow":
+    pa = bulk.require_pyarrow()
+    records = bulk.from_record_batches(pa.ipc.open_stream(request.stream))
+  else:
+    return jsonify(error="format must be ndjson or arrow"), 400
+  counts = bulk.import_records(models.current_db_integration, records, batch_size)
+  models.graph_changed()
+  return jsonify(counts), 200
+
+
 # Add more routes as needed for specific actions, queries, etc.
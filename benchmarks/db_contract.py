@@ -0,0 +1,339 @@
+# Micro-benchmarks for the DatabaseIntegration contract.
+#
+# Builds a synthetic graph with realistic property sizes through any DatabaseIntegration implementation and times
+# the contract methods: add_entity, add_relationship, get_entity, search_entities_with_type, search_relationships,
+# get_full_graph and delete_entity. For every operation it records throughput, p50/p99 latency and the process peak
+# RSS after the phase, writes the results to JSON and optionally compares them against a stored baseline.
+#
+# Each scale runs in a fresh process so that peak RSS is measured per graph size.
+#
+# Usage:
+#   python benchmarks/db_contract.py --scales 10k                          # in-memory backend, 10k entities
+#   python benchmarks/db_contract.py --scales 10k,100k,1m --output out.json
+#   python benchmarks/db_contract.py --backend falkordb --scales 10k       # writes into the configured FalkorDB graph!
+#   python benchmarks/db_contract.py --scales 10k --baseline benchmarks/baselines/db_contract_memory.json
+#   python benchmarks/db_contract.py --scales 10k --save-baseline benchmarks/baselines/db_contract_memory.json
+#
+# --backend takes a DATABASE_TYPE (memory, falkordb, nebulagraph, nexusdb) or a "module:Class" path.
+# The comparison exits with status 1 when any operation's throughput drops by more than --tolerance.
+
+import argparse
+import contextlib
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+  sys.path.insert(0, ROOT)
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+OPERATIONS = [
+    "add_entity",
+    "add_relationship",
+    "get_entity",
+    "search_entities_with_type",
+    "search_relationships",
+    "get_full_graph",
+    "delete_entity",
+]
+
+WORDS = (
+    "alpha beta gamma delta quantum neural graph market venture capital robotics energy solar bio health data "
+    "cloud edge vision language model open source labs systems network research global pacific atlantic north "
+    "south river mountain city union capital partners group holdings institute foundation studio works").split()
+
+
+def parse_scale(scale):
+  scale = scale.strip().lower()
+  if scale in SCALES:
+    return SCALES[scale]
+  return int(scale)
+
+
+def load_backend(backend):
+  if ":" in backend:
+    module_path, class_name = backend.split(":", 1)
+    return getattr(importlib.import_module(module_path), class_name)
+  from app.integrations.database import get_database_integration
+  return get_database_integration(backend)
+
+
+def load_schema(schema_file_path):
+  with open(schema_file_path, "r") as file:
+    schema = json.load(file)
+  entity_types = list(schema.keys())
+  # Relationship names from the schema; names with "/" are not valid edge types on every backend
+  edge_types = sorted({
+      edge_type
+      for info in schema.values()
+      for edge_type in info["edge_types"]
+      if edge_type not in ("name", "description") and "/" not in edge_type
+  })
+  return entity_types, edge_types
+
+
+def words(rng, count):
+  return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def make_entity(rng, entity_type, index):
+  # Names are unique so that hashed-ID backends don't collapse entities
+  name = f"{words(rng, rng.randint(1, 3)).title()} {index}"
+  return {
+      "entity_type": entity_type,
+      "data": {
+          "temp_id": index,
+          "name": name,
+          "description": words(rng, rng.randint(20, 60)),
+          "Related to": words(rng, rng.randint(3, 10)),
+      },
+  }
+
+
+def make_relationship(rng, edge_types, source, target):
+  relationship = rng.choice(edge_types)
+  return {
+      "relationship": relationship,
+      "relationship_type": relationship,
+      "snippet": f"{source['name']} {relationship} {target['name']}. {words(rng, rng.randint(10, 30))}",
+      "from_id": source["id"],
+      "to_id": target["id"],
+      "from_type": source["type"],
+      "to_type": target["type"],
+      "from_entity": source["name"],
+      "to_entity": target["name"],
+  }
+
+
+def percentile(sorted_values, fraction):
+  if not sorted_values:
+    return 0.0
+  index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+  return sorted_values[index]
+
+
+def peak_rss_mb():
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+  if sys.platform == "darwin":
+    return peak / (1024 * 1024)
+  return peak / 1024
+
+
+def time_calls(fn, calls):
+  latencies = []
+  started = time.perf_counter()
+  for args in calls:
+    call_started = time.perf_counter()
+    fn(*args)
+    latencies.append(time.perf_counter() - call_started)
+  total = time.perf_counter() - started
+
+  latencies.sort()
+  return {
+      "count": len(latencies),
+      "total_s": round(total, 6),
+      "throughput_ops": round(len(latencies) / total, 2) if total else 0.0,
+      "p50_ms": round(percentile(latencies, 0.50) * 1000, 4),
+      "p99_ms": round(percentile(latencies, 0.99) * 1000, 4),
+      "peak_rss_mb": round(peak_rss_mb(), 1),
+  }
+
+
+def run_scale(backend, entity_count, options):
+  rng = random.Random(options["seed"])
+  entity_types, edge_types = load_schema(options["schema"])
+  integration_class = load_backend(backend)
+
+  results = {}
+  with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+    db = integration_class()
+
+    # add_entity: builds the graph, every call is timed
+    payloads = [
+        make_entity(rng, entity_types[i % len(entity_types)], i)
+        for i in range(entity_count)
+    ]
+    entities = []
+
+    def add_entity(payload):
+      entity_id = db.add_entity(payload["entity_type"], payload)
+      entities.append({
+          "id": entity_id,
+          "type": payload["entity_type"],
+          "name": payload["data"]["name"],
+      })
+
+    results["add_entity"] = time_calls(add_entity, ((p, ) for p in payloads))
+    del payloads
+
+    # add_relationship: random endpoints, edges_per_entity on average
+    relationship_count = int(entity_count * options["edges_per_entity"])
+    relationships = [
+        make_relationship(rng, edge_types, rng.choice(entities), rng.choice(entities))
+        for _ in range(relationship_count)
+    ]
+    results["add_relationship"] = time_calls(
+        db.add_relationship, ((r, ) for r in relationships))
+
+    lookups = [rng.choice(entities) for _ in range(options["lookups"])]
+    results["get_entity"] = time_calls(
+        db.get_entity, ((e["type"], e["id"]) for e in lookups))
+
+    # Dedup-style searches, the way conditional_entity_addition calls them
+    searches = [rng.choice(entities) for _ in range(options["searches"])]
+    results["search_entities_with_type"] = time_calls(
+        db.search_entities_with_type,
+        ((e["type"], {"name": e["name"]}) for e in searches))
+
+    # Same parameters conditional_relationship_addition uses
+    relationship_searches = [
+        rng.choice(relationships) for _ in range(options["searches"])
+    ] if relationships else []
+    results["search_relationships"] = time_calls(
+        db.search_relationships,
+        (({key: r[key] for key in ("from_id", "from_type", "to_id", "to_type")}, )
+         for r in relationship_searches))
+    del relationships
+
+    results["get_full_graph"] = time_calls(
+        db.get_full_graph, (() for _ in range(options["full_graph_runs"])))
+
+    deletions = rng.sample(entities, min(options["deletes"], len(entities)))
+    results["delete_entity"] = time_calls(
+        db.delete_entity, ((e["type"], e["id"]) for e in deletions))
+
+  run = {
+      "backend": backend,
+      "entities": entity_count,
+      "relationships": relationship_count,
+      "peak_rss_mb": round(peak_rss_mb(), 1),
+      "operations": results,
+  }
+  # Backends that measure themselves (e.g. nebulagraph) also report per-operation and round trip latency
+  if hasattr(db, "latency_stats"):
+    run["backend_latency"] = db.latency_stats()
+  return run
+
+
+def run_isolated(backend, entity_count, options):
+  # A fresh interpreter per scale keeps ru_maxrss meaningful
+  context = multiprocessing.get_context("spawn")
+  with context.Pool(1) as pool:
+    return pool.apply(run_scale, (backend, entity_count, options))
+
+
+def compare(results, baseline, tolerance):
+  regressions = []
+  baseline_runs = {(run["backend"], run["entities"]): run for run in baseline["runs"]}
+
+  for run in results["runs"]:
+    reference = baseline_runs.get((run["backend"], run["entities"]))
+    if reference is None:
+      print(f"\nNo baseline for {run['backend']} @ {run['entities']} entities")
+      continue
+
+    print(f"\n{run['backend']} @ {run['entities']} entities vs baseline")
+    print(f"{'operation':<28}{'ops/s':>12}{'baseline':>12}{'change':>9}{'p99 ms':>10}{'baseline':>10}")
+    for operation in OPERATIONS:
+      current = run["operations"].get(operation)
+      previous = reference["operations"].get(operation)
+      if not current or not previous or not previous["throughput_ops"]:
+        continue
+      change = current["throughput_ops"] / previous["throughput_ops"] - 1
+      flag = ""
+      if change < -tolerance:
+        flag = "  REGRESSION"
+        regressions.append((run["backend"], run["entities"], operation, change))
+      print(
+          f"{operation:<28}{current['throughput_ops']:>12.1f}{previous['throughput_ops']:>12.1f}"
+          f"{change:>+9.1%}{current['p99_ms']:>10.3f}{previous['p99_ms']:>10.3f}{flag}")
+
+  return regressions
+
+
+def print_run(run):
+  print(
+      f"\n{run['backend']} @ {run['entities']} entities, {run['relationships']} relationships, "
+      f"peak RSS {run['peak_rss_mb']} MB")
+  print(f"{'operation':<28}{'count':>9}{'ops/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'RSS MB':>9}")
+  for operation in OPERATIONS:
+    stats = run["operations"][operation]
+    print(
+        f"{operation:<28}{stats['count']:>9}{stats['throughput_ops']:>12.1f}"
+        f"{stats['p50_ms']:>10.3f}{stats['p99_ms']:>10.3f}{stats['peak_rss_mb']:>9.1f}")
+  if "backend_latency" in run:
+    print(f"\nreported by the backend\n{'operation':<36}{'count':>9}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for operation, stats in sorted(run["backend_latency"].items()):
+      print(
+          f"{operation:<36}{stats['count']:>9}{stats['mean_ms']:>10.3f}"
+          f"{stats['p50_ms']:>10.3f}{stats['p99_ms']:>10.3f}")
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark a DatabaseIntegration implementation.")
+  parser.add_argument("--backend", default=os.getenv("DATABASE_TYPE", "memory"),
+                      help="DATABASE_TYPE name or module:Class path.")
+  parser.add_argument("--scales", default="10k", help="Comma separated entity counts, e.g. 10k,100k,1m.")
+  parser.add_argument("--edges-per-entity", type=float, default=2.0)
+  parser.add_argument("--lookups", type=int, default=5000, help="Number of get_entity calls.")
+  parser.add_argument("--searches", type=int, default=200, help="Number of calls per search method.")
+  parser.add_argument("--deletes", type=int, default=200, help="Number of delete_entity calls.")
+  parser.add_argument("--full-graph-runs", type=int, default=5, help="Number of get_full_graph calls.")
+  parser.add_argument("--seed", type=int, default=42)
+  parser.add_argument("--schema", default=os.path.join(ROOT, "schema.json"))
+  parser.add_argument("--output", help="Write results to this JSON file.")
+  parser.add_argument("--baseline", help="Compare against this stored results file.")
+  parser.add_argument("--save-baseline", help="Store the results as a baseline at this path.")
+  parser.add_argument("--tolerance", type=float, default=0.3,
+                      help="Allowed throughput drop against the baseline before failing (0.3 = 30%%).")
+  args = parser.parse_args()
+
+  options = {
+      "edges_per_entity": args.edges_per_entity,
+      "lookups": args.lookups,
+      "searches": args.searches,
+      "deletes": args.deletes,
+      "full_graph_runs": args.full_graph_runs,
+      "seed": args.seed,
+      "schema": args.schema,
+  }
+  results = {
+      "python": platform.python_version(),
+      "platform": platform.platform(),
+      "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+      "options": options,
+      "runs": [],
+  }
+
+  for scale in args.scales.split(","):
+    run = run_isolated(args.backend, parse_scale(scale), options)
+    results["runs"].append(run)
+    print_run(run)
+
+  for path in (args.output, args.save_baseline):
+    if path:
+      os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+      with open(path, "w") as file:
+        json.dump(results, file, indent=2)
+      print(f"\nWrote {path}")
+
+  if args.baseline:
+    with open(args.baseline, "r") as file:
+      baseline = json.load(file)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+      print(f"\n{len(regressions)} operation(s) regressed by more than {args.tolerance:.0%}")
+      sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
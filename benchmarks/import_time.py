@@ -0,0 +1,109 @@
+# Import-time benchmark for app startup.
+#
+# Runs `python -X importtime` in a fresh interpreter that imports the app and calls create_app(), then parses the
+# per-module timings that CPython writes to stderr. The report lists the total startup import time and the modules
+# with the largest cumulative cost, which makes it easy to spot a heavy dependency (openai, bs4, a database driver)
+# creeping back onto the startup path.
+#
+# Usage:
+#   python benchmarks/import_time.py                       # memory backend, human readable report
+#   python benchmarks/import_time.py --top 30 --runs 5     # more modules, median over 5 runs
+#   python benchmarks/import_time.py --json out.json       # also write the results as JSON
+#   DATABASE_TYPE=falkordb python benchmarks/import_time.py
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_SNIPPET = "from app import create_app; create_app()"
+
+# "import time: self [us] | cumulative | imported package"
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S.*)$")
+
+
+def parse_importtime(stderr):
+  modules = []
+  for line in stderr.splitlines():
+    match = IMPORTTIME_LINE.match(line)
+    if not match:
+      continue
+    self_us, cumulative_us, indent, name = match.groups()
+    modules.append({
+        "module": name.strip(),
+        "self_us": int(self_us),
+        "cumulative_us": int(cumulative_us),
+        # Top-level imports have a single space of indentation
+        "depth": (len(indent) - 1) // 2,
+    })
+  return modules
+
+
+def run_once(snippet, env):
+  result = subprocess.run(
+      [sys.executable, "-X", "importtime", "-c", snippet],
+      cwd=ROOT,
+      env=env,
+      capture_output=True,
+      text=True,
+  )
+  if result.returncode != 0:
+    raise RuntimeError(f"Startup failed:\n{result.stderr[-2000:]}")
+  return parse_importtime(result.stderr)
+
+
+def benchmark(snippet=STARTUP_SNIPPET, runs=3, env=None):
+  env = dict(os.environ if env is None else env)
+  env.setdefault("DATABASE_TYPE", "memory")
+
+  totals = []
+  per_module = {}
+  for _ in range(runs):
+    modules = run_once(snippet, env)
+    totals.append(sum(m["cumulative_us"] for m in modules if m["depth"] == 0))
+    for m in modules:
+      per_module.setdefault(m["module"], []).append(m["cumulative_us"])
+
+  return {
+      "snippet": snippet,
+      "database_type": env["DATABASE_TYPE"],
+      "runs": runs,
+      "total_us": int(statistics.median(totals)),
+      "module_count": len(per_module),
+      "modules": {
+          name: int(statistics.median(values))
+          for name, values in per_module.items()
+      },
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Measure app startup import time with python -X importtime.")
+  parser.add_argument("--runs", type=int, default=3, help="Number of fresh interpreters to run (median is reported).")
+  parser.add_argument("--top", type=int, default=20, help="Number of most expensive modules to show.")
+  parser.add_argument("--snippet", default=STARTUP_SNIPPET, help="Python code to time.")
+  parser.add_argument("--json", dest="json_path", help="Write the full results to this JSON file.")
+  args = parser.parse_args()
+
+  results = benchmark(args.snippet, runs=args.runs)
+
+  print(f"DATABASE_TYPE={results['database_type']}  runs={results['runs']}")
+  print(f"Total import time: {results['total_us'] / 1000:.1f} ms across {results['module_count']} modules\n")
+  print(f"{'cumulative ms':>14}  module")
+  ranked = sorted(results["modules"].items(), key=lambda item: item[1], reverse=True)
+  for name, cumulative_us in ranked[:args.top]:
+    print(f"{cumulative_us / 1000:>14.1f}  {name}")
+
+  if args.json_path:
+    with open(args.json_path, "w") as file:
+      json.dump(results, file, indent=2)
+    print(f"\nWrote {args.json_path}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,168 @@
+# End-to-end ingestion benchmark against the offline LLM stub.
+#
+# Starts benchmarks/llm_stub.py in-process (or uses an already running stub through --llm-url), points the app at it
+# with OPENAI_BASE_URL and ingests a text corpus through the real Flask routes
+# (POST /trigger-integration/natural_input by default, which runs add_multiple_conditional and conditional_*).
+# Because the stub reports how long it spent answering, the benchmark can separate LLM time from everything else and
+# report the non-LLM overhead of the pipeline per document.
+#
+# Usage:
+#   python benchmarks/ingest.py                                     # bundled corpus, synthetic answers, memory backend
+#   python benchmarks/ingest.py --documents 200 --latency-ms 500 --jitter-ms 100
+#   python benchmarks/ingest.py --exchanges llm.jsonl               # replay recorded OpenAI exchanges
+#   python benchmarks/ingest.py --llm-url http://127.0.0.1:8001/v1  # use a stub started separately
+#   python benchmarks/ingest.py --output ingest.json
+
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+  sys.path.insert(0, ROOT)
+
+from benchmarks.llm_stub import start_in_background  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(ROOT, "benchmarks", "corpus", "sample.txt")
+
+
+def load_corpus(path):
+  with open(path, "r") as file:
+    text = file.read()
+  return [paragraph.strip() for paragraph in text.split("\n\n") if paragraph.strip()]
+
+
+def stub_stats(llm_url):
+  base = llm_url.rstrip("/")
+  if base.endswith("/v1"):
+    base = base[:-3]
+  with urllib.request.urlopen(f"{base}/stats") as response:
+    return json.loads(response.read())
+
+
+def percentile(sorted_values, fraction):
+  if not sorted_values:
+    return 0.0
+  index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+  return sorted_values[index]
+
+
+def summarize(values):
+  values = sorted(values)
+  return {
+      "total": round(sum(values), 6),
+      "mean": round(sum(values) / len(values), 6) if values else 0.0,
+      "p50": round(percentile(values, 0.50), 6),
+      "p99": round(percentile(values, 0.99), 6),
+  }
+
+
+def run(args):
+  server = None
+  llm_url = args.llm_url
+  if not llm_url:
+    server, llm_url = start_in_background(
+        exchanges=args.exchanges,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        seed=args.seed,
+    )
+
+  # Must be set before the integrations are imported
+  os.environ["OPENAI_BASE_URL"] = llm_url
+  os.environ.setdefault("OPENAI_API_KEY", "stub")
+  os.environ.setdefault("DATABASE_TYPE", "memory")
+
+  from app import create_app
+  from app.models import get_full_graph
+
+  documents = list(itertools.islice(itertools.cycle(load_corpus(args.corpus)), args.documents))
+  output = open(os.devnull, "w") if not args.show_app_output else sys.stdout
+
+  with contextlib.redirect_stdout(output):
+    app = create_app()
+    client = app.test_client()
+
+  wall_times = []
+  llm_times = []
+  overheads = []
+  llm_calls = 0
+  errors = 0
+  started = time.perf_counter()
+  for document in documents:
+    before = stub_stats(llm_url)
+    with contextlib.redirect_stdout(output):
+      request_started = time.perf_counter()
+      response = client.post(f"/trigger-integration/{args.integration}", json={"natural_input": document})
+      wall = time.perf_counter() - request_started
+    after = stub_stats(llm_url)
+
+    if response.status_code != 200:
+      errors += 1
+    llm_time = after["served_s"] - before["served_s"]
+    llm_calls += after["requests"] - before["requests"]
+    wall_times.append(wall)
+    llm_times.append(llm_time)
+    overheads.append(max(0.0, wall - llm_time))
+  elapsed = time.perf_counter() - started
+
+  graph = get_full_graph()
+  if server is not None:
+    server.shutdown()
+    server.server_close()
+
+  return {
+      "integration": args.integration,
+      "database_type": os.environ["DATABASE_TYPE"],
+      "documents": len(documents),
+      "errors": errors,
+      "elapsed_s": round(elapsed, 4),
+      "documents_per_s": round(len(documents) / elapsed, 2) if elapsed else 0.0,
+      "llm_calls": llm_calls,
+      "llm_latency_ms": args.latency_ms,
+      "wall_s": summarize(wall_times),
+      "llm_s": summarize(llm_times),
+      "non_llm_overhead_s": summarize(overheads),
+      "entities": sum(len(entities) for entities in graph["entities"].values()),
+      "relationships": len(graph["relationships"]),
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Ingest a corpus through the Flask routes against the LLM stub.")
+  parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="Text file with documents separated by blank lines.")
+  parser.add_argument("--documents", type=int, default=50, help="Number of documents to ingest (the corpus is cycled).")
+  parser.add_argument("--integration", default="natural_input", help="Integration to trigger per document.")
+  parser.add_argument("--llm-url", help="Base URL of a running stub; by default one is started in-process.")
+  parser.add_argument("--exchanges", help="Recorded exchanges (JSONL) for the in-process stub to replay.")
+  parser.add_argument("--latency-ms", type=float, default=0.0)
+  parser.add_argument("--jitter-ms", type=float, default=0.0)
+  parser.add_argument("--seed", type=int, default=42)
+  parser.add_argument("--show-app-output", action="store_true", help="Don't silence the app's print output.")
+  parser.add_argument("--output", help="Write results to this JSON file.")
+  args = parser.parse_args()
+
+  results = run(args)
+
+  print(f"{results['documents']} documents via {results['integration']} "
+        f"({results['errors']} errors) in {results['elapsed_s']:.2f}s, {results['documents_per_s']} docs/s")
+  print(f"LLM calls: {results['llm_calls']}, graph: {results['entities']} entities, "
+        f"{results['relationships']} relationships")
+  print(f"{'per document':<22}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}")
+  for label, key in (("wall", "wall_s"), ("LLM", "llm_s"), ("non-LLM overhead", "non_llm_overhead_s")):
+    stats = results[key]
+    print(f"{label:<22}{stats['mean'] * 1000:>10.2f}{stats['p50'] * 1000:>10.2f}{stats['p99'] * 1000:>10.2f}")
+
+  if args.output:
+    with open(args.output, "w") as file:
+      json.dump(results, file, indent=2)
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,392 @@
+# Offline, OpenAI-compatible stand-in for the chat completion API.
+#
+# Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8001/v1 and every integration that calls
+# openai.ChatCompletion.create (natural_input, add_multiple_conditional -> conditional_*, latent_input, ai_search)
+# talks to this server instead of OpenAI. It supports plain chat completions and the function_call shape used by
+# natural_input.
+#
+# Modes:
+#   replay (default)  Answer from a JSONL file of recorded exchanges. Requests that were never recorded get a
+#                     deterministic synthetic answer shaped like what the calling integration expects
+#                     (use --no-synthetic to return an error instead).
+#   record            Forward every request to --upstream with OPENAI_API_KEY, return the real answer and append
+#                     the exchange to the JSONL file.
+#
+# --latency-ms and --jitter-ms add synthetic latency to every answer so benchmarks can model the model's response
+# time without paying for it. GET /stats returns request counts and time spent serving; POST /stats/reset clears them.
+#
+# Usage:
+#   python benchmarks/llm_stub.py --port 8001                                  # synthetic answers, no latency
+#   python benchmarks/llm_stub.py --mode record --exchanges llm.jsonl          # capture real exchanges
+#   python benchmarks/llm_stub.py --exchanges llm.jsonl --latency-ms 800 --jitter-ms 200
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_UPSTREAM = "https://api.openai.com/v1"
+
+# Capitalized word runs, e.g. "Jane Smith" or "Company XYZ"
+PROPER_NOUN = re.compile(r"\b[A-Z][\w&'-]*(?:\s+[A-Z][\w&'-]*)*")
+
+STOP_WORDS = {"The", "A", "An", "In", "On", "At", "He", "She", "They", "It", "We", "I", "This", "That", "Help",
+              "User", "Based", "Generate", "Person", "Org", "And", "But", "Of"}
+
+
+def request_key(body):
+  # Exchanges are matched on everything that influences the answer
+  relevant = {key: body.get(key) for key in ("model", "messages", "functions", "function_call")}
+  canonical = json.dumps(relevant, sort_keys=True, separators=(",", ":"))
+  return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def estimate_tokens(text):
+  return max(1, len(text) // 4)
+
+
+def completion_response(body, content=None, function_call=None):
+  message = {"role": "assistant", "content": content}
+  if function_call is not None:
+    message["function_call"] = function_call
+  prompt_text = json.dumps(body.get("messages", []))
+  completion_text = content or json.dumps(function_call)
+  prompt_tokens = estimate_tokens(prompt_text)
+  completion_tokens = estimate_tokens(completion_text)
+  return {
+      "id": f"chatcmpl-stub-{request_key(body)[:24]}",
+      "object": "chat.completion",
+      "created": int(time.time()),
+      "model": body.get("model", "stub"),
+      "choices": [{
+          "index": 0,
+          "message": message,
+          "finish_reason": "function_call" if function_call is not None else "stop",
+      }],
+      "usage": {
+          "prompt_tokens": prompt_tokens,
+          "completion_tokens": completion_tokens,
+          "total_tokens": prompt_tokens + completion_tokens,
+      },
+  }
+
+
+def proper_nouns(text, limit=8):
+  names = []
+  for match in PROPER_NOUN.findall(text):
+    words = [word for word in match.split() if word not in STOP_WORDS]
+    name = " ".join(words)
+    if len(name) > 1 and name not in names:
+      names.append(name)
+    if len(names) >= limit:
+      break
+  return names
+
+
+def last_user_message(body):
+  for message in reversed(body.get("messages", [])):
+    if message.get("role") == "user":
+      return message.get("content") or ""
+  return ""
+
+
+def system_message(body):
+  for message in body.get("messages", []):
+    if message.get("role") == "system":
+      return message.get("content") or ""
+  return ""
+
+
+def synthetic_knowledge_graph(body, function):
+  # Shaped like the knowledge_graph function in natural_input
+  text = last_user_message(body).split(":", 1)[-1]
+  properties = function.get("parameters", {}).get("properties", {})
+  node_types = list(properties.get("nodes", {}).get("properties", {}).keys()) or ["Person"]
+  relationship_schema = (properties.get("relationships", {}).get("items", {}).get("properties", {})
+                         .get("data", {}).get("properties", {}).get("relationship", {}))
+  edge_types = relationship_schema.get("enum") or ["Related to"]
+
+  nodes = {}
+  entities = []
+  for temp_id, name in enumerate(proper_nouns(text), start=1):
+    # Stable type per name so the same entity keeps its type across documents
+    node_type = node_types[int(hashlib.md5(name.encode("utf-8")).hexdigest(), 16) % len(node_types)]
+    nodes.setdefault(node_type, []).append({"temp_id": temp_id, "name": name})
+    entities.append((temp_id, node_type, name))
+
+  sentences = re.split(r"(?<=[.!?])\s+", text)
+  relationships = []
+  for (from_id, from_type, from_name), (to_id, to_type, to_name) in zip(entities, entities[1:]):
+    snippet = next((s for s in sentences if from_name in s and to_name in s), f"{from_name} and {to_name}.")
+    relationships.append({
+        "from_type": from_type,
+        "from_temp_id": from_id,
+        "to_type": to_type,
+        "to_temp_id": to_id,
+        "data": {
+            "relationship": edge_types[(from_id + to_id) % len(edge_types)],
+            "snippet": snippet.strip(),
+        },
+    })
+
+  arguments = json.dumps({"nodes": nodes, "relationships": relationships})
+  return {"name": function.get("name", "knowledge_graph"), "arguments": arguments}
+
+
+def parse_literal(text):
+  try:
+    return ast.literal_eval(text.strip().rstrip("?").strip().rstrip("."))
+  except (ValueError, SyntaxError):
+    return None
+
+
+def synthetic_entity_match(body):
+  # conditional_entity_addition: "Here are the search results: [...]. Does any entry match the input data: {...}?"
+  results_text, _, input_text = last_user_message(body).partition(". Does any entry match the input data: ")
+  results = parse_literal(results_text.replace("Here are the search results: ", "", 1))
+  payload = parse_literal(input_text)
+  if isinstance(results, list) and isinstance(payload, dict):
+    name = str(payload.get("data", {}).get("name", "")).strip().lower()
+    for result in results:
+      if isinstance(result, dict) and name and str(result.get("name", "")).strip().lower() == name:
+        return str(result.get("id"))
+  return "No Matches"
+
+
+def synthetic_relationship_match(body):
+  # conditional_relationship_addition: "Existing relationships: [...]. Do any of these match ...: {...}?"
+  existing_text, _, proposed_text = last_user_message(body).partition(
+      ". Do any of these match the proposed relationship details: ")
+  existing = parse_literal(existing_text.replace("Existing relationships: ", "", 1))
+  proposed = parse_literal(proposed_text)
+  if isinstance(existing, list) and isinstance(proposed, dict):
+    for relationship in existing:
+      if isinstance(relationship, dict) and relationship.get("relationship") == proposed.get("relationship"):
+        return json.dumps(relationship, default=str)
+  return "No Matches"
+
+
+def synthetic_answer(body):
+  functions = body.get("functions") or []
+  if functions:
+    requested = (body.get("function_call") or {}).get("name") if isinstance(body.get("function_call"), dict) else None
+    function = next((f for f in functions if f.get("name") == requested), functions[0])
+    return completion_response(body, function_call=synthetic_knowledge_graph(body, function))
+
+  system = system_message(body)
+  if "decide if new input data matches" in system:
+    return completion_response(body, synthetic_entity_match(body))
+  if "proposed new relationship" in system:
+    return completion_response(body, synthetic_relationship_match(body))
+  if "search parameters" in system:
+    names = proper_nouns(last_user_message(body).replace("User input:", "", 1))
+    return completion_response(body, json.dumps([{"name": name} for name in names]))
+  if "long and detailed answers" in system:
+    text = last_user_message(body)
+    names = proper_nouns(text) or ["Acme Corp", "Jane Doe"]
+    sentences = [f"{a} is related to {b}." for a, b in zip(names, names[1:] + names[:1])]
+    return completion_response(body, f"{text} " + " ".join(sentences))
+  return completion_response(body, f"Synthetic answer based on: {last_user_message(body)[:200]}")
+
+
+class ExchangeStore:
+  def __init__(self, path):
+    self.path = path
+    self.lock = threading.Lock()
+    self.responses = {}
+    self.cursors = {}
+    if path and os.path.exists(path):
+      with open(path, "r") as file:
+        for line in file:
+          if line.strip():
+            exchange = json.loads(line)
+            self.responses.setdefault(exchange["key"], []).append(exchange["response"])
+
+  def lookup(self, key):
+    with self.lock:
+      responses = self.responses.get(key)
+      if not responses:
+        return None
+      # Repeated identical requests cycle through the recorded answers
+      cursor = self.cursors.get(key, 0)
+      self.cursors[key] = cursor + 1
+      return responses[cursor % len(responses)]
+
+  def append(self, key, request_body, response_body):
+    with self.lock:
+      self.responses.setdefault(key, []).append(response_body)
+      if self.path:
+        with open(self.path, "a") as file:
+          file.write(json.dumps({"key": key, "request": request_body, "response": response_body}) + "\n")
+
+
+class StubState:
+  def __init__(self, mode="replay", exchanges=None, upstream=DEFAULT_UPSTREAM, api_key=None, latency_ms=0.0,
+               jitter_ms=0.0, synthetic=True, seed=None):
+    self.mode = mode
+    self.store = ExchangeStore(exchanges)
+    self.upstream = upstream.rstrip("/")
+    self.api_key = api_key
+    self.latency_ms = latency_ms
+    self.jitter_ms = jitter_ms
+    self.synthetic = synthetic
+    self.random = random.Random(seed)
+    self.lock = threading.Lock()
+    self.reset_stats()
+
+  def reset_stats(self):
+    with self.lock:
+      self.stats = {"requests": 0, "replayed": 0, "synthetic": 0, "recorded": 0, "errors": 0, "served_s": 0.0}
+
+  def count(self, outcome, served_s):
+    with self.lock:
+      self.stats["requests"] += 1
+      self.stats[outcome] += 1
+      self.stats["served_s"] += served_s
+
+  def delay(self):
+    if not self.latency_ms and not self.jitter_ms:
+      return
+    with self.lock:
+      jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms)
+    time.sleep(max(0.0, self.latency_ms + jitter) / 1000)
+
+  def forward(self, body):
+    request = urllib.request.Request(
+        f"{self.upstream}/chat/completions",
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request) as response:
+      return json.loads(response.read())
+
+  def answer(self, body):
+    key = request_key(body)
+    if self.mode == "record":
+      response_body = self.forward(body)
+      self.store.append(key, body, response_body)
+      return "recorded", response_body
+
+    recorded = self.store.lookup(key)
+    if recorded is not None:
+      self.delay()
+      return "replayed", recorded
+    if not self.synthetic:
+      raise LookupError(f"No recorded exchange for request {key}")
+    self.delay()
+    return "synthetic", synthetic_answer(body)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+  protocol_version = "HTTP/1.1"
+
+  def log_message(self, format, *args):
+    # Keep benchmark output readable
+    pass
+
+  def send_json(self, status, payload):
+    data = json.dumps(payload).encode("utf-8")
+    self.send_response(status)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
+
+  def read_json(self):
+    length = int(self.headers.get("Content-Length", 0))
+    return json.loads(self.rfile.read(length) or b"{}")
+
+  def do_GET(self):
+    if self.path.rstrip("/") == "/stats":
+      with self.server.state.lock:
+        return self.send_json(200, dict(self.server.state.stats))
+    self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+  def do_POST(self):
+    state = self.server.state
+    path = self.path.rstrip("/")
+    if path == "/stats/reset":
+      self.read_json()
+      state.reset_stats()
+      return self.send_json(200, {"success": True})
+    if not path.endswith("/chat/completions"):
+      return self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    started = time.perf_counter()
+    try:
+      body = self.read_json()
+      outcome, response_body = state.answer(body)
+    except urllib.error.HTTPError as e:
+      state.count("errors", time.perf_counter() - started)
+      return self.send_json(e.code, json.loads(e.read() or b"{}"))
+    except Exception as e:
+      state.count("errors", time.perf_counter() - started)
+      return self.send_json(500, {"error": {"message": str(e), "type": "stub_error"}})
+    state.count(outcome, time.perf_counter() - started)
+    self.send_json(200, response_body)
+
+
+def create_server(host="127.0.0.1", port=8001, **state_options):
+  server = ThreadingHTTPServer((host, port), StubHandler)
+  server.daemon_threads = True
+  server.state = StubState(**state_options)
+  return server
+
+
+def start_in_background(host="127.0.0.1", port=0, **state_options):
+  # Port 0 picks a free port; the base URL to use is returned alongside the server
+  server = create_server(host, port, **state_options)
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+  parser = argparse.ArgumentParser(description="OpenAI-compatible chat completion stub with record/replay.")
+  parser.add_argument("--host", default="127.0.0.1")
+  parser.add_argument("--port", type=int, default=8001)
+  parser.add_argument("--mode", choices=["replay", "record"], default="replay")
+  parser.add_argument("--exchanges", help="JSONL file to replay from or record to.")
+  parser.add_argument("--upstream", default=os.environ.get("OPENAI_UPSTREAM_URL", DEFAULT_UPSTREAM),
+                      help="Real API base URL used in record mode.")
+  parser.add_argument("--latency-ms", type=float, default=0.0, help="Synthetic latency added to every answer.")
+  parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter around --latency-ms.")
+  parser.add_argument("--no-synthetic", action="store_true", help="Fail requests that were not recorded.")
+  parser.add_argument("--seed", type=int, default=None, help="Seed for the latency jitter.")
+  args = parser.parse_args()
+
+  if args.mode == "record" and not os.environ.get("OPENAI_API_KEY"):
+    parser.error("record mode needs OPENAI_API_KEY for the upstream API")
+
+  server = create_server(
+      args.host,
+      args.port,
+      mode=args.mode,
+      exchanges=args.exchanges,
+      upstream=args.upstream,
+      api_key=os.environ.get("OPENAI_API_KEY"),
+      latency_ms=args.latency_ms,
+      jitter_ms=args.jitter_ms,
+      synthetic=not args.no_synthetic,
+      seed=args.seed,
+  )
+  print(f"LLM stub ({args.mode}) listening on http://{args.host}:{server.server_address[1]}/v1")
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+
+
+if __name__ == "__main__":
+  main()
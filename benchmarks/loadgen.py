@@ -0,0 +1,445 @@
+# HTTP load generator for mixed read/write workloads against the Flask app.
+#
+# Runs a workload profile from benchmarks/workloads.json: a weighted mix of operations against the real routes in
+# app/views.py (graph polling, entity CRUD, relationships, search and integration triggers) issued by a pool of
+# concurrent clients for a fixed duration. By default the app is started in a separate process with a threaded
+# server, the in-memory backend and the offline LLM stub (benchmarks/llm_stub.py); use --url to target a server
+# you started yourself. Reports throughput, latency percentiles and error rates per route.
+#
+# Usage:
+#   python benchmarks/loadgen.py --profile mixed
+#   python benchmarks/loadgen.py --profile read_heavy --concurrency 64 --duration 60 --output read_heavy.json
+#   python benchmarks/loadgen.py --profile mixed --url http://127.0.0.1:81     # server started separately
+#
+# Available operations for a profile's "mix": see OPERATIONS below.
+
+import argparse
+import contextlib
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import threading
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+  sys.path.insert(0, ROOT)
+
+DEFAULT_WORKLOADS = os.path.join(ROOT, "benchmarks", "workloads.json")
+
+ENTITY_TYPES = ["Person", "Organization", "Concept", "Event", "Technology"]
+RELATIONSHIPS = ["Works for", "Invests in", "Related to", "Collaborates on", "Competes with"]
+WORDS = ("alpha beta gamma delta quantum neural graph market venture capital robotics energy solar health data "
+         "cloud vision language model labs systems network research global pacific north river city").split()
+
+
+def free_port():
+  with contextlib.closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as sock:
+    sock.bind(("127.0.0.1", 0))
+    return sock.getsockname()[1]
+
+
+def serve_app(port, llm_latency_ms, llm_jitter_ms):
+  # Runs in a child process: LLM stub in a thread, the app on a threaded werkzeug server
+  from benchmarks.llm_stub import start_in_background
+
+  _, llm_url = start_in_background(latency_ms=llm_latency_ms, jitter_ms=llm_jitter_ms)
+  os.environ["OPENAI_BASE_URL"] = llm_url
+  os.environ.setdefault("OPENAI_API_KEY", "stub")
+  os.environ["DATABASE_TYPE"] = "memory"
+
+  # The app prints on every request and werkzeug logs every request; neither belongs in the report
+  sys.stdout = open(os.devnull, "w")
+  logging.getLogger("werkzeug").setLevel(logging.WARNING)
+  from werkzeug.serving import make_server
+
+  from app import create_app
+
+  make_server("127.0.0.1", port, create_app(), threaded=True).serve_forever()
+
+
+def wait_for_server(host, port, timeout=30):
+  deadline = time.monotonic() + timeout
+  while time.monotonic() < deadline:
+    try:
+      with socket.create_connection((host, port), timeout=1):
+        return
+    except OSError:
+      time.sleep(0.1)
+  raise RuntimeError(f"Server on {host}:{port} did not start within {timeout}s")
+
+
+def words(rng, count):
+  return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+class GraphState:
+  # Entities and relationships known to the clients, shared across worker threads
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.entities = []
+    self.relationships = []
+
+  def add_entity(self, entity):
+    with self.lock:
+      self.entities.append(entity)
+
+  def pick_entity(self, rng):
+    with self.lock:
+      return rng.choice(self.entities) if self.entities else None
+
+  def pop_entity(self, rng):
+    with self.lock:
+      if not self.entities:
+        return None
+      index = rng.randrange(len(self.entities))
+      self.entities[index], self.entities[-1] = self.entities[-1], self.entities[index]
+      return self.entities.pop()
+
+  def add_relationship(self, relationship):
+    with self.lock:
+      self.relationships.append(relationship)
+
+  def pick_relationship(self, rng):
+    with self.lock:
+      return rng.choice(self.relationships) if self.relationships else None
+
+
+def entity_payload(rng, entity_type):
+  return {
+      "entity_type": entity_type,
+      "data": {
+          "name": f"{words(rng, 2).title()} {rng.randrange(10**6)}",
+          "description": words(rng, rng.randint(20, 50)),
+      },
+  }
+
+
+def relationship_payload(rng, source, target):
+  relationship = rng.choice(RELATIONSHIPS)
+  return {
+      "relationship": relationship,
+      "relationship_type": relationship,
+      "snippet": f"{source['name']} {relationship} {target['name']}.",
+      "from_id": source["id"],
+      "to_id": target["id"],
+      "from_type": source["type"],
+      "to_type": target["type"],
+      "from_entity": source["name"],
+      "to_entity": target["name"],
+  }
+
+
+# Each operation returns (route label, method, path, JSON body, callback for the parsed response) or None to skip
+
+def op_graph_poll(rng, state):
+  return "GET /get-graph-data", "GET", "/get-graph-data", None, None
+
+
+def op_get_entity(rng, state):
+  entity = state.pick_entity(rng)
+  if entity is None:
+    return None
+  return "GET /<entity_type>/<id>", "GET", f"/{entity['type']}/{entity['id']}", None, None
+
+
+def op_list_entities(rng, state):
+  return "GET /<entity_type>", "GET", f"/{rng.choice(ENTITY_TYPES)}", None, None
+
+
+def op_create_entity(rng, state):
+  entity_type = rng.choice(ENTITY_TYPES)
+  payload = entity_payload(rng, entity_type)
+
+  def remember(body):
+    state.add_entity({"id": body["id"], "type": entity_type, "name": payload["data"]["name"]})
+
+  return "POST /<entity_type>", "POST", f"/{entity_type}", payload, remember
+
+
+def op_update_entity(rng, state):
+  entity = state.pick_entity(rng)
+  if entity is None:
+    return None
+  payload = {"data": {"description": words(rng, rng.randint(20, 50))}}
+  return "PUT /<entity_type>/<id>", "PUT", f"/{entity['type']}/{entity['id']}", payload, None
+
+
+def op_delete_entity(rng, state):
+  entity = state.pop_entity(rng)
+  if entity is None:
+    return None
+  return "DELETE /<entity_type>/<id>", "DELETE", f"/{entity['type']}/{entity['id']}", None, None
+
+
+def op_create_relationship(rng, state):
+  source, target = state.pick_entity(rng), state.pick_entity(rng)
+  if source is None or target is None:
+    return None
+  payload = relationship_payload(rng, source, target)
+  return "POST /relationship", "POST", "/relationship", payload, lambda body: state.add_relationship(payload)
+
+
+def op_search_entities(rng, state):
+  entity = state.pick_entity(rng)
+  if entity is None:
+    return None
+  query = urllib.parse.urlencode({"name": entity["name"].split()[0]})
+  return "GET /search/entities/<entity_type>", "GET", f"/search/entities/{entity['type']}?{query}", None, None
+
+
+def op_search_relationships(rng, state):
+  relationship = state.pick_relationship(rng)
+  if relationship is None:
+    return None
+  query = urllib.parse.urlencode({key: relationship[key] for key in ("from_id", "to_id")})
+  return "GET /search/relationships", "GET", f"/search/relationships?{query}", None, None
+
+
+def op_trigger_search_integration(rng, state):
+  entity = state.pick_entity(rng)
+  if entity is None:
+    return None
+  payload = {"entity_type": entity["type"], "search_params": {"name": entity["name"].split()[0]}}
+  return ("POST /trigger-integration/search_integration", "POST", "/trigger-integration/search_integration",
+          payload, None)
+
+
+def op_trigger_natural_input(rng, state):
+  source, target = state.pick_entity(rng), state.pick_entity(rng)
+  if source is None or target is None:
+    return None
+  text = (f"{source['name'].title()} met {target['name'].title()} at the {words(rng, 1).title()} Summit. "
+          f"{source['name'].title()} later joined {words(rng, 2).title()} Labs.")
+  return ("POST /trigger-integration/natural_input", "POST", "/trigger-integration/natural_input",
+          {"natural_input": text}, None)
+
+
+def op_trigger_ai_search(rng, state):
+  entity = state.pick_entity(rng)
+  if entity is None:
+    return None
+  return ("POST /trigger-integration/ai_search", "POST", "/trigger-integration/ai_search",
+          f"What is {entity['name'].title()} connected to?", None)
+
+
+OPERATIONS = {
+    "graph_poll": op_graph_poll,
+    "get_entity": op_get_entity,
+    "list_entities": op_list_entities,
+    "create_entity": op_create_entity,
+    "update_entity": op_update_entity,
+    "delete_entity": op_delete_entity,
+    "create_relationship": op_create_relationship,
+    "search_entities": op_search_entities,
+    "search_relationships": op_search_relationships,
+    "trigger_search_integration": op_trigger_search_integration,
+    "trigger_natural_input": op_trigger_natural_input,
+    "trigger_ai_search": op_trigger_ai_search,
+}
+
+
+class Client:
+  def __init__(self, host, port, timeout=120):
+    self.host = host
+    self.port = port
+    self.timeout = timeout
+    self.connection = None
+
+  def request(self, method, path, body=None):
+    # One keep-alive connection per worker, reopened after failures
+    if self.connection is None:
+      self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+    headers = {}
+    data = None
+    if body is not None:
+      data = json.dumps(body).encode("utf-8")
+      headers["Content-Type"] = "application/json"
+    try:
+      self.connection.request(method, path, body=data, headers=headers)
+      response = self.connection.getresponse()
+      return response.status, response.read()
+    except (OSError, http.client.HTTPException):
+      self.connection.close()
+      self.connection = None
+      raise
+
+
+def seed(client, state, rng, entity_count, relationship_count):
+  for _ in range(entity_count):
+    entity_type = rng.choice(ENTITY_TYPES)
+    payload = entity_payload(rng, entity_type)
+    status, body = client.request("POST", f"/{entity_type}", payload)
+    if status == 201:
+      state.add_entity({"id": json.loads(body)["id"], "type": entity_type, "name": payload["data"]["name"]})
+  for _ in range(relationship_count):
+    payload = relationship_payload(rng, state.pick_entity(rng), state.pick_entity(rng))
+    status, _ = client.request("POST", "/relationship", payload)
+    if status == 201:
+      state.add_relationship(payload)
+
+
+def worker(host, port, state, mix, deadline, measure_from, think_ms, seed_value, records):
+  rng = random.Random(seed_value)
+  client = Client(host, port)
+  names = list(mix.keys())
+  weights = list(mix.values())
+  local = []
+  while time.monotonic() < deadline:
+    operation = OPERATIONS[rng.choices(names, weights)[0]](rng, state)
+    if operation is None:
+      continue
+    route, method, path, body, callback = operation
+    started = time.monotonic()
+    try:
+      status, raw = client.request(method, path, body)
+    except (OSError, http.client.HTTPException):
+      status, raw = None, b""
+    latency = time.monotonic() - started
+
+    ok = status is not None and status < 400
+    if ok and callback is not None:
+      try:
+        callback(json.loads(raw))
+      except ValueError:
+        pass
+    if started >= measure_from:
+      local.append((route, latency, status))
+    if think_ms:
+      time.sleep(think_ms / 1000)
+  records.extend(local)
+
+
+def percentile(sorted_values, fraction):
+  if not sorted_values:
+    return 0.0
+  index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+  return sorted_values[index]
+
+
+def report(records, measured_s):
+  routes = {}
+  for route, latency, status in records:
+    routes.setdefault(route, []).append((latency, status))
+
+  def stats(samples):
+    latencies = sorted(latency for latency, _ in samples)
+    errors = sum(1 for _, status in samples if status is None or status >= 400)
+    statuses = {}
+    for _, status in samples:
+      statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / measured_s, 2) if measured_s else 0.0,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p90_ms": round(percentile(latencies, 0.90) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        "statuses": statuses,
+    }
+
+  return {
+      "total": stats([(latency, status) for _, latency, status in records]),
+      "routes": {route: stats(samples) for route, samples in sorted(routes.items())},
+  }
+
+
+def run(profile, host, port, seed_value):
+  state = GraphState()
+  rng = random.Random(seed_value)
+  seed(Client(host, port), state, rng, profile.get("seed_entities", 0), profile.get("seed_relationships", 0))
+
+  unknown = set(profile["mix"]) - set(OPERATIONS)
+  if unknown:
+    raise ValueError(f"Unknown operations in mix: {sorted(unknown)}")
+
+  warmup_s = profile.get("warmup_s", 0)
+  duration_s = profile["duration_s"]
+  started = time.monotonic()
+  measure_from = started + warmup_s
+  deadline = measure_from + duration_s
+  records = []
+  threads = [
+      threading.Thread(
+          target=worker,
+          args=(host, port, state, profile["mix"], deadline, measure_from, profile.get("think_ms", 0),
+                seed_value + i + 1, records),
+          daemon=True,
+      ) for i in range(profile["concurrency"])
+  ]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  measured_s = time.monotonic() - measure_from
+  return report(records, measured_s)
+
+
+def print_report(name, profile, results):
+  total = results["total"]
+  print(f"\nprofile {name}: concurrency {profile['concurrency']}, {profile['duration_s']}s measured")
+  print(f"{total['requests']} requests, {total['throughput_rps']} req/s, error rate {total['error_rate']:.2%}")
+  print(f"{'route':<46}{'reqs':>8}{'req/s':>9}{'err%':>7}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}")
+  for route, stats in results["routes"].items():
+    print(f"{route:<46}{stats['requests']:>8}{stats['throughput_rps']:>9.1f}{stats['error_rate']:>7.1%}"
+          f"{stats['p50_ms']:>9.2f}{stats['p90_ms']:>9.2f}{stats['p99_ms']:>9.2f}")
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Mixed read/write HTTP load test for the Flask app.")
+  parser.add_argument("--workloads", default=DEFAULT_WORKLOADS, help="JSON file with workload profiles.")
+  parser.add_argument("--profile", default="mixed")
+  parser.add_argument("--concurrency", type=int, help="Override the profile's concurrency.")
+  parser.add_argument("--duration", type=float, help="Override the profile's measured duration in seconds.")
+  parser.add_argument("--url", help="Target an already running server instead of starting one.")
+  parser.add_argument("--seed", type=int, default=42)
+  parser.add_argument("--output", help="Write results to this JSON file.")
+  args = parser.parse_args()
+
+  with open(args.workloads, "r") as file:
+    profiles = json.load(file)["profiles"]
+  if args.profile not in profiles:
+    parser.error(f"unknown profile {args.profile!r}, choose from {sorted(profiles)}")
+  profile = dict(profiles[args.profile])
+  if args.concurrency:
+    profile["concurrency"] = args.concurrency
+  if args.duration:
+    profile["duration_s"] = args.duration
+
+  server = None
+  if args.url:
+    parsed = urllib.parse.urlparse(args.url)
+    host, port = parsed.hostname, parsed.port or 80
+  else:
+    host, port = "127.0.0.1", free_port()
+    server = multiprocessing.get_context("spawn").Process(
+        target=serve_app,
+        args=(port, profile.get("llm_latency_ms", 0), profile.get("llm_jitter_ms", 0)),
+        daemon=True,
+    )
+    server.start()
+
+  try:
+    wait_for_server(host, port)
+    results = run(profile, host, port, args.seed)
+  finally:
+    if server is not None:
+      server.terminate()
+      server.join()
+
+  print_report(args.profile, profile, results)
+  if args.output:
+    with open(args.output, "w") as file:
+      json.dump({"profile": args.profile, "settings": profile, **results}, file, indent=2)
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+  main()
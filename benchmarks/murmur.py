@@ -0,0 +1,119 @@
+# Benchmark and verification of the murmur64 vertex-ID hashing used by the NebulaGraph backend.
+#
+# Hashes a set of synthetic entity names with the original byte-at-a-time implementation (murmur64_reference), the
+# scalar murmur64 (cold and memoized) and the NumPy murmur64_batch, checks that all of them agree bit for bit, and
+# reports names per second. With --verify-nebula the hashes of a sample are also compared with RETURN hash(...)
+# on the NebulaGraph server at NEBULA_ADDRESS.
+#
+# Usage:
+#   python benchmarks/murmur.py                          # 100k names
+#   python benchmarks/murmur.py --names 1000000 --skip-reference
+#   python benchmarks/murmur.py --verify-nebula --sample 1000
+#   python benchmarks/murmur.py --output murmur.json
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+  sys.path.insert(0, ROOT)
+
+from app.integrations.database.murmur import murmur64, murmur64_batch, murmur64_reference  # noqa: E402
+
+WORDS = (
+    "alpha beta gamma delta quantum neural graph market venture capital robotics energy solar bio health data "
+    "cloud edge vision language model open source labs systems network research global pacific atlantic north "
+    "south river mountain city union capital partners group holdings institute foundation studio works "
+    "zürich são paulo münchen 東京 서울").split()
+
+
+def make_names(count, seed):
+  rng = random.Random(seed)
+  return [f"{' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title()} {i}" for i in range(count)]
+
+
+def timed(label, fn, count):
+  started = time.perf_counter()
+  hashes = fn()
+  elapsed = time.perf_counter() - started
+  print(f"{label:<24}{elapsed:>10.3f}s{count / elapsed:>16,.0f} names/s")
+  return hashes, {"seconds": round(elapsed, 4), "names_per_s": round(count / elapsed, 1)}
+
+
+def verify_nebula(names):
+  from nebula3.Config import Config
+  from nebula3.gclient.net import ConnectionPool
+
+  address, port = os.environ.get("NEBULA_ADDRESS", "127.0.0.1:9669").split(":")
+  pool = ConnectionPool()
+  assert pool.init([(address, int(port))], Config()), "Failed to connect to NebulaGraph"
+  session = pool.get_session(os.environ.get("NEBULA_USER", "root"), os.environ.get("NEBULA_PASSWORD", "nebula"))
+  try:
+    mismatches = 0
+    for name in names:
+      escaped = name.replace("\\", "\\\\").replace('"', '\\"')
+      result = session.execute(f'RETURN hash("{escaped}") AS h;')
+      assert result.is_succeeded(), result.error_msg()
+      if result.column_values("h")[0].as_int() != murmur64(name):
+        mismatches += 1
+        print(f"Mismatch for {name!r}")
+    return mismatches
+  finally:
+    session.release()
+    pool.close()
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark and verify murmur64 vertex-ID hashing.")
+  parser.add_argument("--names", type=int, default=100_000, help="Number of names to hash.")
+  parser.add_argument("--seed", type=int, default=42)
+  parser.add_argument("--skip-reference", action="store_true", help="Don't time the byte-at-a-time reference.")
+  parser.add_argument("--sample", type=int, default=10_000,
+                      help="Names checked against the reference when it is skipped, and against Nebula.")
+  parser.add_argument("--verify-nebula", action="store_true", help="Compare a sample with Nebula's hash().")
+  parser.add_argument("--output", help="Write results to this JSON file.")
+  args = parser.parse_args()
+
+  names = make_names(args.names, args.seed)
+  results = {"names": len(names)}
+
+  murmur64.cache_clear()
+  scalar, results["scalar_cold"] = timed("murmur64 (cold cache)", lambda: [murmur64(name) for name in names],
+                                         len(names))
+  _, results["scalar_cached"] = timed("murmur64 (memoized)", lambda: [murmur64(name) for name in names],
+                                      len(names))
+  batch, results["batch"] = timed("murmur64_batch", lambda: murmur64_batch(names).tolist(), len(names))
+
+  if args.skip_reference:
+    sample = names[:args.sample]
+    reference = [murmur64_reference(name) for name in sample]
+    checked = len(sample)
+  else:
+    reference, results["reference"] = timed(
+        "murmur64_reference", lambda: [murmur64_reference(name) for name in names], len(names))
+    checked = len(names)
+
+  assert scalar[:checked] == reference, "murmur64 differs from the reference"
+  assert batch[:checked] == reference, "murmur64_batch differs from the reference"
+  print(f"\nmurmur64 and murmur64_batch match the reference on {checked:,} names")
+  results["verified"] = checked
+
+  if args.verify_nebula:
+    mismatches = verify_nebula(names[:args.sample])
+    print(f"Nebula hash(): {args.sample - mismatches:,} of {args.sample:,} names match")
+    results["nebula_mismatches"] = mismatches
+    if mismatches:
+      sys.exit(1)
+
+  if args.output:
+    with open(args.output, "w") as file:
+      json.dump(results, file, indent=2)
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+  main()
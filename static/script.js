@@ -188,18 +188,23 @@ $(document).ready(function () {
 
   function transformDataToCytoscapeFormat(data) {
     const { entities, relationships } = data; // Adjusted for new data structure
+    const positions = data.positions || {}; // Precomputed on the server
 
     const nodes = [];
     // Iterate over each entity type (e.g., 'people', 'organizations') and their entities
     Object.entries(entities).forEach(([entityType, entityGroup]) => {
       Object.entries(entityGroup).forEach(([entityId, entityData]) => {
-        nodes.push({
+        const node = {
           data: {
             id: entityId,
             name: entityData.data.name, // Assuming 'name' is a consistent property
             type: entityType, // Used for styling based on the entity type
           },
-        });
+        };
+        if (positions[entityId]) {
+          node.position = positions[entityId];
+        }
+        nodes.push(node);
       });
     });
 
@@ -229,9 +234,10 @@ $(document).ready(function () {
 
     cy.add([...cytoscapeData.nodes, ...cytoscapeData.edges]);
 
-    // Relayout the graph
+    // Use the server's positions when every node has one, and lay out in the browser otherwise
+    const positioned = cytoscapeData.nodes.every((node) => node.position);
     cy.layout({
-      name: "cose",
+      name: positioned ? "preset" : "cose",
     }).run();
 
     // Fit the graph to the viewport
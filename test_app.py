@@ -1,6 +1,43 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+import numpy as np
 from app import create_app
-from app.models import graph, add_entity, get_entity, update_entity, delete_entity, add_relationship
+from app.integrations.database.cache import LRUCache
+from app.integrations.database.caching import CachingDatabaseIntegration
+from app.integrations.database.falkordb import FalkorDBIntegration, create_pool, fulltext_query
+from app.integrations.database import nebulagraph
+from app.integrations.database.memory import InMemoryDatabase
+from app.integrations.database.metrics import LatencyRecorder
+from app.integrations.database.nebulagraph import NebulaGraphIntegration
+from app.integrations.database.sharded import ShardedDatabaseIntegration, shard_of
+from app.integrations.database.shared_memory import ENTITY, SharedMemoryDatabase
+from app.integrations.database.snapshot_file import SnapshotFile, read_snapshot, write_snapshot
+from app.integrations.database.murmur import murmur64, murmur64_batch, murmur64_reference
+from app.integrations.database.write_behind import WriteBehindQueue
+from app import bulk
+from app.analytics import GraphAnalytics, get_graph_analytics
+from app.clustering import ClusterHierarchy, label_propagation
+from app.graph_snapshot import GraphSnapshot
+from app.layout import GraphLayout, exact_repulsion, get_graph_layout, grid_repulsion
+from app.retrieval import assemble_context, candidate_edges, count_tokens
+from app.views import view_keys
+from app.integration_manager import CronSchedule, Scheduler, ScheduledJob
+from app.models import add_entity, add_relationship, get_graph_snapshot, set_database_integration, update_entity
+from datetime import datetime
+from redis import Redis
+from redis.connection import Connection
+from redis.exceptions import ConnectionError as RedisConnectionError
+from types import SimpleNamespace
+from flask import Flask
+from app.signals import AsyncSignalBus, entity_created
+from blinker import signal
 
 class FlaskTestCase(unittest.TestCase):
 
@@ -11,12 +48,6 @@ class FlaskTestCase(unittest.TestCase):
         self.app_context.push()
         self.client = self.app.test_client()
 
-        # Initialize the in-memory data store
-        graph['people'] = {}
-        graph['organizations'] = {}
-        graph['events'] = {}
-        graph['relationships'] = []
-
         # Create initial test data
         self.person_id = add_entity('people', {
             'name': 'John Doe',
@@ -30,11 +61,20 @@ class FlaskTestCase(unittest.TestCase):
             'location': 'Conference Center'
         })
         self.relationship_id = add_relationship({
-            'type': 'employment',
-            'person_id': self.person_id,
-            'organization_id': self.organization_id
+            'relationship': 'Works for',
+            'from_id': self.person_id,
+            'to_id': self.organization_id,
+            'from_type': 'people',
+            'to_type': 'organizations'
         })
 
+    def test_startup_does_not_import_numpy(self):
+        # A fresh interpreter, since this one has NumPy loaded already
+        script = 'import sys; from app import create_app; create_app(); print("numpy" in sys.modules)'
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(result.stdout.split()[-1], 'False')
+
     def tearDown(self):
         # Clear the in-memory data store
         self.app_context.pop()
@@ -127,13 +167,1158 @@ class FlaskTestCase(unittest.TestCase):
 
     def test_create_relationship(self):
         response = self.client.post('/relationship', json={
-            'type': 'partnership',
-            'person_id': self.person_id,
-            'organization_id': self.organization_id
+            'relationship': 'Collaborates on',
+            'from_id': self.person_id,
+            'to_id': self.organization_id,
+            'from_type': 'people',
+            'to_type': 'organizations'
         })
         self.assertEqual(response.status_code, 201)
         data = response.get_json()
         self.assertIn('id', data)
 
+class LRUCacheTestCase(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2, ttl=0)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_expires_entries(self):
+        cache = LRUCache(maxsize=2, ttl=0.01)
+        cache.set('a', 1)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('a'))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['expirations']), (0, 1, 1))
+
+class Murmur64TestCase(unittest.TestCase):
+
+    def test_matches_reference(self):
+        # Every tail length, multi-byte UTF-8 and the empty string
+        names = ['', 'foobar', 'John Doe', 'Zürich 東京', *('x' * n for n in range(1, 25))]
+        expected = [murmur64_reference(name) for name in names]
+        self.assertEqual([murmur64(name) for name in names], expected)
+        self.assertEqual(murmur64_batch(names).tolist(), expected)
+        self.assertEqual(murmur64_batch(names, seed=7).tolist(), [murmur64_reference(name, 7) for name in names])
+
+class WriteBehindQueueTestCase(unittest.TestCase):
+
+    def test_coalesces_per_relation(self):
+        calls = []
+        queue = WriteBehindQueue(lambda *call: calls.append(call) or 'ok', batch_size=100, flush_seconds=60)
+        queue.insert('people', ['id', 'name'], ['p1', 'Ada'])
+        queue.delete('graph', "sourceId = 'p1'")
+        queue.insert('people', ['id', 'name'], ['p2', 'Bob'])
+        self.assertEqual(queue.delete('graph', "targetId = 'p2'"), 4)
+        self.assertEqual(queue.settled, 0)
+        queue.flush()
+        self.assertEqual(queue.settled, 4)
+        self.assertEqual(calls, [
+            ('insert', 'people', (['id', 'name'], [['p1', 'Ada'], ['p2', 'Bob']])),
+            ('delete', 'graph', "(sourceId = 'p1') || (targetId = 'p2')"),
+        ])
+        queue.close()
+
+    def test_retries_failed_calls(self):
+        responses = iter(['Error: unavailable', 'ok'])
+        queue = WriteBehindQueue(lambda *call: next(responses), backoff_seconds=0, enabled=False)
+        queue.upsert('graph', ['sourceId'], ['p1'])
+        stats = queue.stats()
+        self.assertEqual((stats['remote_calls'], stats['retries'], stats['failed_calls']), (2, 1, 0))
+
+    def test_flushes_when_batch_is_full(self):
+        flushed = threading.Event()
+        queue = WriteBehindQueue(lambda *call: flushed.set() or 'ok', batch_size=2, flush_seconds=60)
+        queue.insert('people', ['id'], ['p1'])
+        queue.insert('people', ['id'], ['p2'])
+        self.assertTrue(flushed.wait(5))
+        queue.close()
+
+class CachingDatabaseIntegrationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.db = CachingDatabaseIntegration(InMemoryDatabase(), maxsize=100, ttl=60)
+
+    def test_search_hits_until_type_is_written(self):
+        self.db.add_entity('people', {'data': {'name': 'Ada'}})
+        self.assertEqual(len(self.db.search_entities_with_type('people', {'name': 'ada'})), 1)
+        self.assertEqual(len(self.db.search_entities_with_type('people', {'name': 'ada'})), 1)
+        self.db.add_entity('events', {'data': {'name': 'Ada Day'}})
+        self.db.search_entities_with_type('people', {'name': 'ada'})
+        self.db.add_entity('people', {'data': {'name': 'Ada Lovelace'}})
+        self.assertEqual(len(self.db.search_entities_with_type('people', {'name': 'ada'})), 2)
+        stats = self.db.cache_stats()['methods']['search_entities_with_type']
+        self.assertEqual((stats['hits'], stats['misses']), (2, 2))
+
+    def test_signals_invalidate(self):
+        self.assertEqual(self.db.search_relationships({'relationship': 'knows'}), [])
+        self.db.inner.add_relationship({'relationship': 'Knows', 'from_id': 1, 'to_id': 2})
+        self.assertEqual(self.db.search_relationships({'relationship': 'knows'}), [])
+        entity_created.send(None, entity_type='relationship', entity_id=1)
+        self.assertEqual(len(self.db.search_relationships({'relationship': 'knows'})), 1)
+
+    def test_batch_only_sends_misses(self):
+        self.db.add_entity('people', {'data': {'name': 'Ada'}})
+        self.db.search_entities_with_type('people', {'name': 'ada'})
+        results = self.db.search_entities_with_type_batch('people', [{'name': 'ada'}, {'name': 'bob'}])
+        self.assertEqual([len(r) for r in results], [1, 0])
+        stats = self.db.cache_stats()['methods']['search_entities_with_type']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+class FakeFalkorGraph:
+    # Answers the queries FalkorDBIntegration sends from nodes and edges kept in dicts
+    name = 'mindgraph'
+
+    def __init__(self):
+        self.nodes = {}  # id -> (label, properties)
+        self.edges = []  # (source, type, target, properties)
+        self.queries = []
+
+    def ro_query(self, q, params=None):
+        return self.query(q, params)
+
+    def query(self, q, params=None):
+        self.queries.append(q)
+        params = params or {}
+        if q.startswith('CREATE (n:'):
+            node_id = len(self.nodes)
+            self.nodes[node_id] = (re.match(r'CREATE \(n:`?([^)`]+)', q).group(1), dict(params['attr']))
+            return SimpleNamespace(result_set=[[node_id]])
+        if 'CREATE (src)-[' in q:
+            edge_type = re.search(r'\[(?:e)?:(\w+)', q).group(1)
+            self.edges.append((params['src_id'], edge_type, params['dest_id'], dict(params.get('attr', {}))))
+            return SimpleNamespace(relationships_created=1)
+        if 'max(ID(n))' in q:
+            return SimpleNamespace(result_set=[[max(self.nodes) if self.nodes else None]])
+        if 'ID(n) >= $start' in q:
+            rows = []
+            for node_id in range(params['start'], params['end']):
+                if node_id not in self.nodes:
+                    continue
+                label, properties = self.nodes[node_id]
+                out = [(edge_type, target, self.nodes[target][0], edge)
+                       for source, edge_type, target, edge in self.edges if source == node_id]
+                if 'properties(n)' in q:
+                    rows.append([node_id, label, properties, [list(edge) for edge in out]])
+                else:
+                    rows.append([node_id, label, properties.get('name'), [list(edge[:3]) for edge in out]])
+            return SimpleNamespace(result_set=rows)
+        if 'queryNodes' in q:
+            # Word-prefix matching, as RediSearch does
+            terms = [term.rstrip('*') for term in params['fulltext_query'].split()]
+            candidates = [node_id for node_id, (label, properties) in self.nodes.items()
+                          if label == params['label'] and all(
+                              any(word.startswith(term) for word in re.findall(r'\w+', ' '.join(
+                                  str(properties.get(field, '')) for field in ('name', 'description')).lower()))
+                              for term in terms)]
+        else:
+            label = re.search(r'MATCH \(n:`?([^)`]+)', q).group(1)
+            candidates = [node_id for node_id, (node_label, _) in self.nodes.items() if node_label == label]
+        filters = re.findall(r'n\.`(\w+)`\)\) CONTAINS toLower\(\$(p\d+)\)', q)
+        return SimpleNamespace(result_set=[
+            [SimpleNamespace(id=node_id, labels=[self.nodes[node_id][0]], properties=self.nodes[node_id][1])]
+            for node_id in candidates
+            if all(params[param].lower() in str(self.nodes[node_id][1].get(key, '')).lower() for key, param in filters)])
+
+class FlakyConnection(Connection):
+    # Refuses the first failures connects, then answers every command with PONG
+    failures = 0
+    attempts = 0
+
+    def _connect(self):
+        FlakyConnection.attempts += 1
+        if FlakyConnection.attempts <= FlakyConnection.failures:
+            raise OSError('Connection refused')
+        return object()
+
+    def on_connect_check_health(self, check_health=True):
+        pass
+
+    def send_command(self, *args, **kwargs):
+        pass
+
+    def read_response(self, *args, **kwargs):
+        return 'PONG'
+
+    def disconnect(self, *args, **kwargs):
+        self._sock = None
+
+class FalkorDBIntegrationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # The integration without its connection, on a fake graph
+        self.graph = FakeFalkorGraph()
+        self.db = FalkorDBIntegration.__new__(FalkorDBIntegration)
+        self.db._local = threading.local()
+        self.db._local.graph = self.graph
+        self.db.schema = {'people': {}}
+        self.db.fulltext_labels = {'people'}
+
+    def add_people(self):
+        ada = self.db.add_entity('people', {'data': {'name': 'Ada Lovelace', 'born': 1815}})
+        bob = self.db.add_entity('people', {'data': {'name': 'Bob', 'description': 'Engineer'}})
+        self.db.add_relationship({'from_id': ada, 'to_id': bob, 'relationship': 'knows',
+                                  'snippet': 'Ada knows Bob.', 'from_entity': 'Ada Lovelace', 'to_entity': 'Bob'})
+        return ada, bob
+
+    def test_pool_retries_connects(self):
+        for failures, succeeds in ((2, True), (10, False)):
+            FlakyConnection.failures, FlakyConnection.attempts = failures, 0
+            client = Redis(connection_pool=create_pool(connection_class=FlakyConnection))
+            if succeeds:
+                self.assertTrue(client.ping())
+            else:
+                self.assertRaises(RedisConnectionError, client.ping)
+            # One attempt plus FALKOR_RETRIES retries at most
+            self.assertEqual(FlakyConnection.attempts, min(failures + 1, 4))
+
+    def test_pipeline_falls_back_to_single_queries(self):
+        def failing_pipeline(transaction):
+            pipe = SimpleNamespace(execute_command=lambda *args: None)
+            pipe.execute = lambda: (_ for _ in ()).throw(RuntimeError('unknown schema'))
+            return pipe
+        self.db.db = SimpleNamespace(connection=SimpleNamespace(pipeline=failing_pipeline))
+        self.add_people()
+        results = self.db.search_entities_with_type_batch('people', [{'name': 'ada'}, {'name': 'nobody'},
+                                                                      {'name': 'ovelace'}])
+        self.assertEqual([[entity['name'] for entity in result] for result in results],
+                         [['Ada Lovelace'], [], ['Ada Lovelace']])
+
+    def test_fulltext_query(self):
+        self.assertEqual(fulltext_query(['John Do', 'the a']), 'john* do*')
+        self.assertEqual(fulltext_query(['a of']), '')
+        q, params = self.db._search_entities_with_type_query('people', {'name': 'Ada', 'born': 18})
+        self.assertIn('db.idx.fulltext.queryNodes', q)
+        self.assertEqual(params['fulltext_query'], 'ada*')
+        # Types without a full-text index, and values without usable words, scan the label
+        self.assertIn('MATCH (n:`events`)', self.db._search_entities_with_type_query('events', {'name': 'Ada'})[0])
+        self.assertIn('MATCH (n:`people`)', self.db._search_entities_with_type_query('people', {'name': 'a'})[0])
+
+    def test_fulltext_search_falls_back_to_a_label_scan(self):
+        self.add_people()
+        self.assertEqual(len(self.db.search_entities_with_type('people', {'name': 'love'})), 1)
+        self.assertEqual(len(self.db.search_entities_with_type('people', {'name': 'ada', 'born': '1815'})), 1)
+        # The index matches word prefixes only; fragments from the middle of a word are found by the scan
+        self.assertEqual(len(self.db.search_entities_with_type('people', {'name': 'ovelace'})), 1)
+
+    def test_full_graph_is_complete_and_the_view_is_trimmed(self):
+        ada, bob = self.add_people()
+        graph = self.db.get_full_graph()
+        self.assertEqual(graph['entities']['people'][ada]['data'], {'name': 'Ada Lovelace', 'born': 1815})
+        self.assertEqual(graph['entities']['people'][bob]['data']['description'], 'Engineer')
+        self.assertEqual(graph['relationships'], [{'snippet': 'Ada knows Bob.', 'relationship': 'knows',
+                                                   'from_id': ada, 'to_id': bob, 'from_type': 'people',
+                                                   'to_type': 'people'}])
+        view = self.db.get_graph_view(limit=1)
+        self.assertEqual(view['entities']['people'], {ada: {'entity_type': 'people', 'data': {'id': ada, 'name': 'Ada Lovelace'}}})
+        self.assertEqual(view['relationships'], [])
+
+    def test_bulk_round_trip(self):
+        self.add_people()
+        target = FalkorDBIntegration.__new__(FalkorDBIntegration)
+        target._local = threading.local()
+        target._local.graph = FakeFalkorGraph()
+        # An existing node, so the imported entities get other IDs than they had
+        target._local.graph.nodes[100] = ('people', {'name': 'Existing'})
+        records = list(bulk.from_ndjson(bulk.to_ndjson(bulk.iter_records(self.db))))
+        counts = bulk.import_records(target, records)
+        self.assertEqual((counts['entities'], counts['relationships']), (2, 1))
+        # New IDs on the target, every property and the snippet carried over
+        exported, imported = self.db.get_full_graph(), target.get_full_graph()
+        self.assertEqual(sorted(entity['data']['name'] for entity in imported['entities']['people'].values()),
+                         ['Ada Lovelace', 'Bob', 'Existing'])
+        self.assertEqual(imported['entities']['people'][1]['data'], exported['entities']['people'][0]['data'])
+        self.assertEqual([(r['from_id'], r['to_id'], r['snippet']) for r in imported['relationships']],
+                         [(1, 2, 'Ada knows Bob.')])
+
+    def test_import_drops_the_source_backend_id(self):
+        memory = InMemoryDatabase(snapshot_path='')
+        bulk.import_records(memory, [{'kind': 'entity', 'type': 'people', 'id': '7', 'data': {'id': 7, 'name': 'Ada'}},
+                                     {'kind': 'entity', 'type': 'people', 'id': '8', 'data': {'id': 'x', 'name': 'Bob'}}])
+        self.assertEqual([entity['data'] for entity in memory.get_all_entities('people').values()],
+                         [{'name': 'Ada'}, {'id': 'x', 'name': 'Bob'}])
+
+class FakeNebulaValue:
+
+    def __init__(self, value):
+        self.value = value
+
+    def is_null(self):
+        return self.value is None
+
+    def cast(self):
+        return self.value
+
+class FakeNebulaResult:
+
+    def __init__(self, rows=(), error=None):
+        self.rows = list(rows)
+        self.error = error
+
+    def is_succeeded(self):
+        return self.error is None
+
+    def error_msg(self):
+        return self.error
+
+    def keys(self):
+        return list(self.rows[0]) if self.rows else []
+
+    def column_values(self, key):
+        return [FakeNebulaValue(row.get(key)) for row in self.rows]
+
+    def row_size(self):
+        return len(self.rows)
+
+class FakeSessionPool:
+    # Records every query and answers it with the first handler whose pattern matches
+
+    def __init__(self):
+        self.queries = []
+        self.handlers = []
+
+    def on(self, pattern, answer):
+        self.handlers.append((re.compile(pattern), answer))
+
+    def execute(self, query):
+        self.queries.append(query)
+        for pattern, answer in self.handlers:
+            if pattern.search(query):
+                return answer(query) if callable(answer) else answer
+        return FakeNebulaResult()
+
+class NebulaGraphIntegrationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # The integration without its connection and schema checks, on a fake session pool
+        self.pool = FakeSessionPool()
+        self.db = NebulaGraphIntegration.__new__(NebulaGraphIntegration)
+        self.db.client = self.pool
+        self.db.latency = LatencyRecorder()
+        self.db._fanout_executor = None
+        self.db.schema = {'people': {}}
+        self.db.edge_types = ['knows']
+        self.db.fulltext_indexes = {}
+        self.db.version = 0
+        self.db._version_lock = threading.Lock()
+        self.db.entity_cache = LRUCache(100, 0)
+        self.db.search_cache = LRUCache(100, 0)
+        self.db.graph_cache = LRUCache(1, 0)
+        self.people = {murmur64(name): name for name in ['Ada', 'Alan', 'Bob', 'Carol', 'Dan']}
+        self.pool.on(r'^LOOKUP ON `people`', self.lookup)
+
+    def lookup(self, query):
+        # The people whose vertex id is after the cursor, sorted by id, one page
+        after = re.search(r'WHERE \$-\.id > (-?\d+)', query)
+        rows = sorted(({'id': vid, 'name': name, 'description': None} for vid, name in self.people.items()),
+                      key=lambda row: row['id'])
+        if after:
+            rows = [row for row in rows if row['id'] > int(after.group(1))]
+        return FakeNebulaResult(rows[:int(re.search(r'LIMIT (\d+);$', query).group(1))])
+
+    def lookups(self):
+        return [query for query in self.pool.queries if query.startswith('LOOKUP')]
+
+    def test_lookup_queries(self):
+        self.assertIn('WHERE `people`.name STARTS WITH "Ada" YIELD', self.db._lookup_query(
+            'people', {'name': 'Ada'}, ['name', 'description'], 'id(vertex) AS id'))
+        self.db.fulltext_indexes['people'] = 'nebula_tag_people'
+        self.assertIn('WHERE ES_QUERY(nebula_tag_people, "ada*") YIELD', self.db._lookup_query(
+            'people', {'name': 'Ada'}, ['name', 'description'], 'id(vertex) AS id'))
+        del self.db.fulltext_indexes['people']
+        self.addCleanup(setattr, nebulagraph, 'NEBULA_SEARCH_MATCH', nebulagraph.NEBULA_SEARCH_MATCH)
+        nebulagraph.NEBULA_SEARCH_MATCH = 'contains'
+        self.assertEqual(self.db._lookup_query('people', {'name': 'Ada'}, ['name'], 'id(vertex) AS id'),
+                         'LOOKUP ON `people` YIELD id(vertex) AS id | WHERE toLower($-.name) CONTAINS "ada"')
+        self.assertIsNone(self.db._lookup_query('people', {'email': 'a@b.c'}, ['name'], 'id(vertex) AS id'))
+
+    def test_pages_continue_after_the_last_vertex_id(self):
+        rows = list(self.db._paged_rows('LOOKUP ON `people` YIELD id(vertex) AS id', cursor='id', page_size=2))
+        self.assertEqual([row['id'] for row in rows], sorted(self.people))
+        second = sorted(self.people)[1]
+        self.assertEqual(self.lookups(), [
+            'LOOKUP ON `people` YIELD id(vertex) AS id | ORDER BY $-.id | LIMIT 2;',
+            f'LOOKUP ON `people` YIELD id(vertex) AS id | WHERE $-.id > {second} | ORDER BY $-.id | LIMIT 2;',
+            f'LOOKUP ON `people` YIELD id(vertex) AS id | WHERE $-.id > {sorted(self.people)[3]} | ORDER BY $-.id | LIMIT 2;',
+        ])
+        list(self.db._paged_rows('GO FROM 1 OVER * YIELD src(edge) AS from_id', order=('from_id', 'to_id')))
+        self.assertEqual(self.pool.queries[-1],
+                         'GO FROM 1 OVER * YIELD src(edge) AS from_id | ORDER BY $-.from_id, $-.to_id | LIMIT 0, 1000;')
+
+    def test_writes_invalidate_cached_searches(self):
+        self.assertEqual([person['name'] for person in self.db.search_entities({'name': 'Ad'})], ['Ada'])
+        self.db.search_entities({'name': 'Ad'})
+        self.assertEqual(len(self.lookups()), 1)
+        self.assertEqual(self.db.get_entity('people', murmur64('Ada'))['data']['name'], 'Ada')
+
+        self.pool.on(r'^INSERT VERTEX', FakeNebulaResult())
+        vid = self.db.add_entity('people', {'data': {'name': 'Adam'}})
+        self.assertEqual(self.pool.queries[-1], f'INSERT VERTEX `people`(name, description) VALUES {vid}:("Adam", "");')
+        self.people[int(vid)] = 'Adam'
+        self.assertEqual({person['name'] for person in self.db.search_entities({'name': 'Ad'})}, {'Ada', 'Adam'})
+        self.assertEqual(len(self.lookups()), 2)
+
+    def test_delete_entity(self):
+        ada, bob = murmur64('Ada'), murmur64('Bob')
+        self.pool.on(r'^FETCH PROP ON `people` %d ' % ada, FakeNebulaResult([{'id': ada}]))
+        self.pool.on(r'^GO FROM %d OVER \* BIDIRECT .* MINUS' % ada, FakeNebulaResult([{'associated_node': bob}]))
+        self.pool.on(r'^DELETE VERTEX', FakeNebulaResult())
+        self.db._cache_entity('people', ada, {'name': 'Ada', 'description': ''})
+        self.db._cache_entity('people', bob, {'name': 'Bob', 'description': ''})
+        version = self.db.version
+
+        self.assertTrue(self.db.delete_entity('people', str(ada)))
+        self.assertEqual(self.pool.queries[-1], f'DELETE VERTEX {ada}, {bob} WITH EDGE;')
+        self.assertIsNone(self.db.entity_cache.get(ada))
+        self.assertIsNone(self.db.entity_cache.get(bob))
+        self.assertGreater(self.db.version, version)
+
+        self.assertFalse(self.db.delete_entity('people', murmur64('Carol')))
+        self.assertFalse(self.pool.queries[-1].startswith('DELETE'))
+
+class FakeNexusDB:
+    # lookup on the graph relation returns rows, one cell per GRAPH_FIELDS entry
+
+    def __init__(self):
+        self.rows = []
+        self.error = None
+
+    def lookup(self, relation, fields=None, condition=''):
+        if self.error:
+            raise self.error
+        return json.dumps({'rows': [[{'Str': cell} for cell in row] for row in self.rows]})
+
+class NexusDBIntegrationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        try:
+            from app.integrations.database import nexus
+        except ImportError:
+            self.skipTest('typeid or nexus_python is not installed')
+        self.addCleanup(setattr, nexus, 'NEXUSDB_SNAPSHOT_PATH', nexus.NEXUSDB_SNAPSHOT_PATH)
+        nexus.NEXUSDB_SNAPSHOT_PATH = ''
+        # The integration without its connection and loader thread
+        self.db = nexus.NexusDBIntegration.__new__(nexus.NexusDBIntegration)
+        self.db.nexus_db = FakeNexusDB()
+        self.db._sync_lock = threading.Lock()
+        self.db._write_lock = threading.RLock()
+        self.db._loaded = threading.Event()
+        self.db._attempted = threading.Event()
+        self.db.sync_error = None
+        self.db.high_water_mark = ''
+        self.db.graph = {'entities': {}, 'relationships': []}
+        self.db._unsent = {}
+        # Holds every write until it is flushed by hand
+        self.db.writes = WriteBehindQueue(lambda *call: 'ok', batch_size=1000, flush_seconds=3600)
+        self.addCleanup(self.db.writes.close)
+        self.ada, self.bob, self.cy = (str(nexus.TypeID(prefix='people')) for _ in range(3))
+        set_database_integration(self.db)
+        self.addCleanup(set_database_integration, InMemoryDatabase())
+
+    def test_failed_first_sync_does_not_block_waiters(self):
+        self.db.nexus_db.error = ConnectionError('NexusDB is unreachable')
+        self.assertFalse(self.db.sync())
+        self.assertFalse(self.db.wait_until_loaded())
+        self.assertIsInstance(self.db.sync_error, ConnectionError)
+
+    def test_sync_invalidates_the_snapshot(self):
+        self.db.nexus_db.rows = [['knows', '', self.ada, 'Ada', self.bob, 'Bob']]
+        self.assertTrue(self.db.sync())
+        self.assertTrue(self.db.wait_until_loaded())
+        self.assertEqual(get_graph_snapshot().neighbors(self.ada), [self.bob])
+        # A relationship between known entities only comes with a full sync
+        self.db.nexus_db.rows.append(['admires', '', self.bob, 'Bob', self.ada, 'Ada'])
+        self.assertTrue(self.db.sync(full=True))
+        self.assertEqual(get_graph_snapshot().edge_count, 2)
+        version = get_graph_snapshot().version
+        self.assertTrue(self.db.sync(full=True))
+        self.assertEqual(get_graph_snapshot().version, version)
+
+    def test_sync_merges_entity_data_field_by_field(self):
+        self.db.nexus_db.rows = [['knows', '', self.ada, 'Ada', self.bob, 'Bob']]
+        self.assertTrue(self.db.sync())
+        self.db.graph['entities']['People'][self.ada]['data']['description'] = 'Mathematician'
+        self.db.sync(full=True)
+        ada = self.db.graph['entities']['People'][self.ada]['data']
+        self.assertEqual((ada['name'], ada['description']), ('Ada', 'Mathematician'))
+
+    def test_full_sync_removes_remote_deletions(self):
+        self.db.nexus_db.rows = [['knows', '', self.ada, 'Ada', self.bob, 'Bob'],
+                                 ['knows', '', self.bob, 'Bob', self.cy, 'Cy']]
+        self.assertTrue(self.db.sync())
+        self.assertEqual(get_graph_snapshot().edge_count, 2)
+        self.db.nexus_db.rows = self.db.nexus_db.rows[:1]
+        self.assertTrue(self.db.sync(full=True))
+        self.assertEqual(get_graph_snapshot().edge_count, 1)
+        self.assertEqual(sorted(self.db.graph['entities']['People']), sorted([self.ada, self.bob]))
+
+    def test_sync_keeps_unsent_writes(self):
+        self.db.nexus_db.rows = [['knows', '', self.ada, 'Ada', self.bob, 'Bob']]
+        self.assertTrue(self.db.sync())
+        self.db.update_entity('People', self.ada, {'data': {'name': 'Ada Lovelace'}})
+        self.db.add_relationship({'from_id': self.bob, 'to_id': self.ada, 'relationship': 'admires',
+                                  'from_entity': 'Bob', 'to_entity': 'Ada Lovelace'})
+        self.db.sync(full=True)
+        self.assertEqual(self.db.graph['entities']['People'][self.ada]['data']['name'], 'Ada Lovelace')
+        self.assertEqual(len(self.db.graph['relationships']), 2)
+        # Once sent, the remote rows win again
+        self.db.writes.flush()
+        self.db.sync(full=True)
+        self.assertEqual(self.db.graph['entities']['People'][self.ada]['data']['name'], 'Ada')
+        self.assertEqual(len(self.db.graph['relationships']), 1)
+
+class SharedMemoryDatabaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, 'graph')
+        # Two handles on one region stand in for two worker processes
+        self.first = SharedMemoryDatabase(path, initial_bytes=4096)
+        self.second = SharedMemoryDatabase(path, initial_bytes=4096)
+
+    def tearDown(self):
+        self.first.close()
+        self.second.close()
+        self.directory.cleanup()
+
+    def test_writes_are_visible_to_every_handle(self):
+        ids = [db.add_entity('people', {'data': {'name': f'Person {i}'}})
+               for i, db in enumerate([self.first, self.second] * 50)]
+        self.assertEqual(len(set(ids)), 100)
+        self.assertEqual(self.second.get_entity('people', ids[0]), {'data': {'name': 'Person 0'}})
+        self.assertEqual(len(self.first.get_all_entities('people')), 100)
+        self.assertEqual(len(self.first.search_entities_with_type('people', {'name': 'person 1'})), 11)
+        self.assertGreater(self.first.stats()['bytes_mapped'], 4096)
+
+    def test_update_and_delete(self):
+        ada = self.first.add_entity('people', {'data': {'name': 'Ada'}})
+        bob = self.first.add_entity('people', {'data': {'name': 'Bob'}})
+        self.first.add_relationship({'from_id': ada, 'to_id': bob, 'relationship': 'Knows'})
+
+        self.assertTrue(self.second.update_entity('people', ada, {'data': {'name': 'Ada Lovelace'}}))
+        self.assertEqual(self.first.search_entities({'name': 'lovelace'})[0]['id'], ada)
+        self.assertFalse(self.second.update_entity('events', ada, {'data': {}}))
+
+        self.assertTrue(self.second.delete_entity('people', str(bob)))
+        self.assertIsNone(self.first.get_entity('people', bob))
+        self.assertEqual(self.first.search_relationships({'relationship': 'knows'}), [])
+        self.assertEqual(self.first.stats()['dead_records'], 3)
+
+    def test_failed_writes_leave_no_trace(self):
+        ada = self.first.add_entity('people', {'data': {'name': 'Ada'}})
+        bob = self.first.add_entity('people', {'data': {'name': 'Bob'}})
+        self.first.add_relationship({'from_id': ada, 'to_id': bob, 'relationship': 'Knows'})
+        # Not JSON serializable: the update fails before anything is published
+        self.assertRaises(TypeError, self.first.update_entity, 'people', ada, {'data': {'name': 'Ada', 'tags': {1, 2}}})
+        self.assertEqual(self.first.get_entity('people', ada), {'data': {'name': 'Ada'}})
+        # The next write reuses the failed write's generation
+        self.second.add_entity('people', {'data': {'name': 'Eve'}})
+        self.assertEqual(self.first.get_entity('people', ada), {'data': {'name': 'Ada'}})
+
+        original = self.first._delete_record
+        def failing_delete(state, record):
+            if record.kind == ENTITY:
+                raise OSError('No space left on device')
+            original(state, record)
+        self.first._delete_record = failing_delete
+        self.assertRaises(OSError, self.first.delete_entity, 'people', bob)
+        self.second.add_entity('people', {'data': {'name': 'Dan'}})
+        self.assertEqual(len(self.first.search_relationships({'relationship': 'knows'})), 1)
+        self.assertEqual(self.first.stats()['dead_records'], 0)
+
+class ShardedDatabaseIntegrationTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.db = ShardedDatabaseIntegration(shard_count=3)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db.close()
+
+    def test_scatter_gather(self):
+        ids = [self.db.add_entity('people', {'data': {'name': f'Sharded {i}'}}) for i in range(30)]
+        self.assertGreater(len({shard_of(entity_id, 3) for entity_id in ids}), 1)
+        self.assertEqual([result['id'] for result in self.db.search_entities_with_type('people', {'name': 'sharded'})], ids)
+        self.assertEqual(self.db.get_entity('people', ids[7]), {'data': {'name': 'Sharded 7'}})
+        results = self.db.search_entities_with_type_batch('people', [{'name': 'sharded 2'}, {'name': 'nobody'}])
+        self.assertEqual([len(result) for result in results], [11, 0])
+
+    def test_relationships_across_shards(self):
+        ada, bob, eve = (self.db.add_entity('people', {'data': {'name': name}}) for name in ('Ada', 'Bob', 'Eve'))
+        self.db.add_relationship({'from_id': ada, 'to_id': bob, 'relationship': 'Mentors'})
+        self.db.add_relationship({'from_id': bob, 'to_id': eve, 'relationship': 'Mentors'})
+        self.assertEqual(len(self.db.search_relationships({'relationship': 'mentors'})), 2)
+
+        neighbors = self.db.get_neighbors(ada, depth=2)
+        self.assertEqual(len(neighbors['relationships']), 2)
+        self.assertEqual(set(neighbors['entities']['people']), {ada, bob, eve})
+
+        self.assertTrue(self.db.delete_entity('people', str(bob)))
+        self.assertEqual(self.db.search_relationships({'relationship': 'mentors'}), [])
+        self.assertEqual(self.db.get_neighbors(ada)['relationships'], [])
+
+class AsyncSignalBusTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.bus = AsyncSignalBus(workers=2)
+        self.signal = signal(f'test-{self.id()}')
+
+    def tearDown(self):
+        self.bus.close()
+
+    def test_handlers_run_off_the_sending_thread_in_batches(self):
+        release = threading.Event()
+        batches = []
+
+        def handler(events):
+            release.wait(5)
+            batches.append([kwargs['n'] for _, kwargs in events])
+
+        self.bus.connect(self.signal, handler, batch=True, batch_size=10)
+        for n in range(25):
+            self.signal.send(self, n=n)
+        release.set()
+        self.assertTrue(self.bus.flush(5))
+        self.assertEqual(sum(batches, []), list(range(25)))
+        self.assertLessEqual(max(len(batch) for batch in batches), 10)
+        self.assertLess(len(batches), 25)
+
+    def test_failures_and_drops_are_counted(self):
+        release = threading.Event()
+
+        def failing(sender, **kwargs):
+            release.wait(5)
+            raise ValueError(kwargs['n'])
+
+        receiver = self.bus.connect(self.signal, failing, queue_size=2, block_seconds=0)
+        for n in range(5):
+            self.signal.send(self, n=n)
+        release.set()
+        self.assertTrue(self.bus.flush(5))
+        stats = receiver.stats()
+        self.assertEqual(stats['received'] + stats['dropped'], 5)
+        self.assertGreater(stats['dropped'], 0)
+        self.assertEqual(stats['failures'], stats['received'])
+
+class SchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = Scheduler(Flask(__name__), workers=2)
+
+    def tearDown(self):
+        self.scheduler.shutdown()
+
+    def test_interval_jobs_run_without_overlapping(self):
+        release = threading.Event()
+        runs = []
+
+        def slow(app):
+            runs.append(app.name)
+            release.wait(5)
+
+        self.scheduler.add(ScheduledJob('slow', slow, interval=0.01))
+        time.sleep(0.2)
+        release.set()
+        time.sleep(0.05)
+        stats = self.scheduler.stats()['slow']
+        self.assertEqual(runs[0], __name__)
+        self.assertGreater(stats['skipped'], 0)
+        self.assertGreaterEqual(stats['runs'], 1)
+
+    def test_failures_are_counted(self):
+        self.scheduler.add(ScheduledJob('failing', lambda app: 1 / 0, interval=0.01))
+        time.sleep(0.1)
+        stats = self.scheduler.stats()['failing']
+        self.assertGreater(stats['failures'], 0)
+        self.assertIn('ZeroDivisionError', stats['last_error'])
+
+    def test_cron_schedule(self):
+        schedule = CronSchedule('*/15 9-17 * * 1-5')
+        # Friday 17:50 -> Monday 09:00
+        self.assertEqual(schedule.next_after(datetime(2024, 3, 1, 17, 50)), datetime(2024, 3, 4, 9, 0))
+        self.assertEqual(schedule.next_after(datetime(2024, 3, 4, 9, 0, 30)), datetime(2024, 3, 4, 9, 15))
+        with self.assertRaises(ValueError):
+            CronSchedule('* * *')
+
+class GraphSnapshotTestCase(unittest.TestCase):
+
+    def setUp(self):
+        graph = {
+            'entities': {'people': {1: {}, 2: {}, 3: {}}, 'organizations': {'4': {}, 5: {}}},
+            'relationships': [
+                {'from_id': 1, 'to_id': 2, 'relationship': 'knows'},
+                {'from_id': 2, 'to_id': 3, 'relationship': 'knows'},
+                {'from_id': '3', 'to_id': 4, 'relationship': 'works at'},
+                {'from_id': 1, 'to_id': 99, 'relationship': 'knows'},
+            ],
+        }
+        self.snapshot = GraphSnapshot.from_graph(graph)
+
+    def test_structure(self):
+        self.assertEqual((self.snapshot.node_count, self.snapshot.edge_count), (5, 3))
+        self.assertEqual(self.snapshot.skipped_relationships, 1)
+        self.assertEqual(self.snapshot.out_degree().tolist(), [1, 1, 1, 0, 0])
+        self.assertEqual(self.snapshot.in_degree().tolist(), [0, 1, 1, 1, 0])
+        self.assertEqual(self.snapshot.relationship_names, ['knows', 'works at'])
+        self.assertEqual(self.snapshot.neighbors(2), [1, 3])
+        self.assertEqual(self.snapshot.neighbors(2, direction='out'), [3])
+
+    def test_compiles_while_entities_are_added(self):
+        db = InMemoryDatabase()
+        db.add_entities('people', [{'data': {'name': f'Person {i}'}} for i in range(20000)])
+        stop = threading.Event()
+        def writer():
+            while not stop.is_set():
+                db.add_entities('people', [{'data': {'name': 'New'}}])
+                db.add_relationships([{'from_id': 1, 'to_id': 2, 'relationship': 'knows'}])
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            for _ in range(3):
+                snapshot = GraphSnapshot.from_graph(db.get_full_graph())
+                self.assertEqual(len(snapshot.node_types), snapshot.node_count)
+                self.assertEqual(len(snapshot.names), snapshot.node_count)
+        finally:
+            stop.set()
+            thread.join()
+
+    def test_traversal(self):
+        self.assertEqual(self.snapshot.bfs([1]).tolist(), [0, 1, 2, 3, -1])
+        self.assertEqual(self.snapshot.bfs([4], direction='out').tolist(), [-1, -1, -1, 0, -1])
+        self.assertEqual(self.snapshot.neighborhood(1, depth=2), [1, 2, 3])
+
+    def test_models_rebuild_per_version(self):
+        set_database_integration(InMemoryDatabase())
+        first = get_graph_snapshot()
+        self.assertIs(get_graph_snapshot(), first)
+        ada = add_entity('people', {'data': {'name': 'Ada'}})
+        bob = add_entity('people', {'data': {'name': 'Bob'}})
+        add_relationship({'from_id': ada, 'to_id': bob, 'relationship': 'knows'})
+        snapshot = get_graph_snapshot()
+        self.assertIsNot(snapshot, first)
+        self.assertEqual(snapshot.neighbors(ada), [bob])
+
+    def test_models_rebuild_after_writes_of_other_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'graph')
+            first = SharedMemoryDatabase(path, initial_bytes=4096)
+            second = SharedMemoryDatabase(path, initial_bytes=4096)
+            try:
+                set_database_integration(first)
+                self.assertEqual(get_graph_snapshot().node_count, 0)
+                # Written by another worker: this process's models never saw the write
+                second.add_entity('people', {'data': {'name': 'Ada'}})
+                self.assertEqual(get_graph_snapshot().node_count, 1)
+                second.add_entity('people', {'data': {'name': 'Bob'}})
+                self.assertEqual(get_graph_snapshot().node_count, 2)
+            finally:
+                set_database_integration(InMemoryDatabase())
+                first.close()
+                second.close()
+
+    def test_models_rebuild_after_updates(self):
+        set_database_integration(InMemoryDatabase())
+        alice = add_entity('people', {'data': {'name': 'Alice'}})
+        self.assertEqual(get_graph_snapshot().name(0), 'Alice')
+        self.assertTrue(update_entity('people', alice, {'data': {'name': 'Bob'}}))
+        self.assertEqual(get_graph_snapshot().name(0), 'Bob')
+
+class GraphAnalyticsTestCase(unittest.TestCase):
+
+    def test_pagerank_and_components(self):
+        # A 3-cycle, a star pointing at 10 and a lone node
+        graph = {
+            'entities': {'people': {i: {} for i in [1, 2, 3, 10, 11, 12, 20]}},
+            'relationships': [{'from_id': a, 'to_id': b} for a, b in [(1, 2), (2, 3), (3, 1), (11, 10), (12, 10)]],
+        }
+        analytics = GraphAnalytics(GraphSnapshot.from_graph(graph))
+        self.assertAlmostEqual(analytics.pagerank.sum(), 1.0)
+        self.assertAlmostEqual(analytics.score(1), analytics.score(2))
+        self.assertGreater(analytics.score(10), analytics.score(11))
+        self.assertEqual([entity_id for entity_id, _, _ in analytics.top(analytics.pagerank, limit=7)][-3:],
+                         [11, 12, 20])
+        self.assertEqual(analytics.top(analytics.in_degree, limit=1), [(10, 'people', 2)])
+        self.assertEqual([component['size'] for component in analytics.component_list()], [3, 3, 1])
+        self.assertEqual(analytics.component_list(limit=1, smallest_first=True)[0]['members'], [20])
+
+    def test_cached_per_version(self):
+        set_database_integration(InMemoryDatabase())
+        first = get_graph_analytics()
+        self.assertIs(get_graph_analytics(), first)
+        add_entity('people', {'data': {'name': 'Ada'}})
+        self.assertIs(get_graph_analytics(wait=False), first)
+        self.assertEqual(get_graph_analytics().snapshot.node_count, 1)
+
+    def test_routes(self):
+        client = create_app().test_client()
+        ada = client.post('/people', json={'data': {'name': 'Ada'}}).json['id']
+        bob = client.post('/people', json={'data': {'name': 'Bob'}}).json['id']
+        client.post('/relationship', json={'from_id': ada, 'to_id': bob, 'relationship': 'knows'})
+        get_graph_analytics()
+        top = client.get('/analytics/pagerank?type=people&limit=1').json['results']
+        self.assertEqual((top[0]['id'], top[0]['name']), (bob, 'Bob'))
+        self.assertEqual(client.get('/analytics/degree?direction=out').json['results'][0]['id'], ada)
+        self.assertEqual(client.get('/analytics/degree?direction=sideways').status_code, 400)
+        self.assertEqual(client.get('/analytics/components').json['count'], 1)
+
+class BulkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.source = InMemoryDatabase()
+        people = self.source.add_entities('people', [{'data': {'name': name}} for name in ['Ada', 'Bob', 'Cy']])
+        self.source.add_relationships([
+            {'from_id': people[0], 'to_id': people[1], 'relationship': 'knows'},
+            {'from_id': people[1], 'to_id': people[2], 'relationship': 'knows'},
+        ])
+
+    def assertCopied(self, target):
+        graph = target.get_full_graph()
+        names = {entity_id: entity['data']['name'] for entity_id, entity in graph['entities']['people'].items()}
+        self.assertEqual(sorted(names.values()), ['Ada', 'Bob', 'Cy'])
+        edges = sorted((names[r['from_id']], names[r['to_id']], r['relationship']) for r in graph['relationships'])
+        self.assertEqual(edges, [('Ada', 'Bob', 'knows'), ('Bob', 'Cy', 'knows')])
+
+    def test_ndjson_round_trip_remaps_ids(self):
+        lines = list(bulk.to_ndjson(bulk.iter_records(self.source)))
+        self.assertEqual(len(lines), 5)
+        target = InMemoryDatabase()
+        target.add_entity('places', {'data': {'name': 'Paris'}})  # shifts the new IDs
+        counts = bulk.import_records(target, bulk.from_ndjson(lines), batch_size=2)
+        self.assertEqual((counts['entities'], counts['relationships']), (3, 2))
+        self.assertCopied(target)
+
+    def test_skips_dangling_relationships(self):
+        records = [{'kind': 'relationship', 'from_id': 1, 'to_id': 2, 'relationship': 'knows'}]
+        self.assertEqual(bulk.import_records(InMemoryDatabase(), records)['skipped_relationships'], 1)
+
+    def test_parquet_round_trip(self):
+        try:
+            bulk.require_pyarrow()
+        except RuntimeError:
+            self.skipTest('pyarrow is not installed')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'graph.parquet')
+            self.assertEqual(bulk.export_file(self.source, path, batch_size=2), 5)
+            target = InMemoryDatabase()
+            bulk.import_records(target, bulk.read_file(path, batch_size=2))
+            self.assertCopied(target)
+
+    def test_routes(self):
+        app = create_app()
+        set_database_integration(self.source)
+        client = app.test_client()
+        export = client.get('/bulk/export').data
+        set_database_integration(InMemoryDatabase())
+        response = client.post('/bulk/import', data=export, content_type='application/x-ndjson')
+        self.assertEqual(response.json['relationships'], 2)
+        self.assertEqual(client.get('/bulk/export?format=csv').status_code, 400)
+
+class SnapshotFileTestCase(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'graph.snapshot')
+
+    def test_round_trip(self):
+        graph = {
+            'entities': {
+                'people': {
+                    1: {'data': {'name': 'Ada', 'age': 36, 'score': 0.5, 'active': True, 'tags': ['a', 'b']}},
+                    2: {'data': {'name': 'Bob', 'age': None}, 'entity_type': 'people'},
+                    3: {'entity_type': 'people'},
+                },
+                'Organization': {'organization_01h': {'data': {'name': 'Acme', 'size': 10**30}}},
+            },
+            'relationships': [
+                {'from_id': 1, 'to_id': 2, 'relationship': 'knows', 'snippet': 'Ada knows Bob'},
+                {'from_id': 2, 'to_id': 'organization_01h', 'relationship': 'works_at'},
+            ],
+        }
+        write_snapshot(self.path, graph, {'source': 'test'})
+        loaded, metadata = read_snapshot(self.path)
+        self.assertEqual(metadata, {'source': 'test'})
+        self.assertEqual(loaded['entities']['people'][2], graph['entities']['people'][2])
+        self.assertEqual(loaded['relationships'][1], graph['relationships'][1])
+        self.assertEqual({entity_type: dict(entities.items()) for entity_type, entities in loaded['entities'].items()},
+                         graph['entities'])
+        self.assertEqual(list(loaded['relationships']), graph['relationships'])
+        self.assertEqual(SnapshotFile(self.path).stats()['entities'], 4)
+
+    def test_writes_during_materialize(self):
+        write_snapshot(self.path, {'entities': {'people': {i: {'data': {'name': f'P{i}'}} for i in range(100)}},
+                                   'relationships': []})
+        people = read_snapshot(self.path)[0]['entities']['people']
+        self.assertIn(5, people)
+        block = people._block
+        writer = threading.Thread(target=lambda: people.__setitem__(100, {'data': {'name': 'New'}}))
+
+        class WriteWhileDecoding(list):
+            # A request thread writes while the records are being collected
+            def __getitem__(self, row):
+                if not writer.is_alive() and writer.ident is None:
+                    writer.start()
+                    writer.join(0.1)
+                return list.__getitem__(self, row)
+
+        people._block = SimpleNamespace(records=lambda: WriteWhileDecoding(block.records()))
+        records = people.materialize()
+        writer.join()
+        self.assertEqual(records[100], {'data': {'name': 'New'}})
+        self.assertEqual(len(records), 101)
+
+    def test_memory_warm_start(self):
+        db = InMemoryDatabase(snapshot_path=self.path)
+        ada, bob = db.add_entities('people', [{'data': {'name': 'Ada'}}, {'data': {'name': 'Bob'}}])
+        db.add_relationship({'from_id': ada, 'to_id': bob, 'relationship': 'knows'})
+        db.save_snapshot()
+
+        warm = InMemoryDatabase(snapshot_path=self.path)
+        self.assertEqual(warm.get_entity('people', bob), {'data': {'name': 'Bob'}})
+        self.assertEqual(warm.search_entities({'name': 'ad'})[0]['id'], ada)
+        self.assertGreater(warm.add_entity('people', {'data': {'name': 'Cy'}}), bob)
+        self.assertTrue(warm.update_entity('people', ada, {'data': {'name': 'Ada L.'}}))
+        self.assertTrue(warm.delete_entity('people', bob))
+        warm.save_snapshot()
+
+        graph = InMemoryDatabase(snapshot_path=self.path).get_full_graph()
+        self.assertEqual(sorted(entity['data']['name'] for entity in graph['entities']['people'].values()),
+                         ['Ada L.', 'Cy'])
+        self.assertEqual(len(graph['relationships']), 0)
+
+    def test_lazy_graph_routes(self):
+        db = InMemoryDatabase()
+        db.add_entities('people', [{'data': {'name': 'Ada'}}])
+        db.save_snapshot(self.path)
+        client = create_app().test_client()
+        set_database_integration(InMemoryDatabase(snapshot_path=self.path))
+        self.assertEqual([entity['data']['name'] for entity in client.get('/people').json.values()], ['Ada'])
+
+    def test_nebula_seed_caches(self):
+        from app.integrations.database.nebulagraph import NebulaGraphIntegration
+        nebula = NebulaGraphIntegration.__new__(NebulaGraphIntegration)
+        nebula.nebula_space = 'mindgraph'
+        nebula.version = 0
+        nebula.latency = LatencyRecorder()
+        nebula.entity_cache, nebula.graph_cache = LRUCache(10, 0), LRUCache(2, 0)
+        write_snapshot(self.path, {
+            'entities': {'Person': {
+                7: {'entity_type': 'Person', 'data': {'name': 'Ada'}},
+                9: {'entity_type': 'Person', 'data': {'name': 'Bob'}},
+            }},
+            'relationships': [{'from_id': 7, 'to_id': 9, 'relationship': 'knows', 'snippet': ''}],
+        }, {'space': 'mindgraph', 'limit': 2000})
+        self.assertTrue(nebula.seed_caches(self.path))
+        # Keyed by vertex id, like searches; only the view renumbers the vertices
+        graph = nebula.get_full_graph()
+        self.assertEqual(graph['relationships'][0]['from_entity'], 'Ada')
+        self.assertEqual(graph['relationships'][0]['to_id'], 9)
+        self.assertEqual(nebula.entity_cache.get(9), {'entity_type': 'Person', 'data': {'name': 'Bob'}})
+        view = nebula.get_graph_view()
+        self.assertEqual(view['relationships'][0]['to_id'], 1)
+        self.assertEqual(view['entities']['Person'][1]['entity_id'], 9)
+        self.assertEqual(view_keys(view), {'7': '0', '9': '1'})
+
+class GraphLayoutTestCase(unittest.TestCase):
+
+    def graph(self, count):
+        return {
+            'entities': {'people': {i: {} for i in range(count)}},
+            'relationships': [{'from_id': i, 'to_id': i + 1} for i in range(count - 1)],
+        }
+
+    def test_grid_repulsion_approximates_exact(self):
+        positions = np.random.default_rng(1).uniform(-20, 20, (400, 2))
+        movable = np.arange(400)
+        exact, approximate = exact_repulsion(positions, movable, 1.0), grid_repulsion(positions, movable, 1.0, 128)
+        cosine = np.einsum('ij,ij->i', exact, approximate) / (
+            np.linalg.norm(exact, axis=1) * np.linalg.norm(approximate, axis=1))
+        self.assertGreater(np.median(cosine), 0.95)
+
+    def test_chain_is_spread_and_incremental_layout_is_stable(self):
+        graph = self.graph(50)
+        layout = GraphLayout(GraphSnapshot.from_graph(graph, 1))
+        neighbors = np.linalg.norm(layout.positions[1:] - layout.positions[:-1], axis=1)
+        self.assertLess(np.median(neighbors), 3)
+        self.assertGreater(np.ptp(layout.positions, axis=0).max(), 5)
+
+        graph['entities']['people'][50] = {}
+        graph['relationships'].append({'from_id': 49, 'to_id': 50})
+        updated = GraphLayout(GraphSnapshot.from_graph(graph, 2), layout)
+        self.assertEqual(updated.moved, 1)
+        np.testing.assert_array_equal(updated.positions[:50], layout.positions)
+        self.assertLess(np.linalg.norm(updated.positions[50] - updated.positions[49]), 5)
+
+    def test_graph_data_has_positions(self):
+        client = create_app().test_client()
+        ada = client.post('/people', json={'data': {'name': 'Ada'}}).json['id']
+        get_graph_layout()
+        data = client.get('/get-graph-data').json
+        self.assertEqual(set(data['positions'][str(ada)]), {'x', 'y'})
+        self.assertNotIn('positions', client.get('/get-graph-data?layout=false').json)
+
+    def test_positions_are_limited_to_the_view(self):
+        layout = GraphLayout(GraphSnapshot.from_graph(self.graph(50), 1))
+        # A sample keyed by entity ID, as FalkorDB's view is
+        sample = {'entities': {'people': {3: {'entity_type': 'people', 'data': {}}, 4: {}}}}
+        self.assertEqual(view_keys(sample), {'3': '3', '4': '4'})
+        positions = layout.to_json(keys=view_keys(sample))
+        self.assertEqual(set(positions), {'3', '4'})
+        self.assertEqual(positions['4'], layout.to_json()['4'])
+        self.assertEqual(layout.to_json(keys={'99': '99'}), {})
+
+    def test_serves_the_previous_layout_while_refreshing(self):
+        set_database_integration(InMemoryDatabase())
+        ada = add_entity('people', {'data': {'name': 'Ada'}})
+        previous = get_graph_layout()
+        bob = add_entity('people', {'data': {'name': 'Bob'}})
+        self.assertIs(get_graph_layout(wait=False), previous)
+        for _ in range(100):
+            if get_graph_layout(wait=False) is not previous:
+                break
+            time.sleep(0.01)
+        current = get_graph_layout(wait=False)
+        self.assertGreater(current.version, previous.version)
+        self.assertEqual(set(current.to_json()), {str(ada), str(bob)})
+        self.assertEqual(current.to_json(keys={str(bob): 'b1'}).keys(), {'b1'})
+
+class ClusterHierarchyTestCase(unittest.TestCase):
+
+    def cliques(self, count, size):
+        # count cliques of size nodes, joined in a ring by one edge each
+        relationships = [{'from_id': c * size + i, 'to_id': c * size + j}
+                         for c in range(count) for i in range(size) for j in range(i + 1, size)]
+        relationships += [{'from_id': c * size, 'to_id': ((c + 1) % count) * size + 1} for c in range(count)]
+        return {'entities': {'people': {i: {} for i in range(count * size)}}, 'relationships': relationships}
+
+    def test_label_propagation_finds_cliques(self):
+        snapshot = GraphSnapshot.from_graph(self.cliques(4, 6))
+        sources = np.repeat(np.arange(snapshot.node_count), snapshot.out_degree())
+        labels = label_propagation(snapshot.node_count, sources, snapshot.indices, np.ones(snapshot.edge_count))
+        self.assertEqual(len(set(labels.tolist())), 4)
+        self.assertTrue(all(len(set(labels[c * 6:(c + 1) * 6].tolist())) == 1 for c in range(4)))
+
+    def test_levels_and_views(self):
+        hierarchy = ClusterHierarchy(GraphSnapshot.from_graph(self.cliques(20, 5)), top_size=10)
+        self.assertEqual(hierarchy.levels[1].count, 20)
+        self.assertLessEqual(hierarchy.levels[-1].count, 10)
+        self.assertEqual(hierarchy.levels[1].internal.sum(), 20 * 10)
+
+        view = hierarchy.view(1, limit=5)
+        self.assertEqual((view['total'], len(view['clusters'])), (20, 5))
+        self.assertTrue(all(cluster['size'] == 5 for cluster in view['clusters']))
+        self.assertEqual(sum(weight for _, _, weight in hierarchy.view(1)['edges']), 20)
+
+        children = hierarchy.children(1, 0)
+        expanded = hierarchy.view(0, children)
+        self.assertEqual(len(expanded['clusters']), 5)
+        self.assertEqual(len(expanded['edges']), 10)
+        self.assertTrue(expanded['external'])
+
+    def test_routes(self):
+        client = create_app().test_client()
+        ids = [client.post('/people', json={'data': {'name': f'P{i}'}}).json['id'] for i in range(4)]
+        for a, b in [(0, 1), (2, 3)]:
+            client.post('/relationship', json={'from_id': ids[a], 'to_id': ids[b], 'relationship': 'knows'})
+        from app.clustering import get_cluster_hierarchy
+        get_cluster_hierarchy()
+        entities = client.get('/view?level=0').json
+        self.assertEqual({node['name'] for node in entities['nodes']}, {'P0', 'P1', 'P2', 'P3'})
+        self.assertEqual(client.get('/view?level=9').status_code, 400)
+        self.assertEqual(client.get('/view/0/0').status_code, 404)
+
+class ContextAssemblyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = create_app().test_client()
+        names = ['Ada', 'Bob', 'Acme', 'Carol', 'Dan']
+        self.ids = {name: self.client.post('/people', json={'data': {'name': name}}).json['id'] for name in names}
+        self.relationships = [
+            ('Ada', 'Bob', 'knows', 'Ada and Bob studied mathematics together.'),
+            ('Bob', 'Acme', 'works at', None),
+            ('Bob', 'Acme', 'works at', None),
+            ('Acme', 'Carol', 'employs', 'Acme employs Carol as an engineer.'),
+            ('Carol', 'Dan', 'knows', None),
+        ]
+        for a, b, label, snippet in self.relationships:
+            relationship = {'from_id': self.ids[a], 'to_id': self.ids[b], 'relationship': label}
+            if snippet:
+                relationship['snippet'] = snippet
+            self.client.post('/relationship', json=relationship)
+        # Compiled up front, as the background analytics refresh would after the writes
+        get_graph_snapshot()
+
+    def test_snapshot_edges(self):
+        snapshot = get_graph_snapshot()
+        bob = snapshot.positions([self.ids['Bob']])
+        edges = snapshot.edges_of(bob)
+        self.assertEqual(len(edges), 3)
+        self.assertEqual({snapshot.relationship(edge)['relationship'] for edge in edges}, {'knows', 'works at'})
+        self.assertTrue(((snapshot.edge_sources(edges) == bob[0]) | (snapshot.indices[edges] == bob[0])).all())
+        edges, hops = candidate_edges(snapshot, bob, max_hops=2)
+        self.assertEqual(sorted(hops.tolist()), [0, 0, 0, 1])
+        self.assertEqual(len(candidate_edges(snapshot, bob, max_hops=2, limit=2)[0]), 2)
+
+    def test_snapshot_keeps_its_records_after_deletes(self):
+        snapshot = get_graph_snapshot()
+        acme = snapshot.positions([self.ids['Acme']])
+        edges = snapshot.edges_of(acme)
+        before = [snapshot.relationship(edge) for edge in edges]
+        # The in-memory backend rebuilds its relationships list on delete
+        self.client.delete(f"/people/{self.ids['Ada']}")
+        self.assertEqual(len(get_graph_snapshot().positions([self.ids['Ada']])), 0)
+        self.assertEqual([snapshot.relationship(edge) for edge in edges], before)
+        self.assertIn({'from_id': self.ids['Acme'], 'to_id': self.ids['Carol'], 'relationship': 'employs',
+                       'snippet': 'Acme employs Carol as an engineer.'}, before)
+        self.assertEqual(snapshot.name(acme[0]), 'Acme')
+
+    def test_ranks_deduplicates_and_reports(self):
+        context = assemble_context('Where does Bob work?', [{'id': self.ids['Bob'], 'name': 'Bob'}], [])
+        self.assertEqual(context['triplets'][0], 'Bob works at Acme')
+        self.assertEqual(context['duplicates'], 1)
+        self.assertEqual(len(context['triplets']), 3)
+        self.assertNotIn('Carol knows Dan', context['triplets'])
+        self.assertEqual([item['hop'] for item in context['included']], sorted(item['hop'] for item in context['included']))
+        self.assertEqual(context['tokens'], sum(item['tokens'] for item in context['included']))
+
+    def test_answers_from_the_previous_snapshot_while_compiling(self):
+        previous = get_graph_snapshot()
+        eve = self.client.post('/people', json={'data': {'name': 'Eve'}}).json['id']
+        hit = {'from_id': self.ids['Carol'], 'to_id': eve, 'relationship': 'mentors',
+               'from_entity': 'Carol', 'to_entity': 'Eve'}
+        context = assemble_context('Who does Carol mentor?', [], [hit])
+        # Eve isn't in the snapshot yet, the search hit still is a candidate
+        self.assertIn('Carol mentors Eve', context['triplets'])
+        for _ in range(100):
+            if get_graph_snapshot(wait=False) is not previous:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(get_graph_snapshot(wait=False).positions([eve])), 1)
+
+    def test_context_follows_renames(self):
+        self.client.put(f"/people/{self.ids['Bob']}", json={'data': {'name': 'Robert'}})
+        # The snapshot of the rename is compiled in the background; the next questions are answered from it
+        for _ in range(100):
+            context = assemble_context('Where does Robert work?', [{'id': self.ids['Bob']}], [])
+            if 'Robert works at Acme' in context['triplets']:
+                break
+            time.sleep(0.01)
+        self.assertIn('Robert works at Acme', context['triplets'])
+        self.assertNotIn('Bob works at Acme', context['triplets'])
+
+    def test_token_budget(self):
+        budget = count_tokens('Bob works at Acme')
+        context = assemble_context('Where does Bob work?', [{'id': self.ids['Bob']}], [], budget=budget)
+        self.assertEqual(context['triplets'], ['Bob works at Acme'])
+        self.assertLessEqual(context['tokens'], budget)
+        self.assertEqual(context['over_budget'], 2)
+
 if __name__ == '__main__':
     unittest.main()